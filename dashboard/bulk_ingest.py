@@ -0,0 +1,404 @@
+"""
+Caricamento in blocco di cartelle e archivi ZIP nei progetti.
+Questo modulo si occupa di:
+- Salvare i file (caricati o estratti in streaming da un archivio ZIP) calcolandone l'hash in un unico passaggio
+- Scartare i contenuti già presenti nel progetto o ripetuti nello stesso lotto
+- Registrare tutti i ProjectFile con un solo bulk_create (senza segnali per singolo file)
+- Pianificare un unico aggiornamento incrementale dell'indice vettoriale per l'intero lotto
+"""
+
+import logging
+import os
+import threading
+import zipfile
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Limiti per singolo lotto (anche a protezione da archivi con rapporto di compressione anomalo)
+BULK_MAX_FILES = getattr(settings, 'RAG_BULK_MAX_FILES', 5000)
+BULK_MAX_TOTAL_SIZE = getattr(settings, 'RAG_BULK_MAX_TOTAL_SIZE', 2 * 1024 * 1024 * 1024)
+
+# Dimensione dei blocchi letti dagli archivi
+ARCHIVE_READ_BUFFER_SIZE = 1024 * 1024
+
+# File di sistema ignorati negli archivi
+ARCHIVE_IGNORED_NAMES = ('Thumbs.db', 'desktop.ini')
+
+# Progetti con un aggiornamento dell'indice in corso e progetti da riaggiornare al termine
+_index_update_lock = threading.Lock()
+_index_updates_running = set()
+_index_updates_pending = set()
+
+
+def _safe_relative_path(name):
+    """
+    Normalizza il percorso di un file di una cartella o di un archivio.
+
+    Returns:
+        str: Percorso relativo sicuro, o None se il file va ignorato (cartelle di sistema,
+            file nascosti, nomi vuoti)
+    """
+    parts = [part for part in name.replace('\\', '/').split('/') if part and part not in ('.', '..')]
+    if not parts or parts[0] == '__MACOSX':
+        return None
+    if any(part.startswith('.') for part in parts) or parts[-1] in ARCHIVE_IGNORED_NAMES:
+        return None
+    return os.path.join(*parts)
+
+
+def _unique_file_path(file_path, reserved_paths):
+    """
+    Restituisce un percorso libero aggiungendo un contatore al nome, come per i caricamenti singoli.
+    """
+    if not os.path.exists(file_path) and file_path not in reserved_paths:
+        return file_path
+    base_name, extension = os.path.splitext(os.path.basename(file_path))
+    counter = 1
+    while True:
+        candidate = os.path.join(os.path.dirname(file_path), f"{base_name}_{counter}{extension}")
+        if not os.path.exists(candidate) and candidate not in reserved_paths:
+            return candidate
+        counter += 1
+
+
+def _run_index_update(project):
+    """
+    Esegue l'aggiornamento dell'indice e lo ripete una volta se nel frattempo è arrivato un altro lotto.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_utils import create_project_rag_chain
+
+    try:
+        while True:
+            try:
+                logger.info(f"🔄 Aggiornamento incrementale dell'indice del progetto {project.id} dopo il caricamento in blocco")
+                create_project_rag_chain(project)
+            except Exception as e:
+                logger.error(f"Errore nell'aggiornamento dell'indice del progetto {project.id}: {str(e)}")
+            with _index_update_lock:
+                if project.id not in _index_updates_pending:
+                    _index_updates_running.discard(project.id)
+                    return
+                _index_updates_pending.discard(project.id)
+    finally:
+        connections.close_all()
+
+
+def schedule_project_index_update(project):
+    """
+    Pianifica in un thread separato un aggiornamento incrementale dell'indice del progetto.
+
+    Se un aggiornamento è già in corso, ne viene accodato al più uno successivo,
+    che includerà tutti i file registrati nel frattempo.
+
+    Args:
+        project: Oggetto Project
+    """
+    with _index_update_lock:
+        if project.id in _index_updates_running:
+            _index_updates_pending.add(project.id)
+            return
+        _index_updates_running.add(project.id)
+
+    threading.Thread(target=_run_index_update, args=(project,), daemon=True).start()
+
+
+def bulk_create_project_files(project, project_files):
+    """
+    Registra in blocco dei ProjectFile e li restituisce riletti dal database.
+
+    Su MySQL bulk_create non imposta le chiavi primarie degli oggetti creati: i file
+    vengono riletti per percorso, così possono essere usati come chiavi esterne
+    (es. nei log dello storage).
+
+    Args:
+        project: Oggetto Project
+        project_files: Lista di ProjectFile non ancora salvati
+
+    Returns:
+        list: ProjectFile salvati, con chiave primaria
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectFile
+
+    ProjectFile.objects.bulk_create(project_files, batch_size=500)
+    file_paths = [project_file.file_path for project_file in project_files]
+    created = []
+    # Letture a lotti: la clausola IN resta entro i limiti del database
+    for start in range(0, len(file_paths), 500):
+        created.extend(ProjectFile.objects.filter(project=project, file_path__in=file_paths[start:start + 500]))
+    return created
+
+
+def _record_storage_usage(project, project_files, previous_sizes=None):
+    """
+    Aggiorna l'utilizzo dello storage per un lotto di file registrati con bulk_create.
+
+    Equivale al segnale update_storage_usage (non emesso da bulk_create), ma con un solo
+    aggiornamento dell'abbonamento e un solo inserimento dei log per l'intero lotto.
+    I file devono avere la chiave primaria (vedi bulk_create_project_files).
+
+    Args:
+        project: Oggetto Project
+        project_files: File aggiunti, o modificati se previous_sizes è indicato
+        previous_sizes: {id del file: dimensione precedente} per i file modificati con
+            bulk_update; viene registrata solo la variazione di dimensione (opzionale)
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import UserSubscription, StorageUsageLog
+
+    if previous_sizes is None:
+        operation, files_delta = 'add_file', 1
+        bytes_deltas = {project_file.pk: project_file.file_size for project_file in project_files}
+    else:
+        operation, files_delta = 'update_file', 0
+        bytes_deltas = {project_file.pk: project_file.file_size - previous_sizes[project_file.pk]
+                        for project_file in project_files}
+
+    subscription = UserSubscription.objects.filter(user=project.user).first()
+    if subscription is None:
+        return
+
+    UserSubscription.objects.filter(pk=subscription.pk).update(
+        current_storage_used_mb=F('current_storage_used_mb') + Decimal(sum(bytes_deltas.values())) / (1024 * 1024),
+        current_files_count=F('current_files_count') + files_delta * len(project_files),
+        updated_at=timezone.now()
+    )
+    StorageUsageLog.objects.bulk_create([
+        StorageUsageLog(
+            user=project.user,
+            operation=operation,
+            files_count_delta=files_delta,
+            storage_bytes_delta=bytes_deltas[project_file.pk],
+            file=project_file,
+            project=project
+        )
+        for project_file in project_files
+    ], batch_size=500)
+
+    # Calcola eventuali costi extra
+    subscription.refresh_from_db()
+    if subscription.is_storage_limit_reached() or subscription.is_file_limit_reached():
+        extra_cost = subscription.calculate_extra_storage_cost()
+        if extra_cost > 0:
+            subscription.extra_storage_charges += extra_cost
+            subscription.save(update_fields=['extra_storage_charges'])
+
+
+def ingest_file_entries(project, entries, update_index=True):
+    """
+    Salva e registra in blocco una sequenza di file in un progetto.
+
+    Args:
+        project: Oggetto Project
+        entries: Iterabile di tuple (percorso relativo nel progetto, iterabile di blocchi di byte)
+        update_index: Se True, pianifica un unico aggiornamento dell'indice per il lotto
+
+    Returns:
+        dict: {'added': lista di ProjectFile, 'duplicates': int}
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectFile
+    from dashboard.rag_blob_store import link_file_to_blob
+    from dashboard.rag_document_utils import save_chunks_with_hash, invalidate_project_content_snapshot
+    from dashboard.rag_previews import schedule_file_previews
+
+    project_dir = os.path.join(settings.MEDIA_ROOT, 'projects', str(project.user.id), str(project.id))
+
+    # Contenuti già presenti nel progetto, letti con una sola query
+    seen_contents = set(ProjectFile.objects.filter(project=project).values_list('file_hash', 'file_size'))
+    reserved_paths = set()
+    new_files = []
+    duplicates = 0
+
+    try:
+        for relative_path, chunks in entries:
+            target_path = os.path.join(project_dir, relative_path)
+            tmp_path, file_hash, file_size = save_chunks_with_hash(chunks, os.path.dirname(target_path))
+
+            if (file_hash, file_size) in seen_contents:
+                os.remove(tmp_path)
+                duplicates += 1
+                logger.debug(f"File {relative_path} ignorato: contenuto già presente nel progetto")
+                continue
+            seen_contents.add((file_hash, file_size))
+
+            file_path = _unique_file_path(target_path, reserved_paths)
+            reserved_paths.add(file_path)
+            os.replace(tmp_path, file_path)
+            link_file_to_blob(file_path, file_hash)
+
+            new_files.append(ProjectFile(
+                project=project,
+                filename=os.path.basename(file_path),
+                file_path=file_path,
+                file_type=os.path.splitext(file_path)[1].lower().lstrip('.'),
+                file_size=file_size,
+                file_hash=file_hash,
+                is_embedded=False,
+                last_indexed_at=None
+            ))
+    finally:
+        # Anche in caso di errore, i file già spostati nel progetto vengono registrati
+        if new_files:
+            # bulk_create non emette i segnali post_save: nessuna ricostruzione dell'indice per singolo file
+            new_files = bulk_create_project_files(project, new_files)
+            invalidate_project_content_snapshot(project)
+            _record_storage_usage(project, new_files)
+
+    if new_files:
+        from dashboard.rag_utils import invalidate_project_rag_chain
+        invalidate_project_rag_chain(project)
+
+        for project_file in new_files:
+            schedule_file_previews(project_file.file_path, project_file.file_hash)
+        if update_index:
+            schedule_project_index_update(project)
+
+    logger.info(f"📦 Caricamento in blocco nel progetto {project.id}: {len(new_files)} file registrati, "
+                f"{duplicates} duplicati ignorati")
+    return {'added': new_files, 'duplicates': duplicates}
+
+
+def iter_uploaded_file_entries(uploaded_files):
+    """
+    Converte i file caricati in voci per ingest_file_entries.
+
+    Args:
+        uploaded_files: Iterabile di tuple (percorso relativo, UploadedFile)
+
+    Yields:
+        tuple: (percorso relativo sicuro, iterabile di blocchi)
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_document_utils import FILE_HASH_BUFFER_SIZE
+
+    for relative_path, uploaded_file in uploaded_files:
+        safe_path = _safe_relative_path(relative_path)
+        if safe_path is None:
+            continue
+        yield safe_path, uploaded_file.chunks(FILE_HASH_BUFFER_SIZE)
+
+
+def _iter_archive_member(archive, info):
+    """
+    Legge un file dell'archivio a blocchi, senza estrarlo interamente in memoria.
+    """
+    with archive.open(info) as member:
+        for chunk in iter(lambda: member.read(ARCHIVE_READ_BUFFER_SIZE), b''):
+            yield chunk
+
+
+def ingest_zip_archive(project, archive_file, target_subdir=None, update_index=True):
+    """
+    Estrae in streaming un archivio ZIP nel progetto e registra i file in blocco.
+
+    Args:
+        project: Oggetto Project
+        archive_file: Percorso o file (seekable) dell'archivio, es. UploadedFile
+        target_subdir: Sottocartella del progetto in cui estrarre (opzionale)
+        update_index: Se True, pianifica un unico aggiornamento dell'indice per l'archivio
+
+    Returns:
+        dict: {'added': lista di ProjectFile, 'duplicates': int, 'skipped': int}
+
+    Raises:
+        ValueError: Se l'archivio non è valido o supera i limiti configurati
+    """
+    if target_subdir:
+        # La sottocartella non deve poter uscire dalla directory del progetto
+        target_subdir = _safe_relative_path(target_subdir)
+        if target_subdir is None:
+            raise ValueError("Cartella di destinazione non valida.")
+
+    try:
+        archive = zipfile.ZipFile(archive_file)
+    except zipfile.BadZipFile:
+        raise ValueError("Archivio ZIP non valido.")
+
+    with archive:
+        members = []
+        skipped = 0
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            relative_path = _safe_relative_path(info.filename)
+            if relative_path is None or info.flag_bits & 0x1:
+                # File di sistema, nascosti o cifrati
+                skipped += 1
+                continue
+            if target_subdir:
+                relative_path = os.path.join(target_subdir, relative_path)
+            members.append((relative_path, info))
+
+        # Verifica dei limiti sulle dimensioni dichiarate, prima di estrarre qualsiasi file
+        total_size = sum(info.file_size for _, info in members)
+        if len(members) > BULK_MAX_FILES:
+            raise ValueError(f"L'archivio contiene troppi file (massimo {BULK_MAX_FILES}).")
+        if total_size > BULK_MAX_TOTAL_SIZE:
+            raise ValueError(f"L'archivio estratto supera la dimensione massima di "
+                             f"{BULK_MAX_TOTAL_SIZE // (1024 * 1024)} MB.")
+
+        logger.info(f"Estrazione di {len(members)} file ({total_size // 1024} KB) dall'archivio nel progetto {project.id}")
+        result = ingest_file_entries(
+            project,
+            ((relative_path, _iter_archive_member(archive, info)) for relative_path, info in members),
+            update_index=update_index
+        )
+
+    result['skipped'] = skipped
+    return result
+
+
+def ingest_uploaded_files(project, uploaded_files, extract_archives=False):
+    """
+    Registra in blocco i file caricati con un'unica richiesta (selezione multipla o cartella).
+
+    Gli archivi ZIP vengono estratti nel progetto se richiesto; in ogni caso viene
+    pianificato un solo aggiornamento dell'indice per l'intera richiesta.
+
+    Args:
+        project: Oggetto Project
+        uploaded_files: Lista di tuple (percorso relativo nel progetto, UploadedFile)
+        extract_archives: Se True, estrae il contenuto degli archivi .zip invece di salvarli
+
+    Returns:
+        dict: {'added': lista di ProjectFile, 'duplicates': int, 'skipped': int, 'errors': lista di messaggi}
+    """
+    result = {'added': [], 'duplicates': 0, 'skipped': 0, 'errors': []}
+
+    plain_files = []
+    for relative_path, uploaded_file in uploaded_files:
+        if not (extract_archives and relative_path.lower().endswith('.zip')):
+            plain_files.append((relative_path, uploaded_file))
+            continue
+        # L'archivio viene estratto in una cartella con il suo nome (normalizzato come i percorsi dei file)
+        target_subdir = _safe_relative_path(os.path.splitext(relative_path)[0])
+        if target_subdir is None:
+            result['skipped'] += 1
+            continue
+        try:
+            archive_result = ingest_zip_archive(project, uploaded_file, target_subdir, update_index=False)
+        except ValueError as e:
+            result['errors'].append(f"{os.path.basename(relative_path)}: {str(e)}")
+            continue
+        result['added'].extend(archive_result['added'])
+        result['duplicates'] += archive_result['duplicates']
+        result['skipped'] += archive_result['skipped']
+
+    if plain_files:
+        files_result = ingest_file_entries(project, iter_uploaded_file_entries(plain_files), update_index=False)
+        result['added'].extend(files_result['added'])
+        result['duplicates'] += files_result['duplicates']
+        result['skipped'] += len(plain_files) - len(files_result['added']) - files_result['duplicates']
+
+    if result['added']:
+        schedule_project_index_update(project)
+    return result
@@ -0,0 +1,367 @@
+"""
+Caricamento a blocchi (riprendibile) dei documenti di grandi dimensioni.
+Questo modulo si occupa di:
+- Creare una sessione di caricamento con dimensione dei blocchi decisa dal server
+- Ricevere i blocchi in qualsiasi ordine, verificarne dimensione e hash SHA-256 e scriverli
+  direttamente alla loro posizione nel file di destinazione, senza tenerli in memoria
+- Riportare i blocchi già ricevuti, così un caricamento interrotto può riprendere
+- Completare il caricamento registrando il ProjectFile con la stessa logica dei caricamenti normali
+- Eliminare le sessioni abbandonate dopo un tempo massimo di inattività (TTL)
+
+Lo stato delle sessioni è salvato su disco (MEDIA_ROOT/upload_sessions/<upload_id>/),
+quindi è condiviso tra i processi worker che servono le richieste.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Dimensione dei blocchi in cui il client deve suddividere il file
+CHUNKED_UPLOAD_PART_SIZE = getattr(settings, 'RAG_CHUNKED_UPLOAD_PART_SIZE', 8 * 1024 * 1024)
+
+# Dimensione massima di un file caricato a blocchi
+CHUNKED_UPLOAD_MAX_SIZE = getattr(settings, 'RAG_CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+
+# Ore di inattività dopo le quali una sessione incompleta viene eliminata
+CHUNKED_UPLOAD_TTL_HOURS = getattr(settings, 'RAG_CHUNKED_UPLOAD_TTL_HOURS', 24)
+
+# Dimensione dei blocchi letti dal corpo della richiesta
+READ_BUFFER_SIZE = 1024 * 1024
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def get_upload_sessions_dir():
+    """
+    Restituisce la directory delle sessioni di caricamento a blocchi.
+
+    Returns:
+        str: Percorso della directory
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'upload_sessions')
+
+
+def _session_dir(upload_id):
+    return os.path.join(get_upload_sessions_dir(), upload_id)
+
+
+def _save_session(session):
+    """
+    Salva i metadati della sessione (scrittura atomica).
+    """
+    session_path = os.path.join(_session_dir(session['upload_id']), 'session.json')
+    tmp_path = f"{session_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(session, f)
+    os.replace(tmp_path, session_path)
+
+
+def _safe_relative_path(relative_path, filename):
+    """
+    Normalizza il percorso relativo indicato dal client (es. da una cartella caricata),
+    scartando componenti assolute o che risalgono fuori dalla directory del progetto.
+    """
+    parts = [part for part in (relative_path or '').replace('\\', '/').split('/')
+             if part and part not in ('.', '..')]
+    if parts:
+        parts[-1] = filename
+        return os.path.join(*parts)
+    return filename
+
+
+def create_upload_session(project, filename, total_size, relative_path=None, expected_sha256=None):
+    """
+    Crea una sessione di caricamento a blocchi per un file di progetto.
+
+    Args:
+        project: Oggetto Project di destinazione
+        filename: Nome del file
+        total_size: Dimensione totale in byte
+        relative_path: Percorso relativo nel progetto (opzionale, per le cartelle)
+        expected_sha256: Hash SHA-256 atteso dell'intero file (opzionale)
+
+    Returns:
+        dict: Sessione con 'upload_id', 'part_size' e 'total_parts'
+
+    Raises:
+        ValueError: Se i parametri non sono validi
+    """
+    if not isinstance(filename, str):
+        raise ValueError("Nome del file non valido.")
+    filename = os.path.basename(filename.replace('\\', '/')).strip()
+    if not filename or filename.startswith('.'):
+        raise ValueError("Nome del file non valido.")
+    try:
+        total_size = int(total_size)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Dimensione del file non valida.")
+    if total_size <= 0 or total_size > CHUNKED_UPLOAD_MAX_SIZE:
+        raise ValueError(f"Dimensione del file non valida (massimo {CHUNKED_UPLOAD_MAX_SIZE // (1024 * 1024)} MB).")
+    if expected_sha256 and (not isinstance(expected_sha256, str)
+                            or not SHA256_PATTERN.match(expected_sha256.lower())):
+        raise ValueError("Hash SHA-256 atteso non valido.")
+    if relative_path is not None and not isinstance(relative_path, str):
+        raise ValueError("Percorso relativo non valido.")
+
+    upload_id = uuid.uuid4().hex
+    session = {
+        'upload_id': upload_id,
+        'project_id': project.id,
+        'user_id': project.user_id,
+        'filename': filename,
+        'relative_path': _safe_relative_path(relative_path, filename),
+        'total_size': total_size,
+        'part_size': CHUNKED_UPLOAD_PART_SIZE,
+        'total_parts': (total_size + CHUNKED_UPLOAD_PART_SIZE - 1) // CHUNKED_UPLOAD_PART_SIZE,
+        'expected_sha256': expected_sha256.lower() if expected_sha256 else None,
+        'created_at': time.time(),
+    }
+
+    session_dir = _session_dir(upload_id)
+    os.makedirs(os.path.join(session_dir, 'parts'))
+    # File di destinazione con la dimensione finale: ogni blocco viene scritto alla sua posizione
+    with open(os.path.join(session_dir, 'data'), 'wb') as f:
+        f.truncate(total_size)
+    _save_session(session)
+
+    logger.info(f"📤 Sessione di caricamento {upload_id} creata: {filename} "
+                f"({total_size // 1024} KB, {session['total_parts']} blocchi)")
+    return session
+
+
+def get_upload_session(upload_id, project):
+    """
+    Recupera una sessione di caricamento appartenente a un progetto.
+
+    Args:
+        upload_id: ID della sessione
+        project: Oggetto Project
+
+    Returns:
+        dict: Sessione, o None se non esiste o appartiene a un altro progetto
+    """
+    if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+        return None
+    try:
+        with open(os.path.join(_session_dir(upload_id), 'session.json'), 'r', encoding='utf-8') as f:
+            session = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if session.get('project_id') != project.id:
+        return None
+    return session
+
+
+def get_received_parts(session):
+    """
+    Restituisce i numeri dei blocchi già ricevuti e verificati.
+
+    Args:
+        session: Sessione di caricamento
+
+    Returns:
+        list: Numeri dei blocchi (da 0), ordinati
+    """
+    parts_dir = os.path.join(_session_dir(session['upload_id']), 'parts')
+    try:
+        return sorted(int(name) for name in os.listdir(parts_dir) if name.isdigit())
+    except FileNotFoundError:
+        return []
+
+
+def get_upload_status(session):
+    """
+    Restituisce lo stato di una sessione di caricamento (per riprendere un caricamento interrotto).
+
+    Args:
+        session: Sessione di caricamento
+
+    Returns:
+        dict: Metadati della sessione con blocchi ricevuti e mancanti
+    """
+    received = get_received_parts(session)
+    received_set = set(received)
+    return {
+        'upload_id': session['upload_id'],
+        'filename': session['filename'],
+        'total_size': session['total_size'],
+        'part_size': session['part_size'],
+        'total_parts': session['total_parts'],
+        'received_parts': received,
+        'missing_parts': [part for part in range(session['total_parts']) if part not in received_set],
+    }
+
+
+def write_upload_part(session, part_number, stream, expected_sha256=None):
+    """
+    Scrive un blocco nel file di destinazione, verificandone dimensione e hash.
+
+    Il blocco viene letto dal flusso a piccoli buffer e scritto alla sua posizione
+    (part_number * part_size), quindi non viene mai tenuto interamente in memoria.
+
+    Args:
+        session: Sessione di caricamento
+        part_number: Numero del blocco (da 0)
+        stream: Oggetto con metodo read(n) (es. HttpRequest)
+        expected_sha256: Hash SHA-256 atteso del blocco (opzionale)
+
+    Returns:
+        dict: {'part', 'size', 'sha256'}
+
+    Raises:
+        ValueError: Se il blocco non è valido o non corrisponde all'hash atteso
+    """
+    if part_number < 0 or part_number >= session['total_parts']:
+        raise ValueError(f"Numero di blocco non valido: {part_number}.")
+
+    offset = part_number * session['part_size']
+    expected_size = min(session['part_size'], session['total_size'] - offset)
+    session_dir = _session_dir(session['upload_id'])
+
+    sha256 = hashlib.sha256()
+    received = 0
+    fd = os.open(os.path.join(session_dir, 'data'), os.O_WRONLY)
+    try:
+        while received <= expected_size:
+            chunk = stream.read(min(READ_BUFFER_SIZE, expected_size + 1 - received))
+            if not chunk:
+                break
+            if received + len(chunk) > expected_size:
+                raise ValueError(f"Il blocco {part_number} supera la dimensione attesa di {expected_size} byte.")
+            os.pwrite(fd, chunk, offset + received)
+            sha256.update(chunk)
+            received += len(chunk)
+    finally:
+        os.close(fd)
+
+    if received != expected_size:
+        raise ValueError(f"Blocco {part_number} incompleto: ricevuti {received} byte su {expected_size}.")
+
+    part_hash = sha256.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != part_hash:
+        raise ValueError(f"Hash del blocco {part_number} non corrispondente.")
+
+    # Il marcatore viene scritto solo dopo la verifica: un blocco non valido verrà semplicemente ricaricato
+    with open(os.path.join(session_dir, 'parts', str(part_number)), 'w') as f:
+        f.write(part_hash)
+    # La data di modifica della sessione misura l'inattività per la pulizia (TTL)
+    os.utime(session_dir)
+
+    return {'part': part_number, 'size': received, 'sha256': part_hash}
+
+
+def complete_upload_session(session, project):
+    """
+    Completa un caricamento: verifica i blocchi, calcola l'hash del file e registra il ProjectFile.
+
+    Args:
+        session: Sessione di caricamento
+        project: Oggetto Project di destinazione
+
+    Returns:
+        tuple: (ProjectFile, bool) - Il file registrato (o quello esistente con lo stesso
+               contenuto) e un flag che indica se è stato creato
+
+    Raises:
+        ValueError: Se mancano blocchi o l'hash non corrisponde a quello atteso
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_document_utils import compute_file_hash
+    from dashboard.rag_utils import register_project_file_upload
+
+    status = get_upload_status(session)
+    if status['missing_parts']:
+        raise ValueError(f"Caricamento incompleto: mancano {len(status['missing_parts'])} blocchi.")
+
+    session_dir = _session_dir(session['upload_id'])
+    data_path = os.path.join(session_dir, 'data')
+    file_hash = compute_file_hash(data_path)
+    if session.get('expected_sha256') and session['expected_sha256'] != file_hash:
+        raise ValueError("L'hash del file ricomposto non corrisponde a quello atteso.")
+
+    project_dir = os.path.join(settings.MEDIA_ROOT, 'projects', str(project.user.id), str(project.id))
+    file_path = os.path.join(project_dir, session['relative_path'])
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    # Spostamento accanto alla destinazione (rinomina se sullo stesso filesystem); il prefisso
+    # .upload_ esclude il file dalla scansione della directory del progetto
+    tmp_path = os.path.join(os.path.dirname(file_path), f".upload_{session['upload_id']}.part")
+    shutil.move(data_path, tmp_path)
+
+    try:
+        project_file, created = register_project_file_upload(
+            project, tmp_path, file_hash, session['total_size'], file_path, original_name=session['filename']
+        )
+    except Exception:
+        # La sessione resta valida: il file ricomposto torna nella sessione per poter ritentare
+        if os.path.exists(tmp_path):
+            shutil.move(tmp_path, data_path)
+        raise
+
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    shutil.rmtree(session_dir, ignore_errors=True)
+
+    logger.info(f"✅ Caricamento a blocchi {session['upload_id']} completato: {project_file.filename}")
+    return project_file, created
+
+
+def abort_upload_session(session):
+    """
+    Annulla una sessione di caricamento eliminandone i dati.
+
+    Args:
+        session: Sessione di caricamento
+    """
+    shutil.rmtree(_session_dir(session['upload_id']), ignore_errors=True)
+    logger.info(f"Sessione di caricamento {session['upload_id']} annullata")
+
+
+def cleanup_expired_upload_sessions(ttl_hours=None, dry_run=False):
+    """
+    Elimina le sessioni di caricamento inattive da più di ttl_hours ore.
+
+    Args:
+        ttl_hours: Ore di inattività (opzionale, default RAG_CHUNKED_UPLOAD_TTL_HOURS)
+        dry_run: Se True, conta le sessioni scadute senza eliminarle
+
+    Returns:
+        dict: {'checked', 'removed', 'freed_bytes'}
+    """
+    ttl_seconds = (CHUNKED_UPLOAD_TTL_HOURS if ttl_hours is None else ttl_hours) * 3600
+    stats = {'checked': 0, 'removed': 0, 'freed_bytes': 0}
+    sessions_dir = get_upload_sessions_dir()
+    if not os.path.exists(sessions_dir):
+        return stats
+
+    now = time.time()
+    for entry in os.scandir(sessions_dir):
+        if not entry.is_dir():
+            continue
+        stats['checked'] += 1
+        try:
+            if now - entry.stat().st_mtime < ttl_seconds:
+                continue
+            data_path = os.path.join(entry.path, 'data')
+            # Il file è preallocato (sparse): conta lo spazio effettivamente occupato
+            freed = os.stat(data_path).st_blocks * 512 if os.path.exists(data_path) else 0
+            if not dry_run:
+                shutil.rmtree(entry.path)
+            stats['removed'] += 1
+            stats['freed_bytes'] += freed
+        except OSError as e:
+            logger.warning(f"Errore nella pulizia della sessione di caricamento {entry.name}: {str(e)}")
+
+    logger.info(f"🧹 Sessioni di caricamento scadute: {stats['removed']}/{stats['checked']} eliminate")
+    return stats
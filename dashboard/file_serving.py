@@ -0,0 +1,183 @@
+"""
+Risposte HTTP per servire i file dei progetti senza caricarli in memoria.
+Questo modulo si occupa di:
+- Restituire i file in streaming (FileResponse) invece di leggerli interamente
+- Gestire le richieste parziali (Range, If-Range) usate dai visualizzatori PDF
+- Gestire le richieste condizionali (ETag basato sull'hash del file, If-None-Match → 304)
+- Delegare opzionalmente l'invio al proxy frontale (X-Accel-Redirect per nginx, X-Sendfile per Apache)
+"""
+
+import logging
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Delega dell'invio al proxy frontale: None, 'x-accel-redirect' (nginx) o 'x-sendfile' (Apache/lighttpd)
+FILE_SERVE_OFFLOAD = getattr(settings, 'RAG_FILE_SERVE_OFFLOAD', None)
+
+# Location interna di nginx che corrisponde a MEDIA_ROOT (usata con X-Accel-Redirect)
+FILE_SERVE_ACCEL_PREFIX = getattr(settings, 'RAG_FILE_SERVE_ACCEL_PREFIX', '/protected-media/')
+
+# Dimensione dei blocchi letti durante lo streaming
+FILE_SERVE_CHUNK_SIZE = 256 * 1024
+
+RANGE_HEADER_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _etag_matches(header_value, etag):
+    """
+    Verifica se un'intestazione If-None-Match contiene l'ETag (confronto debole).
+    """
+    if not header_value or not etag:
+        return False
+    if header_value.strip() == '*':
+        return True
+    candidates = [value.strip() for value in header_value.split(',')]
+    return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+def _if_range_matches(header_value, etag):
+    """
+    Verifica se un'intestazione If-Range corrisponde all'ETag (confronto forte).
+
+    If-Range ammette un solo validatore: un ETag debole (W/...), una data o un valore
+    diverso non consentono la risposta parziale, e il file va inviato per intero.
+    """
+    return header_value.strip() == etag
+
+
+def parse_range_header(header_value, file_size):
+    """
+    Interpreta un'intestazione Range con un singolo intervallo di byte.
+
+    Args:
+        header_value: Valore dell'intestazione Range (es. 'bytes=0-1023', 'bytes=-500')
+        file_size: Dimensione del file
+
+    Returns:
+        tuple: (inizio, fine inclusa), None se l'intestazione va ignorata (assente,
+            non valida o con più intervalli), oppure 'unsatisfiable' se l'intervallo
+            è fuori dal file
+    """
+    if not header_value:
+        return None
+    match = RANGE_HEADER_PATTERN.match(header_value.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffisso: gli ultimi N byte
+        length = int(end)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(0, file_size - length), file_size - 1
+
+    start = int(start)
+    end = int(end) if end else file_size - 1
+    if start >= file_size or end < start:
+        return 'unsatisfiable'
+    return start, min(end, file_size - 1)
+
+
+def _iter_file_range(file_path, start, length):
+    """
+    Legge un intervallo di un file a blocchi.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(FILE_SERVE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload_response(file_path, content_type):
+    """
+    Costruisce una risposta vuota che delega l'invio del file al proxy frontale.
+
+    Returns:
+        HttpResponse: Risposta con X-Accel-Redirect o X-Sendfile, o None se il file
+            non è delegabile (es. fuori da MEDIA_ROOT con X-Accel-Redirect)
+    """
+    response = HttpResponse(content_type=content_type)
+    if FILE_SERVE_OFFLOAD == 'x-sendfile':
+        response['X-Sendfile'] = file_path
+        return response
+
+    relative_path = os.path.relpath(os.path.realpath(file_path), os.path.realpath(settings.MEDIA_ROOT))
+    if relative_path.startswith(os.pardir):
+        return None
+    # nginx decodifica l'URI interno: spazi, '%', '?' e '#' nel nome del file vanno codificati
+    response['X-Accel-Redirect'] = (FILE_SERVE_ACCEL_PREFIX.rstrip('/') + '/'
+                                    + quote(relative_path.replace(os.sep, '/')))
+    return response
+
+
+def build_file_response(request, file_path, content_type, etag_value=None):
+    """
+    Costruisce la risposta per servire un file, con supporto a Range e richieste condizionali.
+
+    Args:
+        request: HttpRequest
+        file_path: Percorso del file
+        content_type: Tipo MIME del file
+        etag_value: Valore da usare come ETag (es. hash SHA-256 del file); se assente
+            viene derivato da data di modifica e dimensione
+
+    Returns:
+        HttpResponse: 304, 206, 416 o 200 (in streaming o delegata al proxy)
+    """
+    file_stat = os.stat(file_path)
+    file_size = file_stat.st_size
+    etag = f'"{etag_value or f"{file_stat.st_mtime_ns:x}-{file_size:x}"}"'
+
+    # Richiesta condizionale: il client ha già questa versione del file
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    # Invio delegato al proxy frontale (che gestisce anche le richieste Range)
+    response = _offload_response(file_path, content_type) if FILE_SERVE_OFFLOAD else None
+    if response is not None:
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+    if request.method == 'GET':
+        byte_range = parse_range_header(request.headers.get('Range'), file_size)
+        # If-Range: l'intervallo vale solo se il file non è cambiato (confronto forte)
+        if_range = request.headers.get('If-Range')
+        if byte_range is not None and if_range and not _if_range_matches(if_range, etag):
+            byte_range = None
+
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{file_size}"
+    elif byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_iter_file_range(file_path, start, length),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{file_size}"
+        response['Content-Length'] = str(length)
+    else:
+        response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+        response.block_size = FILE_SERVE_CHUNK_SIZE
+        response['Content-Length'] = str(file_size)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,288 @@
+"""
+Risposta a gruppi di domande (batch) su un progetto.
+Questo modulo si occupa di:
+- Caricare la catena RAG e l'indice FAISS del progetto una sola volta per l'intero batch
+- Calcolare gli embedding di tutte le domande con un'unica chiamata batch
+- Eseguire il recupero di tutte le domande con un'unica ricerca vettoriale FAISS
+- Generare le risposte in parallelo con un limite di concorrenza
+- Restituire i risultati man mano che sono pronti (es. per scriverli in JSONL)
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from django.conf import settings
+
+from dashboard.rag_context import compute_context_token_budget, pack_context_documents
+from dashboard.rag_document_utils import get_project_content_snapshot
+from dashboard.rag_query_planner import CHAIN_TYPE_SUMMARIES, plan_query
+from dashboard.rag_rerank import RERANK_CANDIDATE_MULTIPLIER, rerank_documents
+from dashboard.rag_summaries import answer_from_summaries, get_active_project_summaries
+from dashboard.rag_utils import (
+    build_rag_prompt_template, cache_project_rag_chain, check_project_index_update_needed,
+    create_project_rag_chain, get_chain_vectorstore, get_project_LLM_settings, get_project_RAG_settings,
+    get_project_rag_chain,
+)
+from profiles.models import record_rag_query_usage
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Numero massimo di generazioni LLM eseguite in parallelo
+BATCH_MAX_CONCURRENCY = getattr(settings, 'RAG_BATCH_MAX_CONCURRENCY', 4)
+
+# Numero massimo di domande accettate in un singolo batch
+BATCH_MAX_QUESTIONS = getattr(settings, 'RAG_BATCH_MAX_QUESTIONS', 500)
+
+
+def load_batch_project_chain(project):
+    """
+    Restituisce la catena RAG del progetto, aggiornando l'indice una sola volta se necessario.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        RetrievalQA: Catena RAG pronta all'uso, o None in caso di errore
+    """
+    if check_project_index_update_needed(project):
+        logger.info(f"Indice del progetto {project.id} da aggiornare prima del batch")
+        qa_chain = create_project_rag_chain(project=project)
+        cache_project_rag_chain(project, qa_chain)
+        return qa_chain
+    return get_project_rag_chain(project)
+
+
+def _candidate_counts(plan, rag_settings):
+    """
+    Calcola quanti frammenti servono a un piano (k finale e candidati da recuperare).
+
+    Replica le regole di build_project_retriever: il rerank allarga i candidati e
+    MMR o i filtri sui metadati richiedono fetch_k risultati prima della selezione.
+
+    Returns:
+        tuple: (k, numero di candidati da recuperare dall'indice)
+    """
+    k = plan['k']
+    fetch_k = plan['fetch_k']
+    if rag_settings.get('rerank_model'):
+        k = max(k, rag_settings['rerank_top_n'] * RERANK_CANDIDATE_MULTIPLIER)
+        fetch_k = max(fetch_k, k * 3)
+    if plan['search_type'] == 'mmr' or plan.get('filter'):
+        return k, fetch_k
+    return k, k
+
+
+def _matches_filter(metadata, search_filter):
+    """
+    Verifica che i metadati di un documento soddisfino un filtro {chiave: valore}.
+    """
+    return all(metadata.get(key) == value for key, value in search_filter.items())
+
+
+def batch_similarity_search(vectordb, questions, plans, rag_settings):
+    """
+    Recupera i frammenti per tutte le domande con un'unica ricerca sull'indice FAISS.
+
+    Gli embedding delle domande sono calcolati con una sola chiamata batch; la ricerca
+    usa la matrice di tutte le query e recupera per ognuna il numero massimo di candidati
+    richiesto dai piani. Filtri, soglia di rilevanza e MMR vengono poi applicati per
+    domanda sui candidati, con la stessa semantica del retriever standard.
+
+    Args:
+        vectordb: Indice FAISS del progetto
+        questions: Lista delle domande (query di ricerca)
+        plans: Piani di recupero, uno per domanda
+        rag_settings: Dizionario restituito da get_project_RAG_settings
+
+    Returns:
+        list: Per ogni domanda, la lista dei Document recuperati (in ordine di rilevanza)
+    """
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    # 1. Un'unica chiamata di embedding per tutte le domande
+    query_vectors = np.array(vectordb.embeddings.embed_documents(questions), dtype=np.float32)
+    if getattr(vectordb, '_normalize_L2', False):
+        query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    counts = [_candidate_counts(plan, rag_settings) for plan in plans]
+    fetch = min(max(candidates for _, candidates in counts), vectordb.index.ntotal)
+    if fetch <= 0:
+        return [[] for _ in questions]
+
+    # 2. Un'unica ricerca vettoriale per tutte le domande
+    distances, indices = vectordb.index.search(query_vectors, fetch)
+    relevance_fn = vectordb._select_relevance_score_fn()
+
+    results = []
+    for row, plan in enumerate(plans):
+        k, candidates = counts[row]
+        docs, positions, scores = [], [], []
+        for position, (distance, index) in enumerate(zip(distances[row], indices[row])):
+            if index == -1 or position >= candidates:
+                break
+            doc = vectordb.docstore.search(vectordb.index_to_docstore_id[int(index)])
+            if plan.get('filter') and not _matches_filter(doc.metadata, plan['filter']):
+                continue
+            docs.append(doc)
+            positions.append(int(index))
+            scores.append(float(distance))
+
+        if plan['search_type'] == 'mmr' and len(docs) > k:
+            # MMR sui vettori dei candidati, ricostruiti dall'indice FAISS
+            candidate_vectors = np.array([vectordb.index.reconstruct(index) for index in positions])
+            selected = maximal_marginal_relevance(
+                query_vectors[row], candidate_vectors, k=k, lambda_mult=plan['lambda_mult'])
+            docs = [docs[i] for i in selected]
+        elif plan['search_type'] == 'similarity_score_threshold':
+            docs = [doc for doc, distance in zip(docs, scores)
+                    if relevance_fn(distance) >= plan['score_threshold']][:k]
+        else:
+            docs = docs[:k]
+
+        results.append(docs)
+
+    logger.info(f"🔎 Ricerca batch: {len(questions)} domande, {fetch} candidati per domanda in una sola ricerca")
+    return results
+
+
+def _format_sources(docs):
+    """
+    Riduce i documenti di contesto a una descrizione compatta delle fonti.
+    """
+    sources = []
+    for doc in docs:
+        metadata = doc.metadata
+        source_type = metadata.get('type', 'file')
+        if source_type == 'url':
+            name = metadata.get('url', '')
+        elif source_type == 'note':
+            name = metadata.get('title') or 'Senza titolo'
+        else:
+            name = metadata.get('filename') or metadata.get('source', '')
+        sources.append({
+            'type': source_type,
+            'name': name,
+            'page': metadata.get('page'),
+            'rerank_score': metadata.get('rerank_score'),
+        })
+    return sources
+
+
+def answer_questions_batch(project, questions, max_concurrency=None):
+    """
+    Risponde a una lista di domande su un progetto condividendo indice e recupero.
+
+    La catena e l'indice vengono caricati una sola volta, il recupero avviene con
+    un'unica ricerca vettoriale e le generazioni sono eseguite in parallelo (al più
+    max_concurrency alla volta). I risultati vengono restituiti non appena pronti,
+    quindi non necessariamente nell'ordine delle domande: ogni risultato riporta
+    l'indice della domanda. Ogni risposta generata viene registrata nell'utilizzo
+    dell'abbonamento come una normale query RAG.
+
+    La classificazione delle domande usa il classificatore a parole chiave, per non
+    aggiungere una chiamata di embedding per ogni domanda.
+
+    Args:
+        project: Oggetto Project
+        questions: Lista delle domande
+        max_concurrency: Numero massimo di generazioni parallele (opzionale)
+
+    Yields:
+        dict: {'index', 'question', 'answer', 'question_type', 'sources', 'processing_time', 'error'}
+    """
+    questions = [question.strip() for question in questions if question and question.strip()]
+    if not questions:
+        return
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise ValueError(f"Troppe domande nel batch: {len(questions)} (massimo {BATCH_MAX_QUESTIONS})")
+
+    # ===== STEP 1: CARICAMENTO UNICO DELLA CATENA E DELL'INDICE =====
+    qa_chain = load_batch_project_chain(project)
+    vectordb = get_chain_vectorstore(qa_chain) if qa_chain is not None else None
+    if vectordb is None:
+        for index, question in enumerate(questions):
+            yield {'index': index, 'question': question, 'answer': None, 'question_type': None,
+                   'sources': [], 'processing_time': 0, 'error': 'index_unavailable'}
+        return
+
+    chain_settings = qa_chain.metadata or {}
+    engine_settings = chain_settings.get('engine_settings') or get_project_LLM_settings(project)
+    rag_settings = chain_settings.get('rag_settings') or get_project_RAG_settings(project)
+    context_budget = chain_settings.get('context_budget') or compute_context_token_budget(
+        engine_settings, build_rag_prompt_template(rag_settings))
+    model_name = engine_settings['model']
+
+    # ===== STEP 2: PIANIFICAZIONE DI TUTTE LE DOMANDE =====
+    snapshot = get_project_content_snapshot(project)
+    summaries = get_active_project_summaries(project)
+    plans = [plan_query(question, rag_settings, context_budget, snapshot=snapshot,
+                        summaries_available=bool(summaries))
+             for question in questions]
+
+    # ===== STEP 3: RECUPERO CONDIVISO =====
+    start_time = time.time()
+    retrieved = batch_similarity_search(vectordb, questions, plans, rag_settings)
+    retrieval_time = time.time() - start_time
+    logger.info(f"Recupero batch completato in {round(retrieval_time, 2)} secondi")
+
+    # ===== STEP 4: GENERAZIONE CON CONCORRENZA LIMITATA =====
+    llm = qa_chain.combine_documents_chain.llm_chain.llm
+
+    def generate(index):
+        question, plan = questions[index], plans[index]
+        started = time.time()
+        try:
+            if plan['chain_type'] == CHAIN_TYPE_SUMMARIES and summaries:
+                result = answer_from_summaries(question, summaries, llm, plan['context_budget'], model_name)
+                answer, context_docs = result['result'], result['source_documents']
+            else:
+                docs = retrieved[index]
+                if rag_settings.get('rerank_model'):
+                    docs = rerank_documents(question, docs, rag_settings['rerank_model'],
+                                            rag_settings['rerank_top_n'])
+                context_docs = pack_context_documents(docs, plan['context_budget'], model_name)
+                output = qa_chain.combine_documents_chain.invoke({
+                    'input_documents': context_docs,
+                    'question': plan['generation_question'],
+                })
+                answer = output.get('output_text', '')
+            error = None
+        except Exception as e:
+            logger.error(f"Errore nella generazione della risposta {index} del batch: {str(e)}")
+            answer, context_docs, error = None, [], str(e)
+
+        return {
+            'index': index,
+            'question': question,
+            'answer': answer,
+            'question_type': plan['question_type'],
+            'sources': _format_sources(context_docs),
+            'processing_time': round(time.time() - started, 2),
+            'error': error,
+        }
+
+    with ThreadPoolExecutor(max_workers=max_concurrency or BATCH_MAX_CONCURRENCY) as executor:
+        futures = [executor.submit(generate, index) for index in range(len(questions))]
+        for future in as_completed(futures):
+            result = future.result()
+            if result['error'] is None:
+                record_rag_query_usage(project, result['question'], result['answer'], result['processing_time'])
+            yield result
+
+
+def iter_batch_results_jsonl(results):
+    """
+    Serializza i risultati di un batch come righe JSONL.
+
+    Args:
+        results: Iterabile di dizionari (es. restituito da answer_questions_batch)
+
+    Yields:
+        str: Una riga JSON terminata da newline per ogni risultato
+    """
+    for result in results:
+        yield json.dumps(result, ensure_ascii=False) + "\n"
@@ -0,0 +1,297 @@
+"""
+Archivio dei file di progetto indirizzato per contenuto.
+Questo modulo si occupa di:
+- Conservare una sola copia fisica di ogni contenuto in MEDIA_ROOT/blobs, indicizzata per hash SHA-256
+- Collegare i file dei progetti al blob tramite hardlink, mantenendo invariati i percorsi dei progetti
+- Usare il numero di link del filesystem come contatore di riferimenti: un blob con un solo link
+  non è più usato da alcun progetto e può essere eliminato
+- Proteggere i contenuti condivisi: i blob sono in sola lettura, un file va staccato dal blob
+  (copiato) prima di essere modificato, e un file modificato sul posto viene ricollegato
+- Migrare nell'archivio i file già presenti e rimuovere i blob non più referenziati
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Abilita la condivisione dei contenuti tra progetti tramite hardlink
+BLOB_STORE_ENABLED = getattr(settings, 'RAG_BLOB_STORE_ENABLED', True)
+
+# Permessi dei blob (condivisi, in sola lettura) e dei file staccati dal blob
+BLOB_FILE_MODE = 0o444
+DETACHED_FILE_MODE = 0o644
+
+
+def get_blob_store_dir():
+    """
+    Restituisce la directory dell'archivio dei blob.
+
+    Returns:
+        str: Percorso della directory
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'blobs')
+
+
+def get_blob_path(file_hash):
+    """
+    Restituisce il percorso del blob per un hash di contenuto.
+
+    Args:
+        file_hash: Hash SHA-256 del contenuto
+
+    Returns:
+        str: Percorso del blob
+    """
+    return os.path.join(get_blob_store_dir(), file_hash[:2], file_hash)
+
+
+def _protect_blob(blob_path):
+    """
+    Rende il blob in sola lettura: il contenuto è condiviso da tutti i file collegati.
+    """
+    try:
+        os.chmod(blob_path, BLOB_FILE_MODE)
+    except OSError as e:
+        logger.debug(f"Impossibile rendere in sola lettura il blob {os.path.basename(blob_path)}: {str(e)}")
+
+
+def link_file_to_blob(file_path, file_hash):
+    """
+    Fa sì che un file di progetto condivida il contenuto fisico con il blob del suo hash.
+
+    Se il blob non esiste, il file diventa il blob (nuovo hardlink, nessuna copia).
+    Se esiste già, il file viene sostituito atomicamente da un hardlink al blob e
+    lo spazio della copia duplicata viene liberato. Il contenuto collegato diventa
+    in sola lettura: per modificarlo va usato detach_file_from_blob.
+
+    Args:
+        file_path: Percorso del file di progetto
+        file_hash: Hash SHA-256 del contenuto del file
+
+    Returns:
+        bool: True se il file è collegato al blob, False se il collegamento non è possibile
+            (archivio disattivato, filesystem senza hardlink o su dispositivi diversi)
+    """
+    if not BLOB_STORE_ENABLED or not file_hash:
+        return False
+
+    blob_path = get_blob_path(file_hash)
+    try:
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.link(file_path, blob_path)
+        _protect_blob(blob_path)
+        return True
+    except FileExistsError:
+        pass
+    except OSError as e:
+        logger.debug(f"Impossibile creare il blob per {os.path.basename(file_path)}: {str(e)}")
+        return False
+
+    try:
+        if os.path.samefile(file_path, blob_path):
+            _protect_blob(blob_path)
+            return True
+        # Il prefisso .upload_ esclude il file temporaneo dalla scansione della directory del progetto
+        tmp_path = os.path.join(os.path.dirname(file_path), f".upload_{file_hash[:16]}.link")
+        os.link(blob_path, tmp_path)
+        os.replace(tmp_path, file_path)
+        _protect_blob(blob_path)
+        return True
+    except OSError as e:
+        # Es. blob rimosso nel frattempo dalla garbage collection: il file resta una copia autonoma
+        logger.debug(f"Impossibile collegare {os.path.basename(file_path)} al blob esistente: {str(e)}")
+        return False
+
+
+def detach_file_from_blob(file_path):
+    """
+    Sostituisce un file collegato ad altri link con una copia autonoma e scrivibile.
+
+    Va usata prima di modificare un file di progetto sul posto: scrivere su un hardlink
+    modificherebbe il blob e tutti i file degli altri progetti che lo condividono.
+
+    Args:
+        file_path: Percorso del file di progetto
+
+    Returns:
+        bool: True se il file è ora una copia autonoma
+    """
+    try:
+        if os.stat(file_path).st_nlink > 1:
+            # Il prefisso .upload_ esclude il file temporaneo dalla scansione della directory del progetto
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix='.upload_', suffix='.copy')
+            os.close(fd)
+            try:
+                shutil.copyfile(file_path, tmp_path)
+                shutil.copystat(file_path, tmp_path)
+                os.replace(tmp_path, file_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        os.chmod(file_path, DETACHED_FILE_MODE)
+        return True
+    except OSError as e:
+        logger.warning(f"Impossibile staccare {os.path.basename(file_path)} dal blob: {str(e)}")
+        return False
+
+
+def relink_modified_file(file_path, previous_hash, file_hash):
+    """
+    Ricollega all'archivio un file di progetto il cui contenuto è cambiato.
+
+    Se il file era ancora collegato al blob del contenuto precedente, è stato modificato
+    sul posto e ha modificato anche il blob: il blob non corrisponde più al suo hash e
+    viene rimosso dall'archivio, così nessun nuovo file vi viene collegato. Il file viene
+    quindi staccato dagli altri link e collegato al blob del nuovo contenuto. I file degli
+    altri progetti che condividevano il blob risultano modificati alla loro prossima scansione.
+
+    Args:
+        file_path: Percorso del file di progetto
+        previous_hash: Hash del contenuto registrato prima della modifica
+        file_hash: Hash del contenuto attuale
+
+    Returns:
+        bool: True se il file è collegato al blob del nuovo contenuto
+    """
+    if not BLOB_STORE_ENABLED or not file_hash:
+        return False
+
+    try:
+        previous_blob = get_blob_path(previous_hash) if previous_hash else None
+        if previous_blob and os.path.exists(previous_blob) and os.path.samefile(file_path, previous_blob):
+            logger.warning(f"Blob {previous_hash[:12]} modificato sul posto tramite "
+                           f"{os.path.basename(file_path)}: rimosso dall'archivio")
+            os.remove(previous_blob)
+    except OSError as e:
+        logger.warning(f"Errore nella verifica del blob di {os.path.basename(file_path)}: {str(e)}")
+
+    if not detach_file_from_blob(file_path):
+        return False
+    return link_file_to_blob(file_path, file_hash)
+
+
+def release_blob(file_hash):
+    """
+    Elimina il blob di un hash se nessun file di progetto vi è più collegato.
+
+    Args:
+        file_hash: Hash SHA-256 del contenuto
+
+    Returns:
+        bool: True se il blob è stato eliminato
+    """
+    if not file_hash:
+        return False
+
+    blob_path = get_blob_path(file_hash)
+    try:
+        if os.stat(blob_path).st_nlink > 1:
+            return False
+        os.remove(blob_path)
+        logger.debug(f"Blob {file_hash[:12]} eliminato: nessun riferimento residuo")
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning(f"Errore nell'eliminazione del blob {file_hash[:12]}: {str(e)}")
+        return False
+
+
+def collect_unreferenced_blobs(dry_run=False):
+    """
+    Elimina tutti i blob non più collegati ad alcun file di progetto.
+
+    Args:
+        dry_run: Se True, conta i blob eliminabili senza eliminarli
+
+    Returns:
+        dict: {'checked', 'removed', 'freed_bytes'}
+    """
+    stats = {'checked': 0, 'removed': 0, 'freed_bytes': 0}
+    blob_dir = get_blob_store_dir()
+    if not os.path.exists(blob_dir):
+        return stats
+
+    for root, _, files in os.walk(blob_dir):
+        for filename in files:
+            stats['checked'] += 1
+            blob_path = os.path.join(root, filename)
+            try:
+                blob_stat = os.stat(blob_path)
+                if blob_stat.st_nlink > 1:
+                    continue
+                if not dry_run:
+                    os.remove(blob_path)
+                stats['removed'] += 1
+                stats['freed_bytes'] += blob_stat.st_size
+            except OSError as e:
+                logger.warning(f"Errore nella verifica del blob {filename}: {str(e)}")
+
+    logger.info(f"🧹 Garbage collection dei blob: {stats['removed']}/{stats['checked']} eliminati, "
+                f"{stats['freed_bytes'] // 1024} KB liberati")
+    return stats
+
+
+def adopt_project_files(project=None, dry_run=False):
+    """
+    Collega all'archivio dei blob i file di progetto già presenti su disco.
+
+    I file con lo stesso contenuto in progetti diversi vengono ridotti a una sola
+    copia fisica condivisa.
+
+    Args:
+        project: Progetto da migrare (opzionale, default tutti i progetti)
+        dry_run: Se True, calcola solo lo spazio recuperabile
+
+    Returns:
+        dict: {'checked', 'linked', 'deduplicated', 'saved_bytes'}
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectFile
+    from dashboard.rag_document_utils import compute_file_hash
+
+    stats = {'checked': 0, 'linked': 0, 'deduplicated': 0, 'saved_bytes': 0}
+    seen_hashes = set()
+    files = ProjectFile.objects.exclude(file_hash='').only('file_path', 'file_hash', 'file_size')
+    if project is not None:
+        files = files.filter(project=project)
+
+    for project_file in files.iterator():
+        if not os.path.exists(project_file.file_path):
+            continue
+        stats['checked'] += 1
+
+        blob_path = get_blob_path(project_file.file_hash)
+        blob_exists = os.path.exists(blob_path)
+        if blob_exists and os.path.samefile(project_file.file_path, blob_path):
+            continue
+
+        # Un hash non aggiornato collegherebbe il file a un contenuto diverso: va verificato
+        if compute_file_hash(project_file.file_path) != project_file.file_hash:
+            logger.warning(f"Hash non aggiornato per {project_file.file_path}, file non migrato")
+            continue
+
+        if dry_run:
+            # In simulazione il blob non viene creato: i contenuti già visti contano come duplicati
+            if blob_exists or project_file.file_hash in seen_hashes:
+                stats['deduplicated'] += 1
+                stats['saved_bytes'] += project_file.file_size
+            seen_hashes.add(project_file.file_hash)
+            continue
+
+        if link_file_to_blob(project_file.file_path, project_file.file_hash):
+            stats['linked'] += 1
+            if blob_exists:
+                stats['deduplicated'] += 1
+                stats['saved_bytes'] += project_file.file_size
+
+    logger.info(f"📦 Migrazione nell'archivio dei blob: {stats['linked']} file collegati, "
+                f"{stats['deduplicated']} duplicati, {stats['saved_bytes'] // 1024} KB recuperati")
+    return stats
@@ -0,0 +1,307 @@
+"""
+Assemblaggio del contesto per le catene RAG.
+Questo modulo si occupa di:
+- Misurare i chunk in token con tiktoken
+- Unire i chunk adiacenti o sovrapposti provenienti dalla stessa fonte
+- Eliminare i chunk ridondanti (duplicati o contenuti in altri chunk)
+- Riempire un budget di token esplicito derivato dalla finestra di contesto del motore
+"""
+
+import hashlib
+import logging
+import re
+from functools import lru_cache
+from typing import List
+
+from django.conf import settings
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Separatore usato dalla catena "stuff" per concatenare i documenti nel contesto
+CONTEXT_DOCUMENT_SEPARATOR = "\n\n"
+
+# Sovrapposizione minima (in caratteri) per considerare due chunk consecutivi della stessa fonte
+MIN_TEXT_OVERLAP = 20
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model_name):
+    """
+    Restituisce l'encoding tiktoken per il modello, o None se non disponibile.
+
+    Args:
+        model_name: Nome del modello (es. 'gpt-4o')
+
+    Returns:
+        tiktoken.Encoding o None
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # Modello non noto a tiktoken (es. Gemini o Claude): usa l'encoding più comune
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Encoding tiktoken non disponibile per {model_name}, uso stima approssimata: {str(e)}")
+        return None
+
+
+def count_tokens(text, model_name="gpt-3.5-turbo"):
+    """
+    Conta i token di un testo per il modello indicato.
+
+    Se tiktoken non è disponibile usa una stima approssimata (circa 4 caratteri per token).
+
+    Args:
+        text: Testo da misurare
+        model_name: Nome del modello
+
+    Returns:
+        int: Numero di token
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model_name or "gpt-3.5-turbo")
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens, model_name="gpt-3.5-turbo"):
+    """
+    Tronca un testo in modo che resti entro max_tokens (stima proporzionale sui caratteri).
+
+    Args:
+        text: Testo da troncare
+        max_tokens: Numero massimo di token
+        model_name: Nome del modello
+
+    Returns:
+        str: Testo eventualmente troncato
+    """
+    tokens = count_tokens(text, model_name)
+    if tokens <= max_tokens:
+        return text
+    return text[:int(len(text) * max_tokens / tokens)]
+
+
+def compute_context_token_budget(engine_settings, prompt_template="", reserved_tokens=None):
+    """
+    Calcola il budget di token disponibile per il contesto a partire dalla finestra del motore.
+
+    budget = context_window - max_tokens (risposta) - token del prompt - riserva per la domanda,
+    limitato superiormente da RAG_MAX_CONTEXT_TOKENS.
+
+    Args:
+        engine_settings: Dizionario restituito da get_project_LLM_settings
+        prompt_template: Template del prompt senza contesto (opzionale)
+        reserved_tokens: Token riservati alla domanda e ai margini (opzionale)
+
+    Returns:
+        int: Numero massimo di token da destinare al contesto
+    """
+    engine = engine_settings.get('engine')
+    context_window = getattr(engine, 'context_window', None) or 8192
+    max_output_tokens = engine_settings.get('max_tokens') or 0
+    if reserved_tokens is None:
+        reserved_tokens = getattr(settings, 'RAG_CONTEXT_RESERVED_TOKENS', 512)
+
+    prompt_tokens = count_tokens(prompt_template, engine_settings.get('model'))
+    available = context_window - max_output_tokens - prompt_tokens - reserved_tokens
+
+    max_context_tokens = getattr(settings, 'RAG_MAX_CONTEXT_TOKENS', 6000)
+    min_context_tokens = getattr(settings, 'RAG_MIN_CONTEXT_TOKENS', 1000)
+    if available < min_context_tokens:
+        # Finestra del modello troppo piccola per il minimo configurato: non superarla
+        logger.warning(f"Budget di contesto ridotto a {max(available, 0)} token: la finestra del modello "
+                       f"({context_window}) non consente il minimo di {min_context_tokens}")
+        return max(available, 0)
+    return min(available, max_context_tokens)
+
+
+def _source_key(doc):
+    """
+    Restituisce una chiave che identifica la fonte (e la pagina) di un chunk.
+    """
+    metadata = doc.metadata
+    doc_type = metadata.get('type', 'file')
+    if doc_type == 'url':
+        source = metadata.get('url_id') or metadata.get('url') or metadata.get('source')
+    elif doc_type == 'note':
+        source = metadata.get('note_id') or metadata.get('title') or metadata.get('source')
+    else:
+        source = metadata.get('source') or metadata.get('filename')
+    return doc_type, source, metadata.get('page')
+
+
+def _normalize(text):
+    """
+    Normalizza un testo per il confronto (spazi compressi, minuscolo).
+    """
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def _text_overlap(left, right):
+    """
+    Restituisce la lunghezza del suffisso di left che coincide con il prefisso di right.
+    """
+    max_len = min(len(left), len(right))
+    for size in range(max_len, MIN_TEXT_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_pair(first, second):
+    """
+    Prova a unire due chunk della stessa fonte.
+
+    Usa 'start_index' nei metadati quando disponibile (chunk adiacenti o sovrapposti),
+    altrimenti cerca una sovrapposizione testuale tra la fine del primo e l'inizio del secondo.
+
+    Returns:
+        str o None: Testo unito, o None se i chunk non sono contigui
+    """
+    first_text, second_text = first.page_content, second.page_content
+    first_start = first.metadata.get('start_index')
+    second_start = second.metadata.get('start_index')
+
+    if first_start is not None and second_start is not None:
+        if second_start < first_start:
+            first_text, second_text = second_text, first_text
+            first_start, second_start = second_start, first_start
+        first_end = first_start + len(first_text)
+        if second_start > first_end:
+            return None
+        # Aggiungi solo la parte del secondo chunk che eccede il primo
+        return first_text + second_text[first_end - second_start:]
+
+    overlap = _text_overlap(first_text, second_text)
+    if overlap:
+        return first_text + second_text[overlap:]
+    overlap = _text_overlap(second_text, first_text)
+    if overlap:
+        return second_text + first_text[overlap:]
+    return None
+
+
+def deduplicate_and_merge_documents(docs):
+    """
+    Elimina i chunk ridondanti e unisce quelli adiacenti o sovrapposti della stessa fonte.
+
+    L'ordine di rilevanza del retriever viene preservato: il chunk risultante da
+    un'unione prende la posizione del chunk più rilevante che lo compone.
+
+    Args:
+        docs: Lista di Document restituiti dal retriever (in ordine di rilevanza)
+
+    Returns:
+        list: Lista di Document senza ridondanze
+    """
+    result = []
+    seen_hashes = set()
+    # Per ogni fonte, indici in result dei chunk già accettati
+    by_source = {}
+
+    for doc in docs:
+        normalized = _normalize(doc.page_content)
+        if not normalized:
+            continue
+
+        # 1. Duplicati esatti (anche tra fonti diverse, es. stessa pagina web crawlata due volte)
+        content_hash = hashlib.md5(normalized.encode()).hexdigest()
+        if content_hash in seen_hashes:
+            continue
+        seen_hashes.add(content_hash)
+
+        key = _source_key(doc)
+        merged = False
+        for index in by_source.get(key, []):
+            existing = result[index]
+            existing_normalized = _normalize(existing.page_content)
+
+            # 2. Chunk già contenuto in uno accettato (o viceversa)
+            if normalized in existing_normalized:
+                merged = True
+                break
+            if existing_normalized in normalized:
+                metadata = dict(existing.metadata)
+                if 'start_index' in doc.metadata:
+                    metadata['start_index'] = doc.metadata['start_index']
+                result[index] = Document(page_content=doc.page_content, metadata=metadata)
+                merged = True
+                break
+
+            # 3. Chunk adiacenti o sovrapposti: uniscili in un unico blocco
+            merged_text = _merge_pair(existing, doc)
+            if merged_text is not None:
+                metadata = dict(existing.metadata)
+                starts = [d.metadata.get('start_index') for d in (existing, doc)]
+                if None not in starts:
+                    metadata['start_index'] = min(starts)
+                result[index] = Document(page_content=merged_text, metadata=metadata)
+                merged = True
+                break
+
+        if not merged:
+            by_source.setdefault(key, []).append(len(result))
+            result.append(doc)
+
+    return result
+
+
+def pack_context_documents(docs, token_budget, model_name="gpt-3.5-turbo"):
+    """
+    Seleziona i documenti da inserire nel contesto rispettando un budget di token.
+
+    I documenti vengono deduplicati/uniti e poi aggiunti in ordine di rilevanza
+    finché il budget lo consente; quelli che non entrano vengono saltati a favore
+    di documenti successivi più piccoli.
+
+    Args:
+        docs: Lista di Document in ordine di rilevanza
+        token_budget: Numero massimo di token per il contesto
+        model_name: Modello per il conteggio dei token
+
+    Returns:
+        list: Documenti selezionati per il contesto
+    """
+    candidates = deduplicate_and_merge_documents(docs)
+    separator_tokens = count_tokens(CONTEXT_DOCUMENT_SEPARATOR, model_name)
+
+    packed = []
+    used_tokens = 0
+    for doc in candidates:
+        doc_tokens = count_tokens(doc.page_content, model_name)
+        cost = doc_tokens + (separator_tokens if packed else 0)
+        if used_tokens + cost > token_budget:
+            continue
+        # Copia i metadati per non modificare i documenti conservati nel docstore FAISS
+        packed.append(Document(page_content=doc.page_content, metadata={**doc.metadata, 'token_count': doc_tokens}))
+        used_tokens += cost
+
+    logger.info(f"📦 Contesto assemblato: {len(docs)} chunk recuperati → {len(candidates)} dopo dedup/merge "
+                f"→ {len(packed)} inclusi ({used_tokens}/{token_budget} token)")
+    return packed
+
+
+class TokenBudgetRetriever(BaseRetriever):
+    """
+    Retriever che avvolge un retriever esistente e riduce i risultati al budget di token.
+
+    Viene passato a RetrievalQA al posto del retriever del vector store, così la catena
+    "stuff" riceve un contesto già deduplicato, unito e limitato in token.
+    """
+    base_retriever: BaseRetriever
+    token_budget: int
+    model_name: str = "gpt-3.5-turbo"
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return pack_context_documents(docs, self.token_budget, self.model_name)
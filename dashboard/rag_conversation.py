@@ -0,0 +1,215 @@
+"""
+Cronologia compressa delle conversazioni di progetto.
+Questo modulo si occupa di:
+- Mantenere, dopo ogni risposta, un riassunto incrementale della conversazione limitato in token
+- Riscrivere le domande di follow-up ("e il prezzo?", "spiegalo meglio") in domande autonome
+  da usare per il recupero, con un costo in token fisso indipendente dalla lunghezza della conversazione
+"""
+
+import logging
+import re
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from dashboard.rag_context import truncate_to_tokens
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Token massimi del riassunto della conversazione
+CONVERSATION_SUMMARY_MAX_TOKENS = getattr(settings, 'RAG_CONVERSATION_SUMMARY_MAX_TOKENS', 300)
+
+# Oltre questo intervallo (in secondi) dall'ultimo scambio inizia una nuova conversazione
+CONVERSATION_MAX_IDLE_SECONDS = getattr(settings, 'RAG_CONVERSATION_MAX_IDLE_SECONDS', 3600)
+
+# Token massimi di domanda e risposta dell'ultimo scambio non ancora riassunto
+CONVERSATION_LAST_EXCHANGE_MAX_TOKENS = 200
+
+# Ellissi: domande brevi che proseguono la precedente con una congiunzione ("e il prezzo?")
+FOLLOWUP_MAX_WORDS = 8
+FOLLOWUP_ELLIPSIS_PATTERN = re.compile(
+    r'^\W*(?:e|ed|ma|però|invece|anche|and|but|also|what about|how about)(?!\w)',
+    re.IGNORECASE
+)
+
+# Riferimenti anaforici espliciti a quanto detto in precedenza, a qualsiasi lunghezza.
+# Sono esclusi i pronomi generici ("it", "they") e i relativi ("that", "quello che")
+FOLLOWUP_ANAPHORA_PATTERN = re.compile(
+    r'(?<!\w)(?:questo|questa|questi|queste|quell[oaie](?!\s+che)|lo stesso|la stessa|gli stessi|le stesse|'
+    r'suddett[oaie]|precedente|precedentemente|di cui sopra|appena (?:detto|detta|citato|citata|menzionato|menzionata)|'
+    r'spiegalo|spiegala|approfondisci|continua|dimmi di più|'
+    r'this|these|the same|above|previous|previously|aforementioned|mentioned|tell me more|elaborate|go on)(?!\w)',
+    re.IGNORECASE
+)
+
+SUMMARY_UPDATE_PROMPT = """Aggiorna il riassunto di una conversazione tra un utente e un assistente
+con il nuovo scambio. Mantieni solo ciò che serve a capire le domande successive: argomenti,
+documenti, entità, nomi e dati citati. Massimo 120 parole, nella lingua della conversazione.
+
+RIASSUNTO PRECEDENTE:
+{summary}
+
+NUOVO SCAMBIO:
+Utente: {question}
+Assistente: {answer}
+
+RIASSUNTO AGGIORNATO:"""
+
+REWRITE_PROMPT = """Dato il riassunto della conversazione e una domanda di follow-up, riscrivi la domanda
+in modo che sia comprensibile da sola, sostituendo pronomi e riferimenti impliciti con gli
+argomenti a cui si riferiscono. Non rispondere alla domanda. Se è già autonoma, restituiscila
+invariata. Usa la lingua della domanda e restituisci solo la domanda riscritta.
+
+CONVERSAZIONE:
+{history}
+
+DOMANDA DI FOLLOW-UP: {question}
+
+DOMANDA AUTONOMA:"""
+
+
+def get_conversation_history(project):
+    """
+    Restituisce il contesto compresso della conversazione corrente del progetto.
+
+    Il contesto è il riassunto salvato sull'ultimo scambio; se l'ultimo scambio non è
+    ancora stato riassunto (aggiornamento in corso), viene usato il riassunto precedente
+    più l'ultimo scambio troncato. In entrambi i casi la dimensione è limitata.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        str: Contesto della conversazione, vuoto se non c'è una conversazione recente
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectConversation
+
+    since = timezone.now() - timedelta(seconds=CONVERSATION_MAX_IDLE_SECONDS)
+    recent = list(ProjectConversation.objects.filter(project=project, created_at__gte=since)
+                  .order_by('-created_at')
+                  .values_list('question', 'answer', 'context_summary')[:2])
+    if not recent:
+        return ""
+
+    question, answer, summary = recent[0]
+    if summary:
+        return summary
+
+    previous_summary = recent[1][2] if len(recent) > 1 and recent[1][2] else ""
+    last_exchange = (f"Utente: {truncate_to_tokens(question, CONVERSATION_LAST_EXCHANGE_MAX_TOKENS)}\n"
+                     f"Assistente: {truncate_to_tokens(answer, CONVERSATION_LAST_EXCHANGE_MAX_TOKENS)}")
+    return f"{previous_summary}\n{last_exchange}".strip()
+
+
+def is_followup_question(question):
+    """
+    Stima se una domanda dipende dal contesto della conversazione.
+
+    Servono segnali espliciti: un'ellissi (domanda breve che inizia con una congiunzione)
+    o un riferimento anaforico a quanto detto prima. Le domande brevi ma autonome
+    ("orari di apertura?") non vengono riscritte.
+
+    Args:
+        question: Testo della domanda
+
+    Returns:
+        bool: True se la domanda contiene un'ellissi o un riferimento anaforico
+    """
+    if len(question.split()) <= FOLLOWUP_MAX_WORDS and FOLLOWUP_ELLIPSIS_PATTERN.search(question):
+        return True
+    return bool(FOLLOWUP_ANAPHORA_PATTERN.search(question))
+
+
+def rewrite_followup_question(question, history, llm):
+    """
+    Riscrive una domanda di follow-up come domanda autonoma per il recupero.
+
+    Args:
+        question: Domanda dell'utente
+        history: Contesto restituito da get_conversation_history
+        llm: Modello LangChain
+
+    Returns:
+        str: Domanda autonoma (la domanda originale se non serve o in caso di errore)
+    """
+    if not history or not is_followup_question(question):
+        return question
+
+    try:
+        response = llm.invoke(REWRITE_PROMPT.format(history=history, question=question))
+        standalone = getattr(response, 'content', str(response)).strip().strip('"')
+    except Exception as e:
+        logger.warning(f"Riscrittura della domanda non riuscita, uso l'originale: {str(e)}")
+        return question
+
+    if standalone and standalone != question:
+        logger.info(f"🔁 Domanda riscritta: '{question[:50]}' → '{standalone[:80]}'")
+        return standalone
+    return question
+
+
+def update_conversation_summary(conversation, llm, model_name="gpt-3.5-turbo"):
+    """
+    Aggiorna in modo incrementale il riassunto della conversazione con lo scambio appena salvato.
+
+    Il nuovo riassunto è calcolato dal riassunto dello scambio precedente (se recente) e
+    dalla nuova coppia domanda/risposta, quindi ha un costo fisso per scambio.
+
+    Args:
+        conversation: Oggetto ProjectConversation appena creato
+        llm: Modello LangChain
+        model_name: Nome del modello per il conteggio dei token
+
+    Returns:
+        str: Riassunto aggiornato, o None in caso di errore
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectConversation
+
+    since = conversation.created_at - timedelta(seconds=CONVERSATION_MAX_IDLE_SECONDS)
+    previous_summary = ProjectConversation.objects.filter(
+        project_id=conversation.project_id,
+        created_at__lt=conversation.created_at,
+        created_at__gte=since,
+        context_summary__isnull=False,
+    ).order_by('-created_at').values_list('context_summary', flat=True).first() or ""
+
+    prompt = SUMMARY_UPDATE_PROMPT.format(
+        summary=previous_summary or "(nessuno)",
+        question=truncate_to_tokens(conversation.question, CONVERSATION_LAST_EXCHANGE_MAX_TOKENS, model_name),
+        answer=truncate_to_tokens(conversation.answer, CONVERSATION_SUMMARY_MAX_TOKENS * 2, model_name)
+    )
+    try:
+        response = llm.invoke(prompt)
+        summary = getattr(response, 'content', str(response)).strip()
+    except Exception as e:
+        logger.error(f"Errore nell'aggiornamento del riassunto della conversazione {conversation.id}: {str(e)}")
+        return None
+
+    summary = truncate_to_tokens(summary, CONVERSATION_SUMMARY_MAX_TOKENS, model_name)
+    # update() evita di riscrivere gli altri campi della conversazione
+    ProjectConversation.objects.filter(pk=conversation.pk).update(context_summary=summary)
+    return summary
+
+
+def schedule_conversation_summary_update(conversation, llm, model_name="gpt-3.5-turbo"):
+    """
+    Avvia l'aggiornamento del riassunto in un thread separato, senza ritardare la risposta.
+
+    Args:
+        conversation: Oggetto ProjectConversation appena creato
+        llm: Modello LangChain
+        model_name: Nome del modello per il conteggio dei token
+    """
+    def run():
+        try:
+            update_conversation_summary(conversation, llm, model_name)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
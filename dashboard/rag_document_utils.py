@@ -3,20 +3,44 @@ Utility per la gestione dei documenti nel sistema RAG basato su progetti.
 Questo modulo si occupa di:
 - Gestione della cache degli embedding
 - Registrazione e monitoraggio dei documenti di progetto
-- Calcolo degli hash dei file
+- Calcolo degli hash dei file (anche durante il salvataggio dei caricamenti)
+- Rilevamento dei caricamenti duplicati all'interno di un progetto
 - Verifica dello stato degli indici vettoriali
 - Scansione delle directory per rilevare modifiche ai documenti
+- Snapshot aggregato (e in cache) dei contenuti di progetto
+- Cache persistente del testo estratto dai documenti, condivisa tra progetti
 """
 
 import os
+import gzip
 import hashlib
+import json
 import logging
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 
+from dashboard.rag_blob_store import relink_modified_file
+
 # Configurazione logger
 logger = logging.getLogger(__name__)
 
+# Dimensione del buffer di lettura/scrittura per il calcolo degli hash (1 MB)
+FILE_HASH_BUFFER_SIZE = getattr(settings, 'RAG_FILE_HASH_BUFFER_SIZE', 1024 * 1024)
+
+# Thread usati per calcolare gli hash dei file nuovi o modificati durante la scansione
+SCAN_HASH_WORKERS = getattr(settings, 'RAG_SCAN_HASH_WORKERS', 4)
+
+# Manifest (percorso -> mtime, dimensione, hash) salvato nella directory del progetto
+SCAN_MANIFEST_NAME = '.scan_manifest.json'
+
+# Sottocartelle del progetto gestite dall'applicazione e non dall'utente: le pagine dei siti
+# acquisiti sono già indicizzate come ProjectURL e non vanno registrate come file
+PROJECT_SERVICE_DIRS = ('website_content',)
+
 
 def get_embedding_cache_dir():
     """
@@ -38,9 +62,9 @@ def compute_file_hash(file_path):
     """
     Calcola l'hash SHA-256 di un file.
 
-    Legge il file in piccoli chunk per supportare file di grandi dimensioni
-    senza sovraccaricare la memoria. L'hash viene utilizzato per identificare
-    univocamente i file e verificare se sono cambiati.
+    Legge il file a blocchi di FILE_HASH_BUFFER_SIZE byte per supportare file di
+    grandi dimensioni senza sovraccaricare la memoria. L'hash viene utilizzato per
+    identificare univocamente i file e verificare se sono cambiati.
 
     Args:
         file_path: Percorso completo del file
@@ -52,12 +76,85 @@ def compute_file_hash(file_path):
 
     # Leggi il file in chunk per supportare file di grandi dimensioni
     with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b''):
+        for chunk in iter(lambda: f.read(FILE_HASH_BUFFER_SIZE), b''):
             sha256.update(chunk)
 
     return sha256.hexdigest()
 
 
+def save_chunks_with_hash(chunks, target_dir):
+    """
+    Salva una sequenza di blocchi di byte in un file temporaneo calcolando l'hash durante la scrittura.
+
+    Il contenuto viene letto una sola volta: ogni blocco viene scritto su disco e
+    aggiunto all'hash SHA-256, senza rileggere il file al termine. Il file temporaneo
+    è creato nella directory di destinazione, così può essere spostato con os.replace.
+
+    Args:
+        chunks: Iterabile di blocchi di byte
+        target_dir: Directory in cui creare il file temporaneo
+
+    Returns:
+        tuple: (percorso del file temporaneo, hash SHA-256, dimensione in byte)
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    sha256 = hashlib.sha256()
+    file_size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, prefix='.upload_', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in chunks:
+                destination.write(chunk)
+                sha256.update(chunk)
+                file_size += len(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return tmp_path, sha256.hexdigest(), file_size
+
+
+def save_uploaded_file_with_hash(uploaded_file, target_dir):
+    """
+    Salva un file caricato in un file temporaneo calcolando l'hash durante la scrittura.
+
+    Args:
+        uploaded_file: File caricato (UploadedFile di Django)
+        target_dir: Directory in cui creare il file temporaneo
+
+    Returns:
+        tuple: (percorso del file temporaneo, hash SHA-256, dimensione in byte)
+    """
+    return save_chunks_with_hash(uploaded_file.chunks(FILE_HASH_BUFFER_SIZE), target_dir)
+
+
+def find_duplicate_project_file(project, file_hash, file_size=None):
+    """
+    Cerca nel progetto un file già caricato con lo stesso contenuto.
+
+    Args:
+        project: Oggetto Project
+        file_hash: Hash SHA-256 del contenuto
+        file_size: Dimensione in byte (opzionale, filtro aggiuntivo)
+
+    Returns:
+        ProjectFile: Il file esistente con lo stesso contenuto ancora presente su disco, o None
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectFile
+
+    candidates = ProjectFile.objects.filter(project=project, file_hash=file_hash)
+    if file_size is not None:
+        candidates = candidates.filter(file_size=file_size)
+
+    for candidate in candidates.order_by('uploaded_at'):
+        if os.path.exists(candidate.file_path):
+            return candidate
+    return None
+
+
 def get_openai_api_key_for_embedding(user=None):
     """
     Ottiene la chiave API OpenAI per le operazioni di embedding.
@@ -268,83 +365,144 @@ def copy_embedding_to_project_index(project, cache_info, project_index_path):
         logger.error(f"Errore nella copia dell'embedding dalla cache globale al progetto {project.id}: {str(e)}")
         return False
 
-# def check_project_index_update_needed(project):
-#     """
-#     Verifica se l'indice FAISS del progetto deve essere aggiornato.
-#
-#     Controlla vari fattori che potrebbero richiedere un aggiornamento dell'indice:
-#     - Documenti non ancora incorporati
-#     - Cambiamento nel numero di documenti o note
-#     - Note modificate dopo l'ultimo aggiornamento dell'indice
-#     - Cambio nel contenuto delle note (tramite hash)
-#
-#     Questa funzione fornisce un modo efficiente per determinare quando
-#     è necessario aggiornare l'indice vettoriale, evitando operazioni costose
-#     quando non sono necessarie.
-#
-#     Args:
-#         project: Oggetto Project
-#
-#     Returns:
-#         bool: True se l'indice deve essere aggiornato, False altrimenti
-#     """
-#     # Importa qui per evitare l'importazione circolare
-#     from profiles.models import ProjectFile, ProjectNote, ProjectIndexStatus
-#
-#     # Ottieni documenti e note attive del progetto
-#     documents = ProjectFile.objects.filter(project=project)
-#     active_notes = ProjectNote.objects.filter(project=project, is_included_in_rag=True)
-#
-#     logger.debug(f"Controllo aggiornamento indice per progetto {project.id}: "
-#                  f"{documents.count()} documenti, {active_notes.count()} note attive")
-#
-#     # Se non ci sono né documenti né note attive, non è necessario un indice
-#     if not documents.exists() and not active_notes.exists():
-#         logger.debug(f"Nessun documento o nota per il progetto {project.id}, indice non necessario")
-#         return False
-#
-#     # Verifica se esistono documenti non ancora incorporati
-#     non_embedded_docs = documents.filter(is_embedded=False)
-#     if non_embedded_docs.exists():
-#         logger.debug(f"Rilevati {non_embedded_docs.count()} documenti non embedded per il progetto {project.id}")
-#         return True
-#
-#     # Controlla lo stato dell'indice nel database
-#     try:
-#         index_status = ProjectIndexStatus.objects.get(project=project)
-#
-#         # Se il numero totale di documenti e note è cambiato
-#         total_count = documents.count() + active_notes.count()
-#         if index_status.documents_count != total_count:
-#             logger.debug(f"Numero di documenti/note cambiato: {index_status.documents_count} → {total_count}")
-#             return True
-#
-#         # Se una nota è stata modificata dopo l'ultimo aggiornamento dell'indice
-#         latest_note_update = active_notes.order_by('-updated_at').first()
-#         if latest_note_update and latest_note_update.updated_at > index_status.last_updated:
-#             logger.debug(f"Note modificate dopo l'ultimo aggiornamento dell'indice")
-#             return True
-#
-#         # Verifica hash delle note (cambio contenuto)
-#         current_notes_hash = ""
-#         for note in active_notes:
-#             note_hash = hashlib.sha256(f"{note.id}_{note.content}_{note.is_included_in_rag}".encode()).hexdigest()
-#             current_notes_hash += note_hash
-#
-#         current_hash = hashlib.sha256(current_notes_hash.encode()).hexdigest()
-#
-#         if hasattr(index_status, 'notes_hash') and index_status.notes_hash != current_hash:
-#             logger.debug(f"Hash delle note cambiato")
-#             return True
-#
-#         # Indice aggiornato
-#         logger.debug(f"Indice aggiornato per il progetto {project.id}")
-#         return False
-#
-#     except ProjectIndexStatus.DoesNotExist:
-#         # Se non esiste un record per lo stato dell'indice, è necessario crearlo
-#         logger.debug(f"Nessun record di stato dell'indice per il progetto {project.id}")
-#         return True
+# Chiave e durata della cache per lo snapshot dei contenuti di progetto
+PROJECT_SNAPSHOT_CACHE_KEY = "project_content_snapshot_{project_id}"
+PROJECT_SNAPSHOT_CACHE_TIMEOUT = getattr(settings, 'PROJECT_SNAPSHOT_CACHE_TIMEOUT', 300)
+
+# Backend di cache locali al processo: l'invalidazione dei segnali non raggiungerebbe gli altri worker
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _is_snapshot_cache_shared():
+    """
+    Verifica se la cache di default è condivisa tra i processi (es. Redis, Memcached, database).
+
+    Con una cache locale al processo, lo snapshot invalidato da un worker resterebbe
+    valido negli altri fino alla scadenza: in quel caso lo snapshot non viene messo in cache.
+
+    Returns:
+        bool: True se lo snapshot può essere salvato in cache
+    """
+    backend = getattr(settings, 'CACHES', {}).get('default', {}).get(
+        'BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+    return backend not in PROCESS_LOCAL_CACHE_BACKENDS
+
+
+def _empty_snapshot_section():
+    """
+    Restituisce la struttura vuota di una sezione dello snapshot (file, note o URL).
+    """
+    return {
+        'total': 0,
+        'included': 0,
+        'indexed': 0,
+        'pending': 0,
+        'latest_update': None,
+        'latest_indexed': None,
+    }
+
+
+def get_project_content_snapshot(project, use_cache=True):
+    """
+    Restituisce uno snapshot aggregato dei contenuti (file, note, URL) di un progetto.
+
+    Tutti i conteggi necessari al percorso di richiesta RAG vengono calcolati con
+    un'unica query (UNION di tre aggregazioni condizionali, una per tabella) invece
+    delle numerose count()/exists() separate. Se la cache di Django è condivisa tra
+    i processi, il risultato viene salvato in cache e invalidato dai segnali di
+    salvataggio/eliminazione dei contenuti (vedi invalidate_project_content_snapshot);
+    con una cache locale al processo viene ricalcolato a ogni chiamata.
+
+    Semantica dei campi per ogni sezione:
+    - total: numero totale di elementi
+    - included: elementi inclusi nel RAG (per i file coincide con total)
+    - indexed: elementi già presenti nell'indice vettoriale
+    - pending: elementi inclusi ma non ancora indicizzati
+    - latest_update / latest_indexed: ultimi timestamp di modifica e indicizzazione
+
+    Args:
+        project: Oggetto Project di cui calcolare lo snapshot
+        use_cache: Se False ignora la cache e ricalcola lo snapshot
+
+    Returns:
+        dict: Dizionario con le chiavi 'files', 'notes' e 'urls'
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from django.db.models import CharField, Count, Max, Q, Value
+    from profiles.models import ProjectFile, ProjectNote, ProjectURL
+
+    cache_key = PROJECT_SNAPSHOT_CACHE_KEY.format(project_id=project.id)
+    use_cache = use_cache and _is_snapshot_cache_shared()
+    if use_cache:
+        snapshot = cache.get(cache_key)
+        if snapshot is not None:
+            return snapshot
+
+    columns = ('kind', 'total', 'included', 'indexed', 'pending', 'latest_update', 'latest_indexed')
+
+    files_qs = ProjectFile.objects.filter(project=project).values('project').annotate(
+        kind=Value('files', output_field=CharField()),
+        total=Count('id'),
+        included=Count('id'),
+        indexed=Count('id', filter=Q(is_embedded=True)),
+        pending=Count('id', filter=Q(is_embedded=False)),
+        latest_update=Max('last_modified'),
+        latest_indexed=Max('last_indexed_at'),
+    ).order_by().values_list(*columns)
+
+    notes_qs = ProjectNote.objects.filter(project=project).values('project').annotate(
+        kind=Value('notes', output_field=CharField()),
+        total=Count('id'),
+        included=Count('id', filter=Q(is_included_in_rag=True)),
+        indexed=Count('id', filter=Q(is_included_in_rag=True, last_indexed_at__isnull=False)),
+        pending=Count('id', filter=Q(is_included_in_rag=True, last_indexed_at__isnull=True)),
+        latest_update=Max('updated_at'),
+        latest_indexed=Max('last_indexed_at'),
+    ).order_by().values_list(*columns)
+
+    urls_qs = ProjectURL.objects.filter(project=project).values('project').annotate(
+        kind=Value('urls', output_field=CharField()),
+        total=Count('id'),
+        included=Count('id', filter=Q(is_included_in_rag=True)),
+        indexed=Count('id', filter=Q(is_indexed=True)),
+        pending=Count('id', filter=Q(is_indexed=False)),
+        latest_update=Max('updated_at'),
+        latest_indexed=Max('last_indexed_at'),
+    ).order_by().values_list(*columns)
+
+    snapshot = {
+        'files': _empty_snapshot_section(),
+        'notes': _empty_snapshot_section(),
+        'urls': _empty_snapshot_section(),
+    }
+
+    # Un'unica query: una riga per tabella (nessuna riga se la tabella è vuota per il progetto)
+    for row in files_qs.union(notes_qs, urls_qs, all=True):
+        kind, values = row[0], row[1:]
+        snapshot[kind] = dict(zip(columns[1:], values))
+
+    if _is_snapshot_cache_shared():
+        cache.set(cache_key, snapshot, PROJECT_SNAPSHOT_CACHE_TIMEOUT)
+    logger.debug(f"Snapshot contenuti calcolato per progetto {project.id}: {snapshot}")
+    return snapshot
+
+
+def invalidate_project_content_snapshot(project):
+    """
+    Invalida lo snapshot in cache dei contenuti di un progetto.
+
+    Va chiamata ogni volta che file, note o URL del progetto cambiano. I salvataggi
+    e le eliminazioni dei modelli sono coperti dai segnali; gli aggiornamenti in
+    blocco (queryset.update()) non emettono segnali e richiedono una chiamata esplicita.
+
+    Args:
+        project: Oggetto Project o ID del progetto
+    """
+    project_id = getattr(project, 'id', project)
+    cache.delete(PROJECT_SNAPSHOT_CACHE_KEY.format(project_id=project_id))
 
 
 def check_project_index_update_needed(project):
@@ -352,7 +510,8 @@ def check_project_index_update_needed(project):
     Verifica se l'indice RAG del progetto necessita di un aggiornamento.
 
     Questa funzione controlla se ci sono documenti, note o URL non ancora
-    indicizzati, o se l'indice stesso non esiste ancora.
+    indicizzati, o se l'indice stesso non esiste ancora. I conteggi provengono
+    dallo snapshot aggregato del progetto (get_project_content_snapshot).
 
     Args:
         project: Oggetto Project da verificare
@@ -360,30 +519,12 @@ def check_project_index_update_needed(project):
     Returns:
         bool: True se l'indice necessita di aggiornamento, False altrimenti
     """
-    # Importazione locale per evitare dipendenze circolari
-    from profiles.models import ProjectFile, ProjectNote, ProjectURL
-    import os
-    from django.conf import settings
-    import logging
-
-    logger = logging.getLogger(__name__)
     logger.debug(f"Controllo aggiornamento indice per progetto {project.id}")
 
-    # Verifica file non ancora indicizzati
-    files_to_embed = ProjectFile.objects.filter(project=project, is_embedded=False).count()
-
-    # Verifica note attive non ancora indicizzate
-    notes_to_embed = ProjectNote.objects.filter(
-        project=project,
-        is_included_in_rag=True,
-        last_indexed_at=None
-    ).count()
-
-    # Verifica URL non ancora indicizzati
-    urls_to_embed = ProjectURL.objects.filter(
-        project=project,
-        is_indexed=False
-    ).count()
+    snapshot = get_project_content_snapshot(project)
+    files_to_embed = snapshot['files']['pending']
+    notes_to_embed = snapshot['notes']['pending']
+    urls_to_embed = snapshot['urls']['pending']
 
     # Verifica se esiste già un indice per il progetto
     index_path = os.path.join(
@@ -391,7 +532,7 @@ def check_project_index_update_needed(project):
         'projects',
         str(project.user.id),
         str(project.id),
-        'vector_index'
+        f'vector_index_{project.id}'
     )
     has_index = os.path.exists(index_path)
 
@@ -402,33 +543,25 @@ def check_project_index_update_needed(project):
     logger.debug(f"- URL da indicizzare: {urls_to_embed}")
     logger.debug(f"- Indice esistente: {has_index}")
 
+    needs_update = files_to_embed > 0 or notes_to_embed > 0 or urls_to_embed > 0
+
     # Casi in cui è necessario aggiornare l'indice:
     # 1. Non esiste un indice ma ci sono contenuti da indicizzare
-    if not has_index and (files_to_embed > 0 or notes_to_embed > 0 or urls_to_embed > 0):
+    if not has_index and needs_update:
         logger.info(f"Indice RAG del progetto {project.id} necessita di creazione iniziale")
         return True
 
     # 2. L'indice esiste ma ci sono nuovi contenuti da aggiungere
-    if has_index and (files_to_embed > 0 or notes_to_embed > 0 or urls_to_embed > 0):
+    if has_index and needs_update:
         logger.info(f"Indice RAG del progetto {project.id} necessita aggiornamento: nuovi contenuti")
         return True
 
-    # Verifica anche la presenza di contenuti già indicizzati
-    indexed_files = ProjectFile.objects.filter(project=project, is_embedded=True).count()
-    indexed_notes = ProjectNote.objects.filter(project=project, is_included_in_rag=True).exclude(
-        last_indexed_at=None).count()
-    indexed_urls = ProjectURL.objects.filter(project=project, is_indexed=True).count()
-
     # 3. Se non ci sono contenuti indicizzati e neanche da indicizzare, log informativo
-    if indexed_files == 0 and indexed_notes == 0 and indexed_urls == 0:
+    if not (snapshot['files']['indexed'] or snapshot['notes']['indexed'] or snapshot['urls']['indexed']):
         logger.debug(f"Nessun documento, nota o URL indicizzato per il progetto {project.id}")
 
-    logger.info(
-        f"Indice RAG del progetto {project.id} necessita aggiornamento: {bool(files_to_embed or notes_to_embed or urls_to_embed)}")
-
-    # Ritorna True se c'è qualsiasi contenuto da indicizzare
-    return files_to_embed > 0 or notes_to_embed > 0 or urls_to_embed > 0
-
+    logger.info(f"Indice RAG del progetto {project.id} necessita aggiornamento: False")
+    return False
 
 
 def update_project_index_status(project, document_ids=None, note_ids=None, url_ids=None):
@@ -475,10 +608,11 @@ def update_project_index_status(project, document_ids=None, note_ids=None, url_i
             index_status.documents_count = total_documents
         else:
             # Se non sono stati specificati documenti, conta quelli esistenti nel progetto
-            file_count = ProjectFile.objects.filter(project=project, is_embedded=True).count()
-            note_count = ProjectNote.objects.filter(project=project, is_included_in_rag=True).count()
-            url_count = ProjectURL.objects.filter(project=project, is_indexed=True).count()
-            index_status.documents_count = file_count + note_count + url_count
+            invalidate_project_content_snapshot(project)
+            snapshot = get_project_content_snapshot(project)
+            index_status.documents_count = (
+                snapshot['files']['indexed'] + snapshot['notes']['included'] + snapshot['urls']['indexed']
+            )
 
         # Calcola un hash rappresentativo per l'indice
         try:
@@ -541,6 +675,9 @@ def update_project_index_status(project, document_ids=None, note_ids=None, url_i
         index_status.save()
         logger.info(f"Stato indice aggiornato per progetto {project.id}: {index_status.documents_count} documenti")
 
+        # I flag di indicizzazione sono appena cambiati: lo snapshot va ricalcolato
+        invalidate_project_content_snapshot(project)
+
         return index_status
 
     except Exception as e:
@@ -548,20 +685,93 @@ def update_project_index_status(project, document_ids=None, note_ids=None, url_i
         return None
 
 
-def scan_project_directory(project):
+def _is_project_service_path(project, project_dir, file_path):
+    """
+    Verifica se un percorso della directory del progetto è un file di servizio e non un documento
+    (indice vettoriale, riassunti, manifest di scansione, caricamenti in corso, pagine web acquisite).
+    """
+    filename = os.path.basename(file_path)
+    if filename.startswith(('.upload_', SCAN_MANIFEST_NAME)):
+        return True
+    relative_top = os.path.relpath(file_path, project_dir).split(os.sep, 1)[0]
+    return relative_top.startswith(f"vector_index_{project.id}") or relative_top in PROJECT_SERVICE_DIRS
+
+
+def _iter_project_files(project, project_dir):
+    """
+    Restituisce ricorsivamente i documenti della directory del progetto con le relative stat.
+
+    Usa os.scandir, così tipo e stat di ogni voce si ottengono senza chiamate aggiuntive.
+
+    Yields:
+        tuple: (percorso completo, os.stat_result)
+    """
+    pending_dirs = [project_dir]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if _is_project_service_path(project, project_dir, entry.path):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path, entry.stat()
+        except OSError as e:
+            logger.warning(f"Impossibile leggere la directory {current_dir}: {str(e)}")
+
+
+def _load_scan_manifest(project_dir):
+    """
+    Carica il manifest dell'ultima scansione: {percorso: [mtime_ns, dimensione, hash]}.
+    """
+    manifest_path = os.path.join(project_dir, SCAN_MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"Manifest di scansione non leggibile, verrà rigenerato: {str(e)}")
+        return {}
+
+
+def _save_scan_manifest(project_dir, manifest):
+    """
+    Salva il manifest di scansione (scrittura atomica).
+    """
+    manifest_path = os.path.join(project_dir, SCAN_MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+    except Exception as e:
+        logger.warning(f"Impossibile salvare il manifest di scansione: {str(e)}")
+
+
+def scan_project_directory(project, paths=None):
     """
     Analizza la directory del progetto per trovare nuovi documenti o modifiche.
 
-    Esegue una scansione completa della directory del progetto, identificando:
+    Esegue una scansione della directory del progetto, identificando:
     - Nuovi file aggiunti
     - File esistenti che sono stati modificati
     - File che sono stati eliminati
 
+    Per evitare di ricalcolare l'hash di ogni file, la scansione confronta data di
+    modifica e dimensione con il manifest salvato dall'ultima scansione: solo i file
+    nuovi o con stat diverse vengono letti, e i loro hash sono calcolati in parallelo.
+    Letture e scritture sul database avvengono in blocco. Se viene passato `paths`
+    (es. dal watcher dei file), vengono verificati solo quei percorsi.
+
     Tutti i cambiamenti vengono aggiornati nel database, garantendo che
     l'indice vettoriale rimanga sincronizzato con i file effettivamente presenti.
 
     Args:
         project: Oggetto Project
+        paths: Percorsi da verificare (opzionale, default l'intera directory)
 
     Returns:
         tuple: (added_docs, modified_docs, deleted_paths) - Liste di documenti
@@ -570,6 +780,8 @@ def scan_project_directory(project):
     # Importa qui per evitare l'importazione circolare
     from profiles.models import ProjectFile
 
+    start_time = time.time()
+
     # Determina la directory del progetto
     project_dir = os.path.join(settings.MEDIA_ROOT, 'projects', str(project.user.id), str(project.id))
 
@@ -578,42 +790,122 @@ def scan_project_directory(project):
         logger.debug(f"Directory del progetto {project.id} non trovata")
         return [], [], []
 
-    # Ottieni tutti i documenti già registrati nel database
-    existing_docs = {doc.file_path: doc for doc in ProjectFile.objects.filter(project=project)}
-    existing_paths = set(existing_docs.keys())
-
-    # Prepara liste per tracciare i cambiamenti
-    current_paths = set()
+    # PARTE 1: stat dei file da verificare (intera directory o solo i percorsi indicati)
+    if paths is None:
+        current_files = dict(_iter_project_files(project, project_dir))
+    else:
+        current_files = {}
+        for file_path in set(paths):
+            if _is_project_service_path(project, project_dir, file_path):
+                continue
+            try:
+                file_stat = os.stat(file_path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if os.path.isfile(file_path):
+                current_files[file_path] = file_stat
+
+    # PARTE 2: lettura in blocco dei documenti registrati
+    existing_docs = ProjectFile.objects.filter(project=project)
+    if paths is not None:
+        existing_docs = existing_docs.filter(file_path__in=set(paths))
+    existing_docs = {doc.file_path: doc for doc in existing_docs}
+
+    # PARTE 3: confronto con il manifest, l'hash viene calcolato solo per i candidati
+    manifest = _load_scan_manifest(project_dir)
+    candidates = []
+    for file_path, file_stat in current_files.items():
+        entry = manifest.get(file_path)
+        doc = existing_docs.get(file_path)
+        if (doc is not None and entry is not None and entry[0] == file_stat.st_mtime_ns
+                and entry[1] == file_stat.st_size == doc.file_size and entry[2] == doc.file_hash):
+            continue
+        candidates.append(file_path)
+
+    hashes = {}
+    if candidates:
+        workers = min(SCAN_HASH_WORKERS, len(candidates))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            future_to_path = {executor.submit(compute_file_hash, path): path for path in candidates}
+            for future in as_completed(future_to_path):
+                file_path = future_to_path[future]
+                try:
+                    hashes[file_path] = future.result()
+                except OSError as e:
+                    # File rimosso o non leggibile durante la scansione
+                    logger.warning(f"Impossibile calcolare l'hash di {file_path}: {str(e)}")
+
+    # PARTE 4: preparazione delle scritture in blocco
     added_docs = []
     modified_docs = []
-
-    # Scansiona ricorsivamente la directory del progetto
-    for root, _, files in os.walk(project_dir):
-        for filename in files:
-            file_path = os.path.join(root, filename)
-            current_paths.add(file_path)
-
-            # Registra il documento o aggiorna il suo stato
-            doc, is_modified = register_project_document(project, file_path)
-
-            # Traccia se il documento è nuovo o modificato
-            if file_path not in existing_paths:
-                added_docs.append(doc)
-            elif is_modified:
-                modified_docs.append(doc)
+    previous_sizes = {}
+    for file_path, file_hash in hashes.items():
+        file_stat = current_files[file_path]
+        filename = os.path.basename(file_path)
+        file_type = os.path.splitext(filename)[1].lower().lstrip('.')
+        manifest[file_path] = [file_stat.st_mtime_ns, file_stat.st_size, file_hash]
+
+        doc = existing_docs.get(file_path)
+        if doc is None:
+            added_docs.append(ProjectFile(
+                project=project,
+                file_path=file_path,
+                filename=filename,
+                file_size=file_stat.st_size,
+                file_hash=file_hash,
+                file_type=file_type,
+                is_embedded=False  # Nuovo file, deve essere incorporato
+            ))
+        elif doc.file_hash != file_hash or doc.file_size != file_stat.st_size:
+            # Un file modificato sul posto può aver modificato anche il blob condiviso
+            if relink_modified_file(file_path, doc.file_hash, file_hash):
+                manifest[file_path] = [os.stat(file_path).st_mtime_ns, file_stat.st_size, file_hash]
+            previous_sizes[doc.pk] = doc.file_size
+            doc.file_hash = file_hash
+            doc.file_size = file_stat.st_size
+            doc.filename = filename
+            doc.file_type = file_type
+            doc.is_embedded = False  # Reset flag per forzare reindicizzazione
+            doc.last_modified = timezone.now()
+            modified_docs.append(doc)
 
     # Trova i documenti eliminati (presenti nel database ma non più nella directory)
-    deleted_paths = existing_paths - current_paths
+    deleted_paths = set(existing_docs) - set(current_files)
 
-    # Rimuovi i documenti eliminati dal database
+    # PARTE 5: scritture in blocco
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.bulk_ingest import bulk_create_project_files, _record_storage_usage
+
+    # Le scritture in blocco non emettono post_save: l'utilizzo dello storage viene aggiornato
+    # esplicitamente, come farebbe il segnale update_storage_usage
+    if added_docs:
+        added_docs = bulk_create_project_files(project, added_docs)
+        _record_storage_usage(project, added_docs)
+    if modified_docs:
+        ProjectFile.objects.bulk_update(
+            modified_docs,
+            ['file_hash', 'file_size', 'filename', 'file_type', 'is_embedded', 'last_modified'],
+            batch_size=500
+        )
+        _record_storage_usage(project, modified_docs, previous_sizes=previous_sizes)
     if deleted_paths:
-        deleted_count = ProjectFile.objects.filter(file_path__in=deleted_paths).delete()[0]
+        deleted_count = ProjectFile.objects.filter(project=project, file_path__in=deleted_paths).delete()[0]
         logger.info(f"Eliminati {deleted_count} documenti non più presenti nella directory del progetto {project.id}")
 
+    for file_path in deleted_paths:
+        manifest.pop(file_path, None)
+    if hashes or deleted_paths:
+        _save_scan_manifest(project_dir, manifest)
+
+    # Le operazioni in blocco non emettono segnali: invalida esplicitamente lo snapshot dei contenuti
+    if added_docs or modified_docs:
+        invalidate_project_content_snapshot(project.id)
+
     # Log dei risultati
     logger.info(f"Scansione directory progetto {project.id}: "
                 f"{len(added_docs)} nuovi, {len(modified_docs)} modificati, "
-                f"{len(deleted_paths)} eliminati")
+                f"{len(deleted_paths)} eliminati ({len(current_files)} file, {len(candidates)} hash calcolati, "
+                f"{time.time() - start_time:.2f}s)")
 
     return added_docs, modified_docs, deleted_paths
 
@@ -663,6 +955,8 @@ def register_project_document(project, file_path, filename=None):
 
         # Verifica se il documento è cambiato (hash o dimensione diversi)
         if doc.file_hash != file_hash or doc.file_size != file_size:
+            # Un file modificato sul posto può aver modificato anche il blob condiviso
+            relink_modified_file(file_path, doc.file_hash, file_hash)
             # Aggiorna i dettagli del documento e imposta is_embedded a False
             doc.file_hash = file_hash
             doc.file_size = file_size
@@ -692,6 +986,188 @@ def register_project_document(project, file_path, filename=None):
         return doc, True  # Nuovo documento
 
 
+# ==============================================================================
+# CACHE DEL TESTO ESTRATTO DAI DOCUMENTI
+# ==============================================================================
+
+# Dimensione massima della cache del testo estratto: oltre, vengono eliminati i file usati meno di recente
+PARSED_TEXT_CACHE_MAX_MB = getattr(settings, 'RAG_PARSED_TEXT_CACHE_MAX_MB', 2048)
+
+# Metadati che dipendono dal percorso del file e non dal contenuto: la cache è condivisa tra
+# progetti, quindi vengono salvati vuoti e ricalcolati dal percorso del file che la riusa
+PARSED_TEXT_PATH_KEYS = ('source', 'file_path', 'filename', 'filename_no_ext')
+
+
+def get_parsed_text_cache_path(file_hash, loader_version):
+    """
+    Restituisce il percorso del file di cache del testo estratto per un documento.
+
+    Il testo è indicizzato per hash del contenuto e versione dei loader, quindi è
+    condiviso tra progetti e invalidato automaticamente quando cambia l'estrazione.
+
+    Args:
+        file_hash: Hash SHA-256 del file
+        loader_version: Versione dei loader che hanno prodotto il testo
+
+    Returns:
+        str: Percorso del file JSON compresso
+    """
+    cache_dir = os.path.join(settings.MEDIA_ROOT, 'parsed_text_cache', file_hash[:2])
+    return os.path.join(cache_dir, f"{file_hash}_v{loader_version}.json.gz")
+
+
+def get_cached_parsed_document(file_hash, loader_version, file_path=None):
+    """
+    Recupera il testo già estratto da un documento (per pagina, con i metadati).
+
+    Args:
+        file_hash: Hash SHA-256 del file
+        loader_version: Versione dei loader
+        file_path: Percorso del file che riusa la cache, da cui vengono ricalcolati
+            i metadati legati al percorso (source, file_path, filename)
+
+    Returns:
+        list: Lista di Document, o None se il documento non è in cache
+    """
+    from langchain.schema import Document
+
+    if not file_hash:
+        return None
+
+    cache_path = get_parsed_text_cache_path(file_hash, loader_version)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+            pages = json.load(f)
+        # La data di modifica segna l'ultimo utilizzo, per l'eliminazione dei file meno usati
+        os.utime(cache_path)
+    except Exception as e:
+        logger.warning(f"Cache del testo estratto non leggibile per {file_hash[:8]}...: {str(e)}")
+        return None
+
+    path_metadata = {}
+    if file_path:
+        filename = os.path.basename(file_path)
+        path_metadata = {'source': file_path, 'file_path': file_path,
+                         'filename': filename, 'filename_no_ext': os.path.splitext(filename)[0]}
+    documents = []
+    for page in pages:
+        metadata = page['metadata']
+        for key in PARSED_TEXT_PATH_KEYS:
+            if key in metadata:
+                metadata[key] = path_metadata.get(key)
+        documents.append(Document(page_content=page['page_content'], metadata=metadata))
+    return documents
+
+
+def save_parsed_document(file_hash, documents, loader_version):
+    """
+    Salva in forma compressa il testo estratto da un documento.
+
+    La scrittura è atomica (file temporaneo + rename), così processi concorrenti
+    che indicizzano lo stesso file non leggono mai una cache parziale.
+
+    Args:
+        file_hash: Hash SHA-256 del file
+        documents: Lista di Document prodotti dai loader
+        loader_version: Versione dei loader
+    """
+    if not file_hash or not documents:
+        return
+    # Non salvare i risultati di un'estrazione fallita (es. segnaposto di process_image con 'error'):
+    # verrebbero riusati invece di ritentare l'estrazione
+    if any(doc.metadata.get('error') for doc in documents):
+        logger.debug(f"Testo estratto con errori per {file_hash[:8]}..., non salvato in cache")
+        return
+
+    cache_path = get_parsed_text_cache_path(file_hash, loader_version)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # I metadati legati al percorso restano come chiavi vuote: il primo progetto che ha
+    # caricato il file non deve essere visibile agli altri progetti che riusano la cache
+    pages = [{'page_content': doc.page_content,
+              'metadata': {key: (None if key in PARSED_TEXT_PATH_KEYS else value)
+                           for key, value in doc.metadata.items()}}
+             for doc in documents]
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            # default=str: alcuni loader inseriscono nei metadati valori non serializzabili (es. date)
+            json.dump(pages, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.warning(f"Impossibile salvare il testo estratto per {file_hash[:8]}...: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def prune_parsed_text_cache(max_mb=None):
+    """
+    Riduce la cache del testo estratto entro la dimensione massima configurata.
+
+    Vengono eliminati per primi i file usati meno di recente (data di modifica,
+    aggiornata a ogni lettura).
+
+    Args:
+        max_mb: Dimensione massima in MB (opzionale, default: RAG_PARSED_TEXT_CACHE_MAX_MB)
+
+    Returns:
+        int: Numero di file eliminati
+    """
+    max_bytes = (max_mb if max_mb is not None else PARSED_TEXT_CACHE_MAX_MB) * 1024 * 1024
+    cache_dir = os.path.join(settings.MEDIA_ROOT, 'parsed_text_cache')
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    total_size = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        removed += 1
+
+    if removed:
+        logger.info(f"🧹 Cache del testo estratto ridotta: {removed} file eliminati")
+    return removed
+
+
+def clear_parsed_text_cache():
+    """
+    Cancella la cache del testo estratto dai documenti.
+
+    Returns:
+        int: Numero di file eliminati
+    """
+    import shutil
+
+    cache_dir = os.path.join(settings.MEDIA_ROOT, 'parsed_text_cache')
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    file_count = sum(len(files) for _, _, files in os.walk(cache_dir))
+    shutil.rmtree(cache_dir)
+    logger.info(f"Cache del testo estratto cancellata: {file_count} file eliminati")
+    return file_count
+
+
 
 
 
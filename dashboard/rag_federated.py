@@ -0,0 +1,243 @@
+"""
+Ricerca federata su tutti i progetti di un utente.
+Questo modulo si occupa di:
+- Caricare in parallelo le catene RAG (in cache) dei progetti indicizzati dell'utente
+- Calcolare l'embedding della domanda una sola volta per modello di embedding
+- Interrogare in parallelo gli indici FAISS dei progetti
+- Unire i risultati per punteggio di rilevanza calibrato e generare la risposta con un'unica chiamata LLM
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+from langchain.schema import Document
+
+from dashboard.rag_context import pack_context_documents
+from dashboard.rag_utils import get_chain_vectorstore, get_project_rag_chain
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Numero massimo di progetti interrogati in parallelo
+FEDERATED_MAX_WORKERS = getattr(settings, 'RAG_FEDERATED_MAX_WORKERS', 4)
+
+# Frammenti recuperati da ciascun progetto
+FEDERATED_PER_PROJECT_K = getattr(settings, 'RAG_FEDERATED_PER_PROJECT_K', 8)
+
+# Frammenti candidati al contesto dopo l'unione dei risultati
+FEDERATED_TOP_K = getattr(settings, 'RAG_FEDERATED_TOP_K', 20)
+
+
+def _load_project_chain(project):
+    """
+    Carica la catena RAG di un progetto (eseguita in un thread del pool).
+
+    Returns:
+        tuple: (progetto, catena o None)
+    """
+    try:
+        return project, get_project_rag_chain(project)
+    except Exception as e:
+        logger.error(f"Errore nel caricamento della catena del progetto {project.id}: {str(e)}")
+        return project, None
+    finally:
+        # I thread del pool aprono connessioni proprie: chiudile per non lasciarle appese
+        connections.close_all()
+
+
+def _embedding_key(embeddings):
+    """
+    Identifica il modello di embedding, per calcolare una sola volta il vettore della domanda.
+    """
+    return getattr(embeddings, 'model', None) or type(embeddings).__name__
+
+
+def _search_project(project, vectordb, query_vector, k):
+    """
+    Interroga l'indice di un progetto e calibra i punteggi in rilevanza [0, 1].
+
+    La distanza restituita da FAISS viene convertita con la funzione di rilevanza
+    dell'indice (dipendente dalla strategia di distanza), così i punteggi di
+    progetti diversi sono confrontabili.
+
+    Returns:
+        list: Document con 'project_id', 'project_name', 'score' e 'project_rank' nei metadati
+    """
+    relevance_fn = vectordb._select_relevance_score_fn()
+    results = vectordb.similarity_search_with_score_by_vector(query_vector, k=k)
+
+    docs = []
+    for rank, (doc, distance) in enumerate(results, start=1):
+        score = max(0.0, min(1.0, float(relevance_fn(distance))))
+        docs.append(Document(page_content=doc.page_content, metadata={
+            **doc.metadata,
+            'project_id': project.id,
+            'project_name': project.name,
+            'score': round(score, 4),
+            'project_rank': rank,
+        }))
+    return docs
+
+
+def search_across_projects(user, question, projects=None, per_project_k=None):
+    """
+    Recupera i frammenti più rilevanti per una domanda da tutti i progetti indicati.
+
+    Args:
+        user: Utente proprietario dei progetti
+        question: Testo della domanda
+        projects: Queryset o lista di Project (opzionale, default: progetti attivi dell'utente)
+        per_project_k: Frammenti da recuperare per progetto (opzionale)
+
+    Returns:
+        tuple: (documenti ordinati per punteggio, {project_id: catena RAG})
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import Project
+
+    if projects is None:
+        projects = Project.objects.filter(user=user, is_active=True)
+    # Solo i progetti con un indice esistente: la ricerca federata non costruisce indici
+    projects = list(projects.filter(index_status__index_exists=True).select_related('user')
+                    if hasattr(projects, 'filter') else projects)
+    if not projects:
+        return [], {}
+
+    k = per_project_k or FEDERATED_PER_PROJECT_K
+
+    # ===== STEP 1: CARICAMENTO PARALLELO DELLE CATENE =====
+    with ThreadPoolExecutor(max_workers=FEDERATED_MAX_WORKERS) as executor:
+        loaded = [(project, chain) for project, chain in executor.map(_load_project_chain, projects)
+                  if chain is not None]
+
+    targets = []
+    for project, chain in loaded:
+        vectordb = get_chain_vectorstore(chain)
+        if vectordb is not None:
+            targets.append((project, chain, vectordb))
+
+    # ===== STEP 2: UN EMBEDDING DELLA DOMANDA PER MODELLO =====
+    query_vectors = {}
+    for _, _, vectordb in targets:
+        key = _embedding_key(vectordb.embeddings)
+        if key not in query_vectors:
+            query_vectors[key] = vectordb.embeddings.embed_query(question)
+
+    # ===== STEP 3: RICERCA PARALLELA SUGLI INDICI =====
+    def search(target):
+        project, _, vectordb = target
+        try:
+            return _search_project(project, vectordb, query_vectors[_embedding_key(vectordb.embeddings)], k)
+        except Exception as e:
+            logger.error(f"Errore nella ricerca sul progetto {project.id}: {str(e)}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=FEDERATED_MAX_WORKERS) as executor:
+        per_project = list(executor.map(search, targets))
+
+    # ===== STEP 4: UNIONE PER PUNTEGGIO CALIBRATO =====
+    merged = sorted((doc for docs in per_project for doc in docs),
+                    key=lambda doc: (-doc.metadata['score'], doc.metadata['project_rank']))
+
+    logger.info(f"🌐 Ricerca federata: {len(targets)} progetti interrogati, {len(merged)} frammenti uniti")
+    return merged, {project.id: chain for project, chain, _ in targets}
+
+
+def get_answer_across_projects(user, question, projects=None):
+    """
+    Risponde a una domanda cercando in tutti i progetti dell'utente con una sola chiamata LLM.
+
+    La generazione usa la catena (prompt e motore) del progetto con il frammento più
+    rilevante; il contesto contiene i migliori frammenti di tutti i progetti entro il
+    budget di token di quella catena.
+
+    Args:
+        user: Utente proprietario dei progetti
+        question: Testo della domanda
+        projects: Queryset o lista di Project (opzionale, default: progetti attivi dell'utente)
+
+    La query viene registrata nell'utilizzo dell'abbonamento, attribuita al progetto
+    che genera la risposta.
+
+    Returns:
+        dict: Risposta, fonti (con progetto e punteggio) e statistiche per progetto
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import Project, record_rag_query_usage
+
+    start_time = time.time()
+
+    merged, chains = search_across_projects(user, question, projects)
+    if not merged:
+        return {
+            "answer": "Non ho trovato informazioni pertinenti alla tua domanda nei progetti disponibili.",
+            "sources": [],
+            "projects": [],
+            "processing_time": round(time.time() - start_time, 2)
+        }
+
+    # La catena del progetto più rilevante genera la risposta
+    lead_project_id = merged[0].metadata['project_id']
+    lead_chain = chains[lead_project_id]
+    chain_settings = lead_chain.metadata or {}
+    engine_settings = chain_settings.get('engine_settings') or {}
+    model_name = engine_settings.get('model') or "gpt-3.5-turbo"
+    context_budget = chain_settings.get('context_budget') or getattr(settings, 'RAG_MAX_CONTEXT_TOKENS', 6000)
+
+    context_docs = pack_context_documents(merged[:FEDERATED_TOP_K], context_budget, model_name)
+    output = lead_chain.combine_documents_chain.invoke({
+        'input_documents': context_docs,
+        'question': question,
+    })
+
+    # Statistiche per progetto: frammenti recuperati, inclusi nel contesto e miglior punteggio
+    project_stats = {}
+    for doc in merged:
+        stats = project_stats.setdefault(doc.metadata['project_id'], {
+            'id': doc.metadata['project_id'],
+            'name': doc.metadata['project_name'],
+            'best_score': doc.metadata['score'],
+            'retrieved': 0,
+            'used': 0,
+        })
+        stats['retrieved'] += 1
+    for doc in context_docs:
+        project_stats[doc.metadata['project_id']]['used'] += 1
+
+    sources = []
+    for doc in context_docs:
+        metadata = doc.metadata
+        if metadata.get('type') == 'note':
+            filename = f"Nota: {metadata.get('title', 'Senza titolo')}"
+        elif metadata.get('type') == 'url':
+            filename = f"URL: {metadata.get('title') or metadata.get('url', '')}"
+        else:
+            filename = metadata.get('filename') or metadata.get('source', 'Documento sconosciuto')
+        sources.append({
+            "content": doc.page_content,
+            "metadata": metadata,
+            "score": metadata['score'],
+            "type": metadata.get('type', 'file'),
+            "filename": filename,
+            "project_id": metadata['project_id'],
+            "project_name": metadata['project_name'],
+        })
+
+    answer = output.get('output_text', '')
+    processing_time = round(time.time() - start_time, 2)
+    record_rag_query_usage(Project.objects.select_related('user').get(id=lead_project_id),
+                           question, answer, processing_time)
+
+    return {
+        "answer": answer,
+        "sources": sources,
+        "projects": sorted(project_stats.values(), key=lambda stats: -stats['best_score']),
+        "engine": {
+            "type": engine_settings.get('type'),
+            "model": model_name
+        },
+        "processing_time": processing_time
+    }
@@ -0,0 +1,221 @@
+"""
+OCR locale per PDF scansionati e immagini.
+Questo modulo si occupa di:
+- Eseguire tesseract (pytesseract) in un pool di processi sulle pagine senza testo
+- Memorizzare i risultati per hash della pagina/immagine, così le ri-indicizzazioni non ripetono l'OCR
+- Valutare confidenza e densità del testo riconosciuto, per decidere se ricorrere alla Vision API
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Lingue passate a tesseract
+OCR_LANG = getattr(settings, 'RAG_OCR_LANG', 'ita+eng')
+
+# Risoluzione di rendering delle pagine PDF per l'OCR
+OCR_DPI = getattr(settings, 'RAG_OCR_DPI', 200)
+
+# Numero massimo di processi tesseract in parallelo
+OCR_MAX_WORKERS = getattr(settings, 'RAG_OCR_MAX_WORKERS', min(4, os.cpu_count() or 1))
+
+# Soglie sotto le quali il risultato OCR non è considerato affidabile
+OCR_MIN_CONFIDENCE = getattr(settings, 'RAG_OCR_MIN_CONFIDENCE', 60)
+OCR_MIN_TEXT_CHARS = getattr(settings, 'RAG_OCR_MIN_TEXT_CHARS', 30)
+
+# Versione della pipeline OCR (fa parte della chiave di cache)
+OCR_CACHE_VERSION = 1
+
+
+def get_ocr_cache_dir():
+    """
+    Restituisce la directory della cache dei risultati OCR.
+
+    Returns:
+        str: Percorso della directory
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'ocr_cache')
+
+
+def _cache_path(cache_dir, content_hash, lang):
+    """
+    Percorso del risultato OCR in cache per un contenuto e una combinazione di lingue.
+    """
+    return os.path.join(cache_dir, content_hash[:2], f"{content_hash}_{lang}_v{OCR_CACHE_VERSION}.json")
+
+
+def _run_tesseract(image_bytes, lang):
+    """
+    Esegue tesseract su un'immagine e calcola testo e confidenza media delle parole.
+
+    Usa una sola esecuzione (image_to_data) e ricostruisce le righe dal risultato.
+
+    Returns:
+        dict: {'text', 'confidence', 'chars'}
+    """
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+
+    lines = {}
+    confidences = []
+    for index, word in enumerate(data['text']):
+        word = word.strip()
+        if not word:
+            continue
+        key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+        lines.setdefault(key, []).append(word)
+        confidence = float(data['conf'][index])
+        if confidence >= 0:
+            confidences.append(confidence)
+
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    return {
+        'text': text,
+        'confidence': round(sum(confidences) / len(confidences), 1) if confidences else 0.0,
+        'chars': sum(1 for char in text if char.isalnum()),
+    }
+
+
+def _ocr_with_cache(image_bytes, lang, cache_dir):
+    """
+    Esegue l'OCR di un'immagine riusando il risultato in cache per lo stesso contenuto.
+
+    Returns:
+        dict: Risultato OCR, o None se tesseract non è disponibile o fallisce
+    """
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+    cache_path = _cache_path(cache_dir, content_hash, lang)
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            pass
+
+    try:
+        result = _run_tesseract(image_bytes, lang)
+    except Exception as e:
+        logger.warning(f"OCR locale non disponibile: {str(e)}")
+        return None
+
+    result['hash'] = content_hash
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.debug(f"Impossibile salvare il risultato OCR in cache: {str(e)}")
+    return result
+
+
+def render_pdf_page(file_path, page_number, dpi=None, skip_blank=False):
+    """
+    Renderizza una pagina PDF come immagine PNG.
+
+    Args:
+        file_path: Percorso del PDF
+        page_number: Numero di pagina (da 0)
+        dpi: Risoluzione (opzionale, default RAG_OCR_DPI)
+        skip_blank: Se True, restituisce None per le pagine di un solo colore (pagine vuote)
+
+    Returns:
+        bytes: Immagine PNG della pagina, o None se la pagina è vuota e skip_blank è True
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as pdf:
+        pixmap = pdf.load_page(page_number).get_pixmap(dpi=dpi or OCR_DPI)
+        if skip_blank and pixmap.is_unicolor:
+            return None
+        return pixmap.tobytes("png")
+
+
+def _ocr_pdf_page(file_path, page_number, dpi, lang, cache_dir):
+    """
+    Renderizza ed esegue l'OCR di una pagina PDF (eseguita nei processi worker).
+
+    Le pagine vuote (di un solo colore) non vengono passate a tesseract: il risultato
+    ha testo vuoto e 'blank' a True, così non vengono inviate alla Vision API.
+
+    Returns:
+        tuple: (numero pagina, risultato OCR o None)
+    """
+    try:
+        image_bytes = render_pdf_page(file_path, page_number, dpi, skip_blank=True)
+    except Exception as e:
+        logger.warning(f"Rendering della pagina {page_number} di {file_path} non riuscito: {str(e)}")
+        return page_number, None
+    if image_bytes is None:
+        return page_number, {'text': '', 'confidence': 0.0, 'chars': 0, 'blank': True}
+    return page_number, _ocr_with_cache(image_bytes, lang, cache_dir)
+
+
+def ocr_pdf_pages(file_path, page_numbers, max_workers=None):
+    """
+    Esegue l'OCR di un insieme di pagine PDF in un pool di processi.
+
+    Args:
+        file_path: Percorso del PDF
+        page_numbers: Numeri delle pagine da elaborare (da 0)
+        max_workers: Numero massimo di processi (opzionale)
+
+    Returns:
+        dict: {numero pagina: risultato OCR o None}
+    """
+    if not page_numbers:
+        return {}
+
+    cache_dir = get_ocr_cache_dir()
+    args = [(file_path, page_number, OCR_DPI, OCR_LANG, cache_dir) for page_number in page_numbers]
+    workers = min(max_workers or OCR_MAX_WORKERS, len(page_numbers))
+
+    logger.info(f"🔤 OCR locale di {len(page_numbers)} pagine di {os.path.basename(file_path)} "
+                f"con {workers} processi")
+
+    if workers <= 1:
+        return dict(_ocr_pdf_page(*arg) for arg in args)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(executor.map(_ocr_pdf_page, *zip(*args)))
+
+
+def ocr_image_file(image_path):
+    """
+    Esegue l'OCR di un file immagine (con cache per contenuto).
+
+    Args:
+        image_path: Percorso dell'immagine
+
+    Returns:
+        dict: Risultato OCR {'text', 'confidence', 'chars', 'hash'}, o None se non disponibile
+    """
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    return _ocr_with_cache(image_bytes, OCR_LANG, get_ocr_cache_dir())
+
+
+def is_ocr_result_reliable(result):
+    """
+    Verifica che un risultato OCR abbia confidenza e quantità di testo sufficienti.
+
+    Args:
+        result: Risultato OCR (o None)
+
+    Returns:
+        bool: True se il testo può essere usato senza ricorrere alla Vision API
+    """
+    return bool(result) and result['confidence'] >= OCR_MIN_CONFIDENCE and result['chars'] >= OCR_MIN_TEXT_CHARS
@@ -0,0 +1,201 @@
+"""
+Estrazione nativa del testo dai documenti Office (DOCX e PPTX).
+Questo modulo si occupa di:
+- Leggere paragrafi e tabelle dei documenti Word nell'ordine del documento con python-docx,
+  raggruppandoli per sezione (titolo) con i metadati di struttura
+- Leggere il testo delle slide (titolo, caselle di testo, tabelle, gruppi, note) con python-pptx
+- Restituire le sezioni/slide in modo incrementale; i formati legacy (.doc, .ppt) restano
+  a carico dei loader Unstructured, usati come fallback
+"""
+
+import logging
+import os
+
+from langchain.schema import Document
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Dimensione massima (in caratteri) di una sezione DOCX prima di iniziarne una nuova
+DOCX_MAX_SECTION_CHARS = 4000
+
+# Prefissi dei nomi di stile che identificano un titolo (inglese e italiano)
+HEADING_STYLE_PREFIXES = ('heading', 'titolo', 'title')
+
+
+def _table_rows_text(rows):
+    """
+    Converte le righe di una tabella in testo, una riga per linea con celle separate da ' | '.
+
+    Le celle unite vengono restituite più volte da python-docx (stesso elemento <w:tc>) e
+    come celle "coperte" da python-pptx: ogni cella fisica viene inclusa una sola volta,
+    mentre celle distinte con lo stesso valore restano entrambe.
+
+    Args:
+        rows: Iterabile di righe, ciascuna un iterabile di celle python-docx o python-pptx
+    """
+    lines = []
+    for cells in rows:
+        values = []
+        seen = set()
+        for cell in cells:
+            if cell._tc in seen or getattr(cell, 'is_spanned', False):
+                continue
+            seen.add(cell._tc)
+            values.append(" ".join(cell.text.split()))
+        if any(values):
+            lines.append(" | ".join(values))
+    return "\n".join(lines)
+
+
+def _heading_level(paragraph):
+    """
+    Restituisce il livello di titolo di un paragrafo DOCX, o None se non è un titolo.
+    """
+    style_name = (paragraph.style.name if paragraph.style is not None else '') or ''
+    lowered = style_name.lower()
+    if not lowered.startswith(HEADING_STYLE_PREFIXES):
+        return None
+    digits = ''.join(char for char in lowered if char.isdigit())
+    return int(digits) if digits else 1
+
+
+def iter_docx_sections(file_path):
+    """
+    Restituisce le sezioni di un documento Word, delimitate dai titoli.
+
+    Args:
+        file_path: Percorso del file DOCX
+
+    Yields:
+        Document: Testo di una sezione con metadati 'section', 'heading_level',
+            'section_index' e 'has_table'
+    """
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(file_path)
+    body = document.element.body
+
+    section_index = 0
+    heading, level = None, None
+    parts, size, has_table = [], 0, False
+
+    def build_section():
+        return Document(page_content="\n".join(parts), metadata={
+            'source': file_path,
+            'section': heading or '',
+            'heading_level': level,
+            'section_index': section_index,
+            'has_table': has_table,
+        })
+
+    for child in body.iterchildren():
+        tag = child.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            paragraph = Paragraph(child, document)
+            text = paragraph.text.strip()
+            if not text:
+                continue
+            paragraph_level = _heading_level(paragraph)
+            if paragraph_level is not None or size > DOCX_MAX_SECTION_CHARS:
+                if parts:
+                    yield build_section()
+                    section_index += 1
+                parts, size, has_table = [], 0, False
+                if paragraph_level is not None:
+                    heading, level = text, paragraph_level
+            parts.append(text)
+            size += len(text)
+        elif tag == 'tbl':
+            table = Table(child, document)
+            text = _table_rows_text(row.cells for row in table.rows)
+            if text:
+                parts.append(text)
+                size += len(text)
+                has_table = True
+
+    if parts:
+        yield build_section()
+
+
+def _shape_texts(shapes):
+    """
+    Estrae ricorsivamente il testo delle forme di una slide (caselle, tabelle, gruppi).
+    """
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+    texts = []
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            texts.extend(_shape_texts(shape.shapes))
+        elif getattr(shape, 'has_table', False) and shape.has_table:
+            text = _table_rows_text(row.cells for row in shape.table.rows)
+            if text:
+                texts.append(text)
+        elif getattr(shape, 'has_text_frame', False) and shape.has_text_frame:
+            text = "\n".join(paragraph.text.strip() for paragraph in shape.text_frame.paragraphs
+                             if paragraph.text.strip())
+            if text:
+                texts.append(text)
+    return texts
+
+
+def iter_pptx_slides(file_path):
+    """
+    Restituisce il testo di una presentazione, una slide alla volta.
+
+    Args:
+        file_path: Percorso del file PPTX
+
+    Yields:
+        Document: Testo della slide (note incluse) con metadati 'page', 'slide_number',
+            'slide_title' e 'total_pages'
+    """
+    from pptx import Presentation
+
+    presentation = Presentation(file_path)
+    total_slides = len(presentation.slides)
+
+    for index, slide in enumerate(presentation.slides):
+        title_shape = slide.shapes.title
+        title = title_shape.text.strip() if title_shape is not None and title_shape.has_text_frame else ''
+
+        texts = _shape_texts(slide.shapes)
+        if slide.has_notes_slide:
+            notes = slide.notes_slide.notes_text_frame.text.strip() if slide.notes_slide.notes_text_frame else ''
+            if notes:
+                texts.append(f"Note: {notes}")
+        if not texts:
+            continue
+
+        yield Document(page_content="\n".join(texts), metadata={
+            'source': file_path,
+            'page': index,
+            'slide_number': index + 1,
+            'slide_title': title,
+            'total_pages': total_slides,
+        })
+
+
+def load_office_documents(file_path):
+    """
+    Carica un documento DOCX o PPTX con gli estrattori nativi.
+
+    Args:
+        file_path: Percorso del file
+
+    Returns:
+        list: Lista di Document, vuota se il formato non è supportato nativamente
+            (es. .doc/.ppt) o se l'estrazione non produce testo
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension == '.docx':
+            return list(iter_docx_sections(file_path))
+        if extension == '.pptx':
+            return list(iter_pptx_slides(file_path))
+    except Exception as e:
+        logger.warning(f"Estrazione nativa non riuscita per {os.path.basename(file_path)}: {str(e)}")
+    return []
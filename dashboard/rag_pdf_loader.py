@@ -0,0 +1,180 @@
+"""
+Estrazione del testo dai PDF pagina per pagina.
+Questo modulo si occupa di:
+- Restituire le pagine in modo incrementale (generatore), senza materializzare l'intero PDF
+- Suddividere i PDF di grandi dimensioni in intervalli di pagine elaborati da processi separati
+- Applicare il fallback (PyPDF2) alla singola pagina senza testo invece che all'intero file
+- Limitare la memoria dei processi worker indipendentemente dalla dimensione del PDF
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from langchain.schema import Document
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Numero minimo di pagine oltre il quale l'estrazione viene distribuita su più processi
+PDF_PARALLEL_MIN_PAGES = getattr(settings, 'RAG_PDF_PARALLEL_MIN_PAGES', 40)
+
+# Numero di pagine elaborate da ogni processo per volta
+PDF_PAGES_PER_WORKER = getattr(settings, 'RAG_PDF_PAGES_PER_WORKER', 20)
+
+# Numero massimo di processi per l'estrazione
+PDF_MAX_WORKERS = getattr(settings, 'RAG_PDF_MAX_WORKERS', min(4, os.cpu_count() or 1))
+
+# Metadati del documento copiati su ogni pagina (come PyMuPDFLoader)
+PDF_METADATA_KEYS = ('format', 'title', 'author', 'subject', 'keywords', 'creator', 'producer',
+                     'creationDate', 'modDate', 'trapped')
+
+
+def _fallback_page_text(file_path, page_number, reader_cache):
+    """
+    Estrae il testo di una singola pagina con PyPDF2 (usato quando PyMuPDF non restituisce testo).
+
+    Args:
+        file_path: Percorso del PDF
+        page_number: Numero di pagina (da 0)
+        reader_cache: Dizionario per riusare il lettore PyPDF2 tra pagine dello stesso intervallo
+
+    Returns:
+        str: Testo della pagina, vuoto se non estraibile
+    """
+    try:
+        if 'reader' not in reader_cache:
+            from PyPDF2 import PdfReader
+            reader_cache['reader'] = PdfReader(file_path)
+        return reader_cache['reader'].pages[page_number].extract_text() or ""
+    except Exception as e:
+        logger.debug(f"Fallback PyPDF2 non riuscito per la pagina {page_number} di {file_path}: {str(e)}")
+        return ""
+
+
+def _extract_page_range(file_path, start, end):
+    """
+    Estrae il testo delle pagine [start, end) di un PDF.
+
+    Eseguita anche nei processi worker: apre il file autonomamente e restituisce solo
+    testo e flag di fallback, così i dati trasferiti tra processi restano piccoli.
+
+    Returns:
+        list: Tuple (numero pagina, testo, fallback usato)
+    """
+    import fitz  # PyMuPDF
+
+    pages = []
+    reader_cache = {}
+    with fitz.open(file_path) as pdf:
+        for page_number in range(start, min(end, pdf.page_count)):
+            try:
+                text = pdf.load_page(page_number).get_text()
+            except Exception as e:
+                logger.warning(f"Errore PyMuPDF sulla pagina {page_number} di {file_path}: {str(e)}")
+                text = ""
+
+            used_fallback = False
+            if not text.strip():
+                fallback_text = _fallback_page_text(file_path, page_number, reader_cache)
+                if fallback_text.strip():
+                    text, used_fallback = fallback_text, True
+
+            pages.append((page_number, text, used_fallback))
+    return pages
+
+
+def _page_document(file_path, page_number, text, used_fallback, base_metadata):
+    """
+    Costruisce il Document di una pagina con metadati compatibili con PyMuPDFLoader.
+    """
+    metadata = {**base_metadata, 'page': page_number}
+    if used_fallback:
+        metadata['extraction'] = 'pypdf2'
+    return Document(page_content=text, metadata=metadata)
+
+
+def iter_pdf_pages(file_path, max_workers=None):
+    """
+    Restituisce le pagine di un PDF una alla volta, nell'ordine del documento.
+
+    I PDF con almeno PDF_PARALLEL_MIN_PAGES pagine vengono suddivisi in intervalli
+    elaborati da un pool di processi; al più due intervalli per processo sono in
+    elaborazione contemporaneamente, quindi la memoria occupata non dipende dal
+    numero totale di pagine. Le pagine senza testo vengono ritentate singolarmente
+    con PyPDF2.
+
+    Args:
+        file_path: Percorso del PDF
+        max_workers: Numero massimo di processi (opzionale)
+
+    Yields:
+        Document: Una pagina con metadati 'source', 'file_path', 'page', 'total_pages'
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as pdf:
+        total_pages = pdf.page_count
+        pdf_metadata = pdf.metadata or {}
+
+    base_metadata = {'source': file_path, 'file_path': file_path, 'total_pages': total_pages}
+    base_metadata.update({key: pdf_metadata.get(key, '') for key in PDF_METADATA_KEYS})
+
+    workers = max_workers or PDF_MAX_WORKERS
+    ranges = [(start, start + PDF_PAGES_PER_WORKER) for start in range(0, total_pages, PDF_PAGES_PER_WORKER)]
+
+    if total_pages < PDF_PARALLEL_MIN_PAGES or workers <= 1 or len(ranges) == 1:
+        for start, end in ranges:
+            for page_number, text, used_fallback in _extract_page_range(file_path, start, end):
+                yield _page_document(file_path, page_number, text, used_fallback, base_metadata)
+        return
+
+    logger.info(f"Estrazione parallela di {total_pages} pagine da {os.path.basename(file_path)} "
+                f"con {workers} processi")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        next_range = 0
+        # Finestra scorrevole: al più 2 intervalli per processo in volo, restituiti in ordine
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                start, end = ranges[next_range]
+                pending.append(executor.submit(_extract_page_range, file_path, start, end))
+                next_range += 1
+
+            for page_number, text, used_fallback in pending.pop(0).result():
+                yield _page_document(file_path, page_number, text, used_fallback, base_metadata)
+
+
+def load_pdf_documents(file_path, max_workers=None):
+    """
+    Carica un PDF come lista di Document (una per pagina con testo).
+
+    La lista contiene il testo di tutte le pagine: è limitata solo la memoria dei processi
+    worker e del PDF aperto, non quella del testo estratto. Chi può elaborare le pagine
+    una alla volta (es. extract_text_from_pdf) deve usare direttamente iter_pdf_pages.
+
+    Args:
+        file_path: Percorso del PDF
+        max_workers: Numero massimo di processi (opzionale)
+
+    Returns:
+        list: Lista di Document
+    """
+    documents = []
+    empty_pages = 0
+    fallback_pages = 0
+
+    for doc in iter_pdf_pages(file_path, max_workers):
+        if not doc.page_content.strip():
+            empty_pages += 1
+            continue
+        if doc.metadata.get('extraction'):
+            fallback_pages += 1
+        documents.append(doc)
+
+    if empty_pages or fallback_pages:
+        logger.info(f"PDF {os.path.basename(file_path)}: {fallback_pages} pagine estratte con fallback, "
+                    f"{empty_pages} pagine senza testo")
+    return documents
@@ -0,0 +1,249 @@
+"""
+Anteprime delle pagine dei documenti (PDF e immagini).
+Questo modulo si occupa di:
+- Renderizzare le anteprime direttamente alla dimensione finale e salvarle in formato WebP
+- Indicizzare la cache per hash del contenuto, così un file modificato non mostra anteprime obsolete
+  e lo stesso documento in più progetti condivide le anteprime
+- Generare le anteprime in background al caricamento dei file, fuori dal ciclo della richiesta
+- Limitare la dimensione della cache eliminando le anteprime usate meno di recente (LRU)
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Dimensione massima delle anteprime (larghezza, altezza)
+PREVIEW_MAX_SIZE = (800, 800)
+PREVIEW_WEBP_QUALITY = 80
+
+# Pagine dei PDF renderizzate in background al caricamento
+PREVIEW_PAGES_AT_UPLOAD = getattr(settings, 'RAG_PREVIEW_PAGES_AT_UPLOAD', 3)
+
+# Thread dedicati alla generazione delle anteprime
+PREVIEW_MAX_WORKERS = getattr(settings, 'RAG_PREVIEW_MAX_WORKERS', 2)
+
+# Dimensione massima della cache delle anteprime
+PREVIEW_CACHE_MAX_BYTES = getattr(settings, 'RAG_PREVIEW_CACHE_MAX_MB', 500) * 1024 * 1024
+
+# Intervallo minimo tra due controlli della dimensione della cache
+PREVIEW_CACHE_CHECK_INTERVAL = 60
+
+PREVIEW_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_cache_check = 0.0
+
+
+def get_preview_cache_dir():
+    """
+    Restituisce la directory della cache delle anteprime.
+
+    Returns:
+        str: Percorso della directory
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'document_images')
+
+
+def get_preview_path(file_hash, page_number=0, max_size=PREVIEW_MAX_SIZE):
+    """
+    Restituisce il percorso dell'anteprima di una pagina per hash del contenuto.
+
+    Args:
+        file_hash: Hash SHA-256 del file
+        page_number: Numero di pagina (da 0)
+        max_size: Dimensione massima (larghezza, altezza)
+
+    Returns:
+        str: Percorso del file WebP
+    """
+    return os.path.join(get_preview_cache_dir(), file_hash[:2],
+                        f"{file_hash}_{page_number}_{max_size[0]}x{max_size[1]}.webp")
+
+
+def _render_pdf_page(file_path, page_number, max_size):
+    """
+    Renderizza una pagina PDF alla scala necessaria per rientrare in max_size.
+
+    Returns:
+        PIL.Image: Immagine della pagina, o None se la pagina non esiste
+    """
+    import fitz  # PyMuPDF
+    from PIL import Image
+
+    with fitz.open(file_path) as pdf:
+        if page_number < 0 or page_number >= pdf.page_count:
+            return None
+        page = pdf.load_page(page_number)
+        # Rendering diretto alla dimensione finale, senza passare da un'immagine più grande
+        zoom = min(max_size[0] / page.rect.width, max_size[1] / page.rect.height)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def render_page_preview(file_path, file_hash, page_number=0, max_size=PREVIEW_MAX_SIZE):
+    """
+    Restituisce l'anteprima di una pagina, generandola se non è in cache.
+
+    Args:
+        file_path: Percorso del file (PDF o immagine)
+        file_hash: Hash SHA-256 del file
+        page_number: Numero di pagina (da 0, ignorato per le immagini)
+        max_size: Dimensione massima (larghezza, altezza)
+
+    Returns:
+        str: Percorso dell'anteprima WebP, o None se non disponibile
+    """
+    from PIL import Image
+
+    preview_path = get_preview_path(file_hash, page_number, max_size)
+    if os.path.exists(preview_path):
+        try:
+            # Aggiorna la data di modifica: è il criterio di utilizzo per l'eliminazione LRU
+            os.utime(preview_path)
+        except OSError:
+            pass
+        return preview_path
+
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension == '.pdf':
+            image = _render_pdf_page(file_path, page_number, max_size)
+            if image is None:
+                return None
+        elif extension in PREVIEW_IMAGE_EXTENSIONS:
+            if page_number != 0:
+                return None
+            with Image.open(file_path) as source:
+                source.draft('RGB', max_size)
+                image = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+            image.thumbnail(max_size)
+        else:
+            return None
+
+        os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+        tmp_path = f"{preview_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format='WEBP', quality=PREVIEW_WEBP_QUALITY, method=4)
+        os.replace(tmp_path, preview_path)
+        return preview_path
+    except Exception as e:
+        logger.warning(f"Errore nella generazione dell'anteprima di {os.path.basename(file_path)} "
+                       f"(pagina {page_number}): {str(e)}")
+        return None
+
+
+def enforce_preview_cache_limit(max_bytes=None):
+    """
+    Elimina le anteprime usate meno di recente finché la cache non rientra nel limite.
+
+    Args:
+        max_bytes: Dimensione massima della cache (opzionale)
+
+    Returns:
+        int: Numero di anteprime eliminate
+    """
+    max_bytes = max_bytes or PREVIEW_CACHE_MAX_BYTES
+    cache_dir = get_preview_cache_dir()
+    if not os.path.exists(cache_dir):
+        return 0
+
+    entries = []
+    total_size = 0
+    for root, _, files in os.walk(cache_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+    if total_size <= max_bytes:
+        return 0
+
+    # Scende al 90% del limite per non ripetere l'eliminazione a ogni nuova anteprima
+    target_size = int(max_bytes * 0.9)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total_size <= target_size:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+            removed += 1
+        except OSError:
+            continue
+
+    logger.info(f"🧹 Cache anteprime: eliminate {removed} anteprime meno recenti "
+                f"({total_size // (1024 * 1024)} MB residui)")
+    return removed
+
+
+def _maybe_enforce_cache_limit():
+    """
+    Controlla la dimensione della cache al più una volta ogni PREVIEW_CACHE_CHECK_INTERVAL secondi.
+    """
+    global _last_cache_check
+    now = time.monotonic()
+    if now - _last_cache_check < PREVIEW_CACHE_CHECK_INTERVAL:
+        return
+    _last_cache_check = now
+    enforce_preview_cache_limit()
+
+
+def _generate_previews(file_path, file_hash, page_numbers):
+    """
+    Genera le anteprime di più pagine (eseguita dal pool in background).
+    """
+    for page_number in page_numbers:
+        if render_page_preview(file_path, file_hash, page_number) is None:
+            break
+    _maybe_enforce_cache_limit()
+
+
+def _get_executor():
+    """
+    Restituisce il pool di thread condiviso per la generazione delle anteprime.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREVIEW_MAX_WORKERS, thread_name_prefix='preview')
+        return _executor
+
+
+def schedule_file_previews(file_path, file_hash, pages=None):
+    """
+    Pianifica in background la generazione delle anteprime di un file appena caricato.
+
+    Args:
+        file_path: Percorso del file
+        file_hash: Hash SHA-256 del file
+        pages: Numero di pagine PDF da renderizzare (opzionale, default RAG_PREVIEW_PAGES_AT_UPLOAD)
+
+    Returns:
+        bool: True se la generazione è stata pianificata
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.pdf':
+        page_numbers = range(pages or PREVIEW_PAGES_AT_UPLOAD)
+    elif extension in PREVIEW_IMAGE_EXTENSIONS:
+        page_numbers = [0]
+    else:
+        return False
+
+    try:
+        _get_executor().submit(_generate_previews, file_path, file_hash, list(page_numbers))
+        return True
+    except RuntimeError as e:
+        # Pool già chiuso (es. arresto del processo)
+        logger.debug(f"Anteprime non pianificate per {os.path.basename(file_path)}: {str(e)}")
+        return False
@@ -0,0 +1,172 @@
+"""
+Monitoraggio delle directory dei progetti per la scansione incrementale dei documenti.
+Questo modulo si occupa di:
+- Ricevere gli eventi del filesystem (inotify su Linux, tramite watchdog) sotto MEDIA_ROOT/projects
+- Raggruppare i percorsi modificati per progetto, attendendo che gli eventi si stabilizzino
+- Eseguire scan_project_directory solo sui percorsi coinvolti, invece che sull'intera directory
+"""
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Secondi senza nuovi eventi prima di elaborare le modifiche di un progetto
+WATCH_DEBOUNCE_SECONDS = getattr(settings, 'RAG_WATCH_DEBOUNCE_SECONDS', 2.0)
+
+
+def get_projects_root():
+    """
+    Restituisce la directory che contiene le directory di tutti i progetti.
+
+    Returns:
+        str: Percorso della directory
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'projects')
+
+
+def _project_id_from_path(projects_root, path):
+    """
+    Ricava l'ID del progetto da un percorso del tipo <projects_root>/<utente>/<progetto>/...
+
+    Returns:
+        int: ID del progetto, o None se il percorso non appartiene a un progetto
+    """
+    parts = os.path.relpath(path, projects_root).split(os.sep)
+    if len(parts) < 3 or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+class ProjectChangeCollector:
+    """
+    Accumula i percorsi modificati per progetto in attesa della scansione incrementale.
+    """
+
+    def __init__(self, projects_root):
+        self.projects_root = projects_root
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_event_at = {}
+
+    def add(self, *paths):
+        """
+        Registra uno o più percorsi modificati (creati, modificati, spostati o eliminati).
+        """
+        now = time.monotonic()
+        with self._lock:
+            for path in paths:
+                if not path:
+                    continue
+                project_id = _project_id_from_path(self.projects_root, path)
+                if project_id is None:
+                    continue
+                self._pending.setdefault(project_id, set()).add(path)
+                self._last_event_at[project_id] = now
+
+    def pop_ready(self, debounce_seconds):
+        """
+        Restituisce e rimuove i progetti senza nuovi eventi da almeno debounce_seconds.
+
+        Returns:
+            dict: {ID progetto: insieme dei percorsi modificati}
+        """
+        now = time.monotonic()
+        ready = {}
+        with self._lock:
+            for project_id in list(self._pending):
+                if now - self._last_event_at[project_id] >= debounce_seconds:
+                    ready[project_id] = self._pending.pop(project_id)
+                    del self._last_event_at[project_id]
+        return ready
+
+
+def process_project_changes(changes):
+    """
+    Esegue la scansione incrementale dei progetti con percorsi modificati.
+
+    Args:
+        changes: {ID progetto: insieme dei percorsi modificati}
+
+    Returns:
+        dict: {ID progetto: (nuovi, modificati, eliminati)}
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import Project
+    from dashboard.rag_document_utils import scan_project_directory
+
+    results = {}
+    projects = Project.objects.select_related('user').in_bulk(list(changes))
+    for project_id, paths in changes.items():
+        project = projects.get(project_id)
+        if project is None:
+            continue
+        try:
+            added_docs, modified_docs, deleted_paths = scan_project_directory(project, paths=paths)
+            results[project_id] = (len(added_docs), len(modified_docs), len(deleted_paths))
+        except Exception as e:
+            logger.error(f"Errore nella scansione incrementale del progetto {project_id}: {str(e)}")
+    return results
+
+
+def watch_project_directories(debounce_seconds=None, stop_event=None):
+    """
+    Monitora le directory dei progetti ed esegue la scansione incrementale dei percorsi modificati.
+
+    Richiede il pacchetto opzionale `watchdog`. La funzione resta in esecuzione finché
+    stop_event non viene impostato (o fino a KeyboardInterrupt).
+
+    Args:
+        debounce_seconds: Attesa dopo l'ultimo evento di un progetto (opzionale)
+        stop_event: threading.Event per interrompere il monitoraggio (opzionale)
+
+    Raises:
+        ImportError: Se watchdog non è installato
+    """
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    debounce_seconds = WATCH_DEBOUNCE_SECONDS if debounce_seconds is None else debounce_seconds
+    stop_event = stop_event or threading.Event()
+    projects_root = get_projects_root()
+    os.makedirs(projects_root, exist_ok=True)
+
+    collector = ProjectChangeCollector(projects_root)
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            collector.add(event.src_path, getattr(event, 'dest_path', None))
+
+    observer = Observer()
+    observer.schedule(_Handler(), projects_root, recursive=True)
+    observer.start()
+    logger.info(f"👀 Monitoraggio delle directory dei progetti avviato: {projects_root}")
+
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(min(1.0, debounce_seconds or 1.0))
+            ready = collector.pop_ready(debounce_seconds)
+            if not ready:
+                continue
+            try:
+                for project_id, counts in process_project_changes(ready).items():
+                    if any(counts):
+                        logger.info(f"🔄 Progetto {project_id}: {counts[0]} nuovi, {counts[1]} modificati, "
+                                    f"{counts[2]} eliminati")
+            finally:
+                # Il ciclo può durare a lungo: evita connessioni al database scadute
+                connections.close_all()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        logger.info("Monitoraggio delle directory dei progetti terminato")
@@ -0,0 +1,292 @@
+"""
+Pianificazione delle query RAG.
+Questo modulo si occupa di:
+- Classificare la domanda (generica, su URL, su note o standard) con matcher multilingua precompilati
+  o, opzionalmente, con un classificatore basato su embedding
+- Produrre un piano di recupero concreto (filtri, k, fetch_k, budget di contesto, tipo di catena)
+  che il livello di retrieval esegue direttamente
+
+Il piano è un dizionario con le chiavi:
+    question_type, classifier, search_query, generation_question, search_type, k, fetch_k,
+    lambda_mult, score_threshold, filter, context_budget, chain_type
+"""
+
+import logging
+import re
+
+from django.conf import settings
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Tipi di domanda riconosciuti dal planner
+QUESTION_TYPE_DEFAULT = 'default'
+QUESTION_TYPE_GENERIC = 'generic'
+QUESTION_TYPE_URL = 'url'
+QUESTION_TYPE_NOTE = 'note'
+
+# Tipi di catena di generazione
+CHAIN_TYPE_STUFF = 'stuff'
+CHAIN_TYPE_SUMMARIES = 'map_reduce_summaries'
+
+
+def _compile_terms(terms):
+    """
+    Compila una lista di termini in un'unica espressione regolare con confini di parola.
+
+    I termini più lunghi vengono provati per primi, così 'note personali' prevale su 'note'.
+    """
+    alternatives = '|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    return re.compile(rf'(?<!\w)(?:{alternatives})(?!\w)', re.IGNORECASE)
+
+
+# Matcher per tipo di domanda, valutati in ordine di priorità
+QUESTION_MATCHERS = [
+    (QUESTION_TYPE_GENERIC, _compile_terms([
+        'tutti i documenti', 'ogni documento', 'riassumi tutti', 'riassumi i punti principali di tutti',
+        'riassumere tutti', 'tutti i file', 'tutti gli url', 'tutte le pagine web', 'tutte le pagine',
+        'tutti i siti', 'all documents', 'every document', 'each document', 'summarize all',
+        'summarize everything', 'all websites', 'all urls', 'all pages',
+    ])),
+    (QUESTION_TYPE_URL, _compile_terms([
+        'url', 'sito web', 'pagina web', 'website', 'web page', 'link', 'http', 'https', 'www',
+        'siti internet', 'web', 'navigato', 'navigati', 'crawlati', 'esplorati',
+    ])),
+    (QUESTION_TYPE_NOTE, _compile_terms([
+        'nota', 'note', 'appunti', 'note personali', 'annotazioni', 'memo', 'promemoria',
+        'testo', 'testi', 'contenuto personale', 'notes',
+    ])),
+]
+
+# Riferimenti espliciti a una sola tipologia di fonte: abilitano il filtro sui metadati
+SOURCE_FILTER_MATCHERS = {
+    QUESTION_TYPE_URL: _compile_terms([
+        'negli url', 'nei siti', 'nel sito', 'sul sito', 'sito web', 'pagine web', 'pagina web',
+        'pagine crawlate', 'siti crawlati', 'on the website', 'web pages', 'in the urls',
+    ]),
+    QUESTION_TYPE_NOTE: _compile_terms([
+        'nelle note', 'nella nota', 'nelle mie note', 'negli appunti', 'nei miei appunti',
+        'nelle annotazioni', 'in my notes', 'in the notes', 'in the note',
+    ]),
+}
+
+# Frasi di esempio per il classificatore basato su embedding
+EMBEDDING_PROTOTYPES = {
+    QUESTION_TYPE_GENERIC: [
+        "Riassumi tutti i documenti del progetto",
+        "Quali sono i punti principali di ogni documento?",
+        "Summarize all the documents",
+    ],
+    QUESTION_TYPE_URL: [
+        "Cosa dice il sito web su questo argomento?",
+        "Quali informazioni ci sono nelle pagine web analizzate?",
+        "What does the website say about this?",
+    ],
+    QUESTION_TYPE_NOTE: [
+        "Cosa ho scritto nelle mie note?",
+        "Riassumi i miei appunti",
+        "What did I write in my notes?",
+    ],
+}
+
+# Parametri di recupero per tipo di domanda (il tipo standard deriva dalla configurazione RAG).
+# Il budget di contesto resta quello calcolato dalla finestra del modello: le domande generiche
+# ottengono più copertura da k e dalla diversità MMR, non da un contesto più ampio.
+PLAN_PROFILES = {
+    QUESTION_TYPE_GENERIC: {'search_type': 'mmr', 'k': 20, 'lambda_mult': 0.1, 'score_threshold': 0.6},
+    QUESTION_TYPE_URL: {'search_type': 'mmr', 'k': 12, 'lambda_mult': 0.3, 'score_threshold': 0.5},
+    QUESTION_TYPE_NOTE: {'search_type': 'mmr', 'k': 8, 'lambda_mult': 0.4, 'score_threshold': 0.5},
+}
+
+# Istruzioni aggiunte alla domanda inviata al modello (non alla query di ricerca)
+GENERATION_INSTRUCTIONS = {
+    QUESTION_TYPE_GENERIC: """
+IMPORTANTE: Per favore assicurati di:
+1. Identificare TUTTI i documenti disponibili nel contesto (file, note e URL)
+2. Riassumere i punti principali di CIASCUNA fonte
+3. Citare esplicitamente il nome/URL di ogni fonte quando presenti le sue informazioni
+4. Organizzare la risposta per fonte, non per argomento
+""",
+    QUESTION_TYPE_URL: """
+IMPORTANTE: Questa domanda riguarda contenuti web/URL. Per favore:
+1. Presta particolare attenzione alle fonti di tipo URL nel contesto
+2. Quando citi informazioni da URL, indica esplicitamente il link della fonte
+3. Se la domanda si riferisce a un URL specifico, concentrati principalmente su quello
+""",
+    QUESTION_TYPE_NOTE: """
+IMPORTANTE: Questa domanda riguarda le note del progetto. Per favore:
+1. Presta particolare attenzione alle fonti di tipo "nota" nel contesto
+2. Quando citi informazioni da una nota, indica esplicitamente il titolo della nota
+3. Se la domanda si riferisce a una nota specifica, concentrati principalmente su quella
+""",
+    QUESTION_TYPE_DEFAULT: """
+Cerca le informazioni più rilevanti nel contesto fornito.
+Se trovi informazioni nelle note o negli URL inclusi nel contesto, includili nella risposta.
+""",
+}
+
+# Vettori dei prototipi già calcolati, per modello di embedding
+_prototype_vectors = {}
+
+
+def keyword_classify(question):
+    """
+    Classifica la domanda con i matcher precompilati.
+
+    Args:
+        question: Testo della domanda
+
+    Returns:
+        str: Tipo di domanda
+    """
+    for question_type, matcher in QUESTION_MATCHERS:
+        if matcher.search(question):
+            return question_type
+    return QUESTION_TYPE_DEFAULT
+
+
+def embedding_classify(question, embeddings):
+    """
+    Classifica la domanda confrontandone l'embedding con quello delle frasi prototipo.
+
+    Se nessun prototipo supera la soglia RAG_QUERY_CLASSIFIER_THRESHOLD, o in caso di
+    errore, ricade sul classificatore a parole chiave.
+
+    Args:
+        question: Testo della domanda
+        embeddings: Oggetto Embeddings di LangChain (lo stesso dell'indice del progetto)
+
+    Returns:
+        str: Tipo di domanda
+    """
+    import numpy as np
+
+    try:
+        model_key = getattr(embeddings, 'model', None) or type(embeddings).__name__
+        if model_key not in _prototype_vectors:
+            labels, texts = [], []
+            for question_type, examples in EMBEDDING_PROTOTYPES.items():
+                labels.extend([question_type] * len(examples))
+                texts.extend(examples)
+            vectors = np.array(embeddings.embed_documents(texts), dtype='float32')
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            _prototype_vectors[model_key] = (labels, vectors)
+
+        labels, vectors = _prototype_vectors[model_key]
+        query_vector = np.array(embeddings.embed_query(question), dtype='float32')
+        query_vector /= np.linalg.norm(query_vector)
+        similarities = vectors @ query_vector
+        best = int(similarities.argmax())
+
+        threshold = getattr(settings, 'RAG_QUERY_CLASSIFIER_THRESHOLD', 0.8)
+        if similarities[best] >= threshold:
+            return labels[best]
+    except Exception as e:
+        logger.warning(f"Classificatore embedding non disponibile, uso parole chiave: {str(e)}")
+
+    return keyword_classify(question)
+
+
+def classify_question(question, embeddings=None):
+    """
+    Classifica la domanda con il classificatore configurato in RAG_QUERY_CLASSIFIER.
+
+    Args:
+        question: Testo della domanda
+        embeddings: Oggetto Embeddings (necessario solo per il classificatore 'embedding')
+
+    Returns:
+        tuple: (tipo di domanda, nome del classificatore usato)
+    """
+    classifier = getattr(settings, 'RAG_QUERY_CLASSIFIER', 'keyword')
+    if classifier == 'embedding' and embeddings is not None:
+        return embedding_classify(question, embeddings), 'embedding'
+    return keyword_classify(question), 'keyword'
+
+
+def build_default_plan(rag_settings, context_budget):
+    """
+    Costruisce il piano di recupero standard derivato dalla configurazione RAG del progetto.
+
+    Args:
+        rag_settings: Dizionario restituito da get_project_RAG_settings
+        context_budget: Budget di token per il contesto
+
+    Returns:
+        dict: Piano di recupero
+    """
+    # Raddoppia i risultati rispetto al top_k configurato per coprire più fonti
+    k = rag_settings['similarity_top_k'] * 2
+    return {
+        'question_type': QUESTION_TYPE_DEFAULT,
+        'classifier': None,
+        'search_query': None,
+        'generation_question': None,
+        'search_type': rag_settings['retriever_type'],
+        'k': k,
+        'fetch_k': k * 3,
+        'lambda_mult': 0.5,
+        'score_threshold': rag_settings['similarity_threshold'] * 0.8,
+        'filter': None,
+        'context_budget': context_budget,
+        'chain_type': CHAIN_TYPE_STUFF,
+    }
+
+
+def plan_query(question, rag_settings, context_budget, snapshot=None, embeddings=None,
+               summaries_available=False):
+    """
+    Classifica la domanda e produce il piano di recupero da eseguire.
+
+    Args:
+        question: Testo della domanda
+        rag_settings: Dizionario restituito da get_project_RAG_settings
+        context_budget: Budget di token standard per il contesto
+        snapshot: Snapshot dei contenuti del progetto (per decidere se applicare filtri)
+        embeddings: Oggetto Embeddings per il classificatore opzionale
+        summaries_available: True se esistono i riassunti precalcolati delle fonti, oppure una
+            funzione senza argomenti che lo verifica (chiamata solo per le domande generiche)
+
+    Returns:
+        dict: Piano di recupero
+    """
+    question_type, classifier = classify_question(question, embeddings)
+    plan = build_default_plan(rag_settings, context_budget)
+    plan.update({
+        'question_type': question_type,
+        'classifier': classifier,
+        'search_query': question,
+        'generation_question': f"{question}\n{GENERATION_INSTRUCTIONS[question_type]}",
+    })
+
+    profile = PLAN_PROFILES.get(question_type)
+    if profile:
+        plan.update({
+            'search_type': profile['search_type'],
+            'k': profile['k'],
+            'fetch_k': profile['k'] * 3,
+            'lambda_mult': profile['lambda_mult'],
+            'score_threshold': profile['score_threshold'],
+        })
+
+    # Le domande generiche usano il map-reduce sui riassunti delle fonti, quando disponibili
+    if question_type == QUESTION_TYPE_GENERIC and (
+            summaries_available() if callable(summaries_available) else summaries_available):
+        plan['chain_type'] = CHAIN_TYPE_SUMMARIES
+
+    # Filtro sui metadati solo per riferimenti espliciti e se esistono fonti di quel tipo
+    filter_matcher = SOURCE_FILTER_MATCHERS.get(question_type)
+    if filter_matcher and filter_matcher.search(question):
+        available = True
+        if snapshot is not None:
+            section = 'urls' if question_type == QUESTION_TYPE_URL else 'notes'
+            available = snapshot[section]['indexed'] > 0
+        if available:
+            plan['filter'] = {'type': question_type}
+            # Con il filtro FAISS scarta candidati dopo la ricerca: recuperane di più
+            plan['fetch_k'] = plan['k'] * 10
+
+    logger.info(f"🧭 Piano di query: tipo={plan['question_type']} ({plan['classifier']}), "
+                f"search={plan['search_type']}, k={plan['k']}, fetch_k={plan['fetch_k']}, "
+                f"filtro={plan['filter']}, budget={plan['context_budget']}, catena={plan['chain_type']}")
+    return plan
@@ -0,0 +1,161 @@
+"""
+Riordinamento (rerank) dei frammenti recuperati prima della generazione.
+Questo modulo si occupa di:
+- Riassegnare un punteggio ai candidati restituiti da FAISS
+- Supportare un re-scorer lessicale (BM25, nessuna dipendenza) e un cross-encoder su CPU
+- Passare al modello solo i migliori N frammenti
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import List
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Identificativo del re-scorer lessicale (qualsiasi altro valore è interpretato come cross-encoder)
+LEXICAL_RERANK_MODEL = 'lexical'
+
+# Moltiplicatore dei candidati da recuperare rispetto ai frammenti finali
+RERANK_CANDIDATE_MULTIPLIER = 4
+
+# Parametri standard BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def _tokenize(text):
+    """
+    Suddivide un testo in termini minuscoli, ignorando quelli di una sola lettera.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1]
+
+
+def _document_text(doc):
+    """
+    Testo usato per il punteggio: contenuto più titolo/nome file, così le domande
+    che citano un documento per nome premiano i suoi frammenti.
+    """
+    metadata = doc.metadata
+    label = metadata.get('filename') or metadata.get('title') or ''
+    return f"{label}\n{doc.page_content}" if label else doc.page_content
+
+
+def lexical_rerank_scores(query, docs):
+    """
+    Calcola un punteggio BM25 di ciascun documento rispetto alla domanda.
+
+    Le statistiche (IDF, lunghezza media) sono calcolate sul solo insieme dei candidati.
+
+    Args:
+        query: Testo della domanda
+        docs: Lista di Document candidati
+
+    Returns:
+        list: Punteggi nello stesso ordine dei documenti
+    """
+    query_terms = set(_tokenize(query))
+    if not query_terms or not docs:
+        return [0.0] * len(docs)
+
+    doc_terms = [Counter(_tokenize(_document_text(doc))) for doc in docs]
+    avg_length = sum(sum(terms.values()) for terms in doc_terms) / len(docs) or 1.0
+    doc_freq = Counter(term for terms in doc_terms for term in query_terms if term in terms)
+
+    scores = []
+    for terms in doc_terms:
+        length = sum(terms.values())
+        score = 0.0
+        for term in query_terms:
+            frequency = terms.get(term)
+            if not frequency:
+                continue
+            idf = math.log(1 + (len(docs) - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * frequency * (BM25_K1 + 1) / (
+                frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+@lru_cache(maxsize=4)
+def _get_cross_encoder(model_name):
+    """
+    Carica (una sola volta per processo) un cross-encoder di sentence-transformers.
+
+    Returns:
+        CrossEncoder o None se la libreria o il modello non sono disponibili
+    """
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        logger.warning(f"sentence-transformers non installato: rerank '{model_name}' sostituito da quello lessicale")
+        return None
+
+    try:
+        return CrossEncoder(model_name, device='cpu')
+    except Exception as e:
+        logger.error(f"Errore nel caricamento del cross-encoder {model_name}: {str(e)}")
+        return None
+
+
+def rerank_documents(query, docs, model_name, top_n):
+    """
+    Riordina i documenti candidati e restituisce i migliori top_n.
+
+    Args:
+        query: Testo della domanda
+        docs: Lista di Document candidati (in ordine di recupero)
+        model_name: 'lexical' oppure il nome di un cross-encoder
+        top_n: Numero di documenti da restituire
+
+    Returns:
+        list: I migliori top_n Document, con 'rerank_score' nei metadati
+    """
+    if not docs:
+        return []
+
+    scores = None
+    if model_name and model_name != LEXICAL_RERANK_MODEL:
+        encoder = _get_cross_encoder(model_name)
+        if encoder is not None:
+            try:
+                scores = [float(score) for score in
+                          encoder.predict([(query, _document_text(doc)) for doc in docs])]
+            except Exception as e:
+                logger.error(f"Errore nel rerank con cross-encoder: {str(e)}")
+
+    if scores is None:
+        scores = lexical_rerank_scores(query, docs)
+
+    # A parità di punteggio mantiene l'ordine originale del retriever
+    ranked = sorted(range(len(docs)), key=lambda index: (-scores[index], index))[:top_n]
+
+    logger.info(f"🔀 Rerank ({model_name}): {len(docs)} candidati → {len(ranked)} frammenti")
+    return [
+        Document(page_content=docs[index].page_content,
+                 metadata={**docs[index].metadata, 'rerank_score': scores[index]})
+        for index in ranked
+    ]
+
+
+class RerankRetriever(BaseRetriever):
+    """
+    Retriever che recupera un insieme ampio di candidati e conserva solo i migliori N dopo il rerank.
+    """
+    base_retriever: BaseRetriever
+    model_name: str = LEXICAL_RERANK_MODEL
+    top_n: int = 6
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return rerank_documents(query, docs, self.model_name, self.top_n)
@@ -0,0 +1,299 @@
+"""
+Loader per dati tabellari e documenti di markup (CSV, XLSX, Markdown, HTML).
+Questo modulo si occupa di:
+- Leggere CSV (pandas, a blocchi) e XLSX (openpyxl in sola lettura) senza caricare l'intero file
+- Suddividere le tabelle in gruppi di righe che ripetono sempre l'intestazione
+- Adattare i gruppi di righe alla dimensione dei chunk del progetto senza perdere l'intestazione
+- Suddividere Markdown e HTML in sezioni delimitate dai titoli
+"""
+
+import csv
+import logging
+import os
+import re
+
+from django.conf import settings
+from langchain.schema import Document
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Righe per gruppo prodotte dal loader (il chunking può suddividerle ulteriormente)
+TABLE_ROWS_PER_GROUP = getattr(settings, 'RAG_TABLE_ROWS_PER_GROUP', 50)
+
+# Tipo di contenuto usato nei metadati per riconoscere i gruppi di righe in fase di chunking
+TABLE_CONTENT_KIND = 'table_rows'
+
+TABLE_CELL_SEPARATOR = " | "
+
+MARKDOWN_HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+
+# Separatori ammessi per i CSV e dimensione del campione usato per riconoscerli
+CSV_DELIMITERS = ',;\t|'
+CSV_SNIFF_SAMPLE_BYTES = 64 * 1024
+
+
+def _format_row(values):
+    """
+    Converte una riga in testo, comprimendo gli spazi di ogni cella.
+    """
+    return TABLE_CELL_SEPARATOR.join(" ".join(str(value).split()) for value in values)
+
+
+def _row_group_document(file_path, header, rows, row_start, sheet=None):
+    """
+    Costruisce il Document di un gruppo di righe con l'intestazione in testa.
+    """
+    metadata = {
+        'source': file_path,
+        'content_kind': TABLE_CONTENT_KIND,
+        'table_header': header,
+        'row_start': row_start,
+        'row_end': row_start + len(rows) - 1,
+    }
+    if sheet is not None:
+        metadata['sheet'] = sheet
+    return Document(page_content="\n".join([header] + rows), metadata=metadata)
+
+
+def detect_csv_delimiter(file_path):
+    """
+    Riconosce il separatore di un CSV da un campione iniziale del file.
+
+    Il riconoscimento è limitato a virgola, punto e virgola, tab e barra verticale;
+    se non è possibile (es. CSV con una sola colonna) viene usata la virgola.
+
+    Args:
+        file_path: Percorso del file CSV
+
+    Returns:
+        str: Separatore delle colonne
+    """
+    with open(file_path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        sample = f.read(CSV_SNIFF_SAMPLE_BYTES)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+
+def iter_csv_row_groups(file_path, rows_per_group=None):
+    """
+    Legge un CSV a blocchi e restituisce gruppi di righe con l'intestazione ripetuta.
+
+    Args:
+        file_path: Percorso del file CSV
+        rows_per_group: Righe per gruppo (opzionale)
+
+    Yields:
+        Document: Gruppo di righe con metadati 'table_header', 'row_start', 'row_end'
+    """
+    import pandas as pd
+
+    rows_per_group = rows_per_group or TABLE_ROWS_PER_GROUP
+    reader = pd.read_csv(file_path, chunksize=rows_per_group, dtype=str, keep_default_na=False,
+                         sep=detect_csv_delimiter(file_path), encoding_errors='replace')
+
+    # Numerazione come nel foglio di calcolo: la riga 1 è l'intestazione
+    row_start = 2
+    with reader:
+        for chunk in reader:
+            header = _format_row(chunk.columns)
+            rows = [_format_row(values) for values in chunk.itertuples(index=False, name=None)]
+            rows = [row for row in rows if row.replace(TABLE_CELL_SEPARATOR, '').strip()]
+            if rows:
+                yield _row_group_document(file_path, header, rows, row_start)
+            row_start += len(chunk)
+
+
+def iter_xlsx_row_groups(file_path, rows_per_group=None):
+    """
+    Legge un file XLSX in modalità streaming (sola lettura) e restituisce gruppi di righe per foglio.
+
+    La prima riga non vuota di ogni foglio è considerata l'intestazione.
+
+    Args:
+        file_path: Percorso del file XLSX
+        rows_per_group: Righe per gruppo (opzionale)
+
+    Yields:
+        Document: Gruppo di righe con metadati 'sheet', 'table_header', 'row_start', 'row_end'
+    """
+    from openpyxl import load_workbook
+
+    rows_per_group = rows_per_group or TABLE_ROWS_PER_GROUP
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            header, rows, row_start = None, [], None
+            for row_number, values in enumerate(worksheet.iter_rows(values_only=True), start=1):
+                cells = ['' if value is None else value for value in values]
+                if not any(str(cell).strip() for cell in cells):
+                    continue
+                if header is None:
+                    header = _format_row(cells)
+                    continue
+                if row_start is None:
+                    row_start = row_number
+                rows.append(_format_row(cells))
+                if len(rows) >= rows_per_group:
+                    yield _row_group_document(file_path, header, rows, row_start, worksheet.title)
+                    rows, row_start = [], None
+            if rows:
+                yield _row_group_document(file_path, header, rows, row_start, worksheet.title)
+    finally:
+        workbook.close()
+
+
+def split_row_group_document(doc, chunk_size):
+    """
+    Suddivide un gruppo di righe in chunk entro chunk_size caratteri, ripetendo l'intestazione.
+
+    Le righe non vengono mai spezzate: una riga più lunga di chunk_size forma un chunk da sola.
+
+    Args:
+        doc: Document prodotto dai loader tabellari
+        chunk_size: Dimensione massima del chunk in caratteri
+
+    Returns:
+        list: Lista di Document
+    """
+    header = doc.metadata.get('table_header', '')
+    rows = doc.page_content.split("\n")[1:]
+    row_start = doc.metadata.get('row_start', 1)
+
+    chunks, current, size = [], [], len(header)
+    for offset, row in enumerate(rows):
+        if current and size + len(row) + 1 > chunk_size:
+            chunks.append((row_start + offset - len(current), current))
+            current, size = [], len(header)
+        current.append(row)
+        size += len(row) + 1
+    if current:
+        chunks.append((row_start + len(rows) - len(current), current))
+
+    return [
+        Document(page_content="\n".join([header] + chunk_rows), metadata={
+            **doc.metadata, 'row_start': start, 'row_end': start + len(chunk_rows) - 1})
+        for start, chunk_rows in chunks
+    ]
+
+
+def _sections_from_lines(file_path, lines, heading_of):
+    """
+    Raggruppa le righe in sezioni delimitate dai titoli riconosciuti da heading_of.
+    """
+    sections = []
+    title, level, current = '', None, []
+    for line in lines:
+        heading = heading_of(line)
+        if heading is not None:
+            if any(part.strip() for part in current):
+                sections.append((title, level, current))
+            level, title = heading
+            current = [line]
+        else:
+            current.append(line)
+    if any(part.strip() for part in current):
+        sections.append((title, level, current))
+
+    return [
+        Document(page_content="\n".join(section_lines).strip(), metadata={
+            'source': file_path, 'section': section_title, 'heading_level': section_level,
+            'section_index': index})
+        for index, (section_title, section_level, section_lines) in enumerate(sections)
+    ]
+
+
+def _markdown_heading(line):
+    """
+    Restituisce (livello, titolo) se la riga è un titolo Markdown, altrimenti None.
+    """
+    match = MARKDOWN_HEADING_PATTERN.match(line)
+    return (len(match.group(1)), match.group(2)) if match else None
+
+
+def load_markdown_documents(file_path):
+    """
+    Carica un file Markdown suddiviso in sezioni per titolo.
+
+    Args:
+        file_path: Percorso del file Markdown
+
+    Returns:
+        list: Lista di Document (una per sezione)
+    """
+    in_code_block = False
+
+    def lines():
+        nonlocal in_code_block
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if line.lstrip().startswith('```'):
+                    in_code_block = not in_code_block
+                yield line
+
+    # I '#' all'interno dei blocchi di codice (es. commenti shell) non sono titoli
+    return _sections_from_lines(file_path, lines(),
+                                lambda line: None if in_code_block else _markdown_heading(line))
+
+
+def load_html_documents(file_path):
+    """
+    Carica un file HTML, rimuovendo script e navigazione, suddiviso in sezioni per titolo (h1-h3).
+
+    Args:
+        file_path: Percorso del file HTML
+
+    Returns:
+        list: Lista di Document (una per sezione) con il titolo della pagina nei metadati
+    """
+    from bs4 import BeautifulSoup
+
+    with open(file_path, 'rb') as f:
+        soup = BeautifulSoup(f, 'lxml')
+
+    page_title = soup.title.get_text(strip=True) if soup.title else ''
+    for tag in soup(['script', 'style', 'noscript', 'nav', 'header', 'footer', 'form', 'svg']):
+        tag.decompose()
+
+    # I titoli diventano righe in stile Markdown, così le sezioni si delimitano come per i file .md
+    for tag in soup.find_all(['h1', 'h2', 'h3']):
+        heading = tag.get_text(" ", strip=True)
+        tag.replace_with(f"\n{'#' * int(tag.name[1])} {heading}\n" if heading else "")
+
+    root = soup.body or soup
+    lines = (line.strip() for line in root.get_text("\n").split("\n"))
+
+    documents = _sections_from_lines(file_path, (line for line in lines if line), _markdown_heading)
+    for doc in documents:
+        doc.metadata['title'] = page_title
+    return documents
+
+
+def load_structured_documents(file_path):
+    """
+    Carica un file CSV, XLSX, Markdown o HTML.
+
+    Args:
+        file_path: Percorso del file
+
+    Returns:
+        list: Lista di Document (vuota se il formato non è supportato o la lettura fallisce)
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension == '.csv':
+            return list(iter_csv_row_groups(file_path))
+        if extension == '.xlsx':
+            return list(iter_xlsx_row_groups(file_path))
+        if extension in ('.md', '.markdown'):
+            return load_markdown_documents(file_path)
+        if extension in ('.html', '.htm'):
+            return load_html_documents(file_path)
+    except ImportError as e:
+        logger.warning(f"Dipendenza mancante per il formato {extension}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Errore nella lettura di {os.path.basename(file_path)}: {str(e)}")
+    return []
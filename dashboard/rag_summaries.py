@@ -0,0 +1,366 @@
+"""
+Riassunti precalcolati delle fonti di progetto per le domande generiche.
+Questo modulo si occupa di:
+- Generare, in fase di indicizzazione, un riassunto per ogni documento, URL e nota
+- Salvare i riassunti accanto all'indice vettoriale (ricalcolando solo le fonti modificate)
+- Rispondere alle domande generiche ("riassumi tutti i documenti") con un percorso map-reduce
+  sui riassunti, che copre ogni fonte con un consumo di token limitato e prevedibile
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from langchain.schema import Document
+
+from dashboard.rag_context import count_tokens, truncate_to_tokens
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Token massimi di testo di una fonte inviati al modello per generarne il riassunto
+SUMMARY_SOURCE_MAX_TOKENS = getattr(settings, 'RAG_SUMMARY_SOURCE_MAX_TOKENS', 6000)
+
+# Numero massimo di riassunti generati in parallelo
+SUMMARY_MAX_WORKERS = getattr(settings, 'RAG_SUMMARY_MAX_WORKERS', 4)
+
+# Intervallo (in secondi) prima di ritentare il riassunto di una fonte non riuscito
+SUMMARY_RETRY_SECONDS = getattr(settings, 'RAG_SUMMARY_RETRY_SECONDS', 24 * 3600)
+
+# Stato delle fonti senza riassunto: contenuto vuoto (nulla da riassumere) o generazione non riuscita
+SUMMARY_STATUS_EMPTY = 'empty'
+SUMMARY_STATUS_FAILED = 'failed'
+
+# Lock per progetto: i riassunti vengono uniti a quelli salvati senza perdere scritture concorrenti
+_summaries_locks_guard = threading.Lock()
+_summaries_locks = {}
+
+SUMMARY_PROMPT = """Riassumi il seguente contenuto in al massimo 8 frasi, nella stessa lingua del testo.
+Riporta l'argomento principale, i punti chiave, i dati e i nomi più importanti.
+
+FONTE: {label}
+
+CONTENUTO:
+{content}
+
+RIASSUNTO:"""
+
+MAP_PROMPT = """Di seguito trovi i riassunti di alcune fonti di un progetto.
+Rispondi alla domanda usando SOLO questi riassunti. Tratta OGNI fonte separatamente,
+indicandone sempre il nome, e non omettere nessuna fonte.
+
+{summaries}
+
+DOMANDA: {question}
+
+RISPOSTA:"""
+
+REDUCE_PROMPT = """Di seguito trovi risposte parziali alla stessa domanda, ciascuna relativa a un gruppo di fonti.
+Uniscile in un'unica risposta strutturata con una sezione per ogni fonte, senza perdere nessuna fonte
+e senza aggiungere informazioni esterne.
+
+{partial_answers}
+
+DOMANDA: {question}
+
+RISPOSTA:"""
+
+
+def get_summaries_path(project):
+    """
+    Restituisce il percorso del file dei riassunti, salvato accanto all'indice vettoriale.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        str: Percorso del file JSON dei riassunti
+    """
+    project_dir = os.path.join(settings.MEDIA_ROOT, 'projects', str(project.user.id), str(project.id))
+    return os.path.join(project_dir, f"vector_index_{project.id}_summaries.json")
+
+
+def load_project_summaries(project):
+    """
+    Carica i riassunti salvati per un progetto.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        dict: {chiave fonte: {'summary', 'content_hash', 'metadata', 'updated_at'}}; le fonti
+            senza riassunto hanno 'summary' None e 'status' ('empty' o 'failed')
+    """
+    path = get_summaries_path(project)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Errore nel caricamento dei riassunti del progetto {project.id}: {str(e)}")
+        return {}
+
+
+def _get_summaries_lock(project):
+    """
+    Restituisce il lock che serializza le scritture dei riassunti di un progetto.
+    """
+    with _summaries_locks_guard:
+        return _summaries_locks.setdefault(project.id, threading.Lock())
+
+
+def save_project_summaries(project, updates):
+    """
+    Unisce i riassunti aggiornati a quelli salvati e scrive il file (in modo atomico).
+
+    Il file viene riletto sotto un lock per progetto immediatamente prima della scrittura,
+    così aggiornamenti concorrenti (es. completamento in background) non si sovrascrivono.
+
+    Args:
+        project: Oggetto Project
+        updates: Dizionario {chiave fonte: voce} da aggiungere o sostituire
+
+    Returns:
+        dict: Riassunti salvati del progetto
+    """
+    path = get_summaries_path(project)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _get_summaries_lock(project):
+        summaries = load_project_summaries(project)
+        summaries.update(updates)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    return summaries
+
+
+def _is_recent_failure(entry):
+    """
+    Verifica se una voce registra un riassunto non riuscito da meno di RAG_SUMMARY_RETRY_SECONDS.
+    """
+    if entry.get('status') != SUMMARY_STATUS_FAILED or not entry.get('updated_at'):
+        return False
+    try:
+        failed_at = datetime.fromisoformat(entry['updated_at'])
+    except ValueError:
+        return False
+    return timezone.now() - failed_at < timedelta(seconds=SUMMARY_RETRY_SECONDS)
+
+
+def _source_label(metadata):
+    """
+    Nome leggibile di una fonte a partire dai metadati dei suoi documenti.
+    """
+    if metadata.get('type') == 'url':
+        return f"URL: {metadata.get('title') or metadata.get('url')} ({metadata.get('url')})"
+    if metadata.get('type') == 'note':
+        return f"Nota: {metadata.get('title') or 'Senza titolo'}"
+    return f"Documento: {metadata.get('filename') or os.path.basename(metadata.get('source', ''))}"
+
+
+def update_project_summaries(project, docs, llm, model_name="gpt-3.5-turbo", sources=None):
+    """
+    Genera i riassunti delle fonti indicizzate che ne sono prive o che sono cambiate.
+
+    I documenti (prima del chunking) vengono raggruppati per fonte; per ogni fonte il
+    contenuto viene confrontato tramite hash con quello già riassunto, così le fonti
+    invariate non generano nuove chiamate al modello. Le fonti senza contenuto e quelle
+    il cui riassunto non è riuscito vengono registrate, per non ritentarle a ogni domanda.
+
+    Args:
+        project: Oggetto Project
+        docs: Documenti caricati in fase di indicizzazione (con 'source' nei metadati)
+        llm: Modello LangChain usato per i riassunti
+        model_name: Nome del modello per il conteggio dei token
+        sources: Chiavi delle fonti richieste (opzionale): quelle senza documenti con
+            contenuto vengono registrate come vuote
+
+    Returns:
+        dict: Riassunti aggiornati del progetto
+    """
+    summaries = load_project_summaries(project)
+    now = timezone.now().isoformat()
+
+    # Raggruppa le pagine/sezioni per fonte mantenendo l'ordine originale
+    grouped = {}
+    for doc in docs:
+        source = doc.metadata.get('source')
+        if not source or not doc.page_content.strip():
+            continue
+        group = grouped.setdefault(source, {'metadata': dict(doc.metadata), 'parts': []})
+        group['parts'].append(doc.page_content)
+
+    updates = {
+        source: {'summary': None, 'status': SUMMARY_STATUS_EMPTY, 'updated_at': now}
+        for source in (sources or ()) if source not in grouped
+    }
+
+    pending = []
+    for source, group in grouped.items():
+        content = "\n\n".join(group['parts'])
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        entry = summaries.get(source, {})
+        if entry.get('content_hash') == content_hash and (entry.get('summary') or _is_recent_failure(entry)):
+            continue
+        metadata = {key: value for key, value in group['metadata'].items()
+                    if key in ('source', 'type', 'filename', 'title', 'url', 'url_id', 'note_id')}
+        pending.append((source, content, content_hash, metadata))
+
+    if pending:
+        logger.info(f"📝 Generazione di {len(pending)} riassunti per il progetto {project.id}")
+
+    def summarize(item):
+        source, content, content_hash, metadata = item
+        prompt = SUMMARY_PROMPT.format(
+            label=_source_label(metadata),
+            content=truncate_to_tokens(content, SUMMARY_SOURCE_MAX_TOKENS, model_name)
+        )
+        try:
+            response = llm.invoke(prompt)
+            return source, content_hash, metadata, getattr(response, 'content', str(response)).strip()
+        except Exception as e:
+            logger.error(f"Errore nella generazione del riassunto per {source}: {str(e)}")
+            return source, content_hash, metadata, None
+
+    with ThreadPoolExecutor(max_workers=SUMMARY_MAX_WORKERS) as executor:
+        for source, content_hash, metadata, summary in executor.map(summarize, pending):
+            updates[source] = {
+                'summary': summary or None,
+                'content_hash': content_hash,
+                'metadata': metadata,
+                'updated_at': now,
+            }
+            if not summary:
+                # Riassunto non riuscito o vuoto: ritentato dopo RAG_SUMMARY_RETRY_SECONDS
+                updates[source]['status'] = SUMMARY_STATUS_FAILED
+
+    if not updates:
+        logger.debug(f"Riassunti già aggiornati per il progetto {project.id}")
+        return summaries
+    return save_project_summaries(project, updates)
+
+
+def get_project_summaries_coverage(project):
+    """
+    Confronta le fonti riassunte con quelle attualmente incluse nel RAG del progetto.
+
+    Gli aggiornamenti incrementali dell'indice riassumono solo le fonti nuove o modificate:
+    il file dei riassunti può quindi esistere senza coprire tutte le fonti. Il percorso
+    map-reduce va usato solo quando la copertura è completa. Le fonti senza contenuto
+    contano come coperte; quelle con un riassunto non riuscito di recente restano
+    scoperte ma non vanno ritentate subito.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        tuple: (riassunti delle fonti incluse, insieme delle fonti incluse senza riassunto,
+            sottoinsieme delle fonti da riassumere ora)
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectFile, ProjectNote, ProjectURL
+
+    # Fonti che l'indicizzazione trasforma in documenti (le note quasi vuote vengono saltate)
+    required_sources = set(
+        ProjectFile.objects.filter(project=project, is_embedded=True).values_list('file_path', flat=True))
+    required_sources.update(
+        f"url_{url_id}" for url_id in
+        ProjectURL.objects.filter(project=project, is_included_in_rag=True).values_list('id', flat=True))
+    required_sources.update(
+        f"note_{note_id}" for note_id, content in
+        ProjectNote.objects.filter(project=project, is_included_in_rag=True).values_list('id', 'content')
+        if content and len(content.strip()) >= 10)
+
+    summaries = load_project_summaries(project)
+    active_summaries = {source: entry for source, entry in summaries.items()
+                        if source in required_sources and entry.get('summary')}
+    empty_sources = {source for source, entry in summaries.items()
+                     if entry.get('status') == SUMMARY_STATUS_EMPTY}
+    missing_sources = required_sources - set(active_summaries) - empty_sources
+    retry_sources = {source for source in missing_sources if not _is_recent_failure(summaries.get(source, {}))}
+    return active_summaries, missing_sources, retry_sources
+
+
+def get_active_project_summaries(project):
+    """
+    Restituisce i riassunti delle fonti incluse nel RAG, solo se coprono tutte le fonti.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        dict: Riassunti di tutte le fonti incluse, o dizionario vuoto se alcune fonti
+            non sono ancora state riassunte
+    """
+    summaries, missing_sources, _ = get_project_summaries_coverage(project)
+    if missing_sources:
+        logger.info(f"Riassunti incompleti per il progetto {project.id}: "
+                    f"{len(missing_sources)} fonti senza riassunto")
+        return {}
+    return summaries
+
+
+def answer_from_summaries(question, summaries, llm, token_budget, model_name="gpt-3.5-turbo"):
+    """
+    Risponde a una domanda generica con un percorso map-reduce sui riassunti delle fonti.
+
+    I riassunti vengono suddivisi in gruppi che rientrano nel budget di token; ogni gruppo
+    produce una risposta parziale (map, in parallelo) e le risposte parziali vengono unite
+    in una risposta finale (reduce). Se tutti i riassunti rientrano in un solo gruppo basta
+    una chiamata.
+
+    Args:
+        question: Domanda dell'utente
+        summaries: Riassunti restituiti da get_active_project_summaries
+        llm: Modello LangChain
+        token_budget: Budget di token per ciascun gruppo di riassunti
+        model_name: Nome del modello per il conteggio dei token
+
+    Returns:
+        dict: {'result': risposta, 'source_documents': un Document per ogni fonte riassunta}
+    """
+    source_documents = [
+        Document(page_content=entry['summary'], metadata={**entry['metadata'], 'is_summary': True})
+        for entry in summaries.values()
+    ]
+
+    # Suddividi i riassunti in gruppi entro il budget di token
+    batches, current, used = [], [], 0
+    for doc in source_documents:
+        block = f"### {_source_label(doc.metadata)}\n{doc.page_content}"
+        block_tokens = count_tokens(block, model_name)
+        if current and used + block_tokens > token_budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(block)
+        used += block_tokens
+    if current:
+        batches.append(current)
+
+    def run_map(batch):
+        prompt = MAP_PROMPT.format(summaries="\n\n".join(batch), question=question)
+        return getattr(llm.invoke(prompt), 'content', '')
+
+    logger.info(f"🗂️ Risposta map-reduce su {len(source_documents)} riassunti in {len(batches)} gruppi")
+
+    with ThreadPoolExecutor(max_workers=SUMMARY_MAX_WORKERS) as executor:
+        partial_answers = list(executor.map(run_map, batches))
+
+    if len(partial_answers) == 1:
+        answer = partial_answers[0]
+    else:
+        prompt = REDUCE_PROMPT.format(
+            partial_answers="\n\n---\n\n".join(partial_answers),
+            question=question
+        )
+        answer = getattr(llm.invoke(prompt), 'content', '')
+
+    return {'result': answer, 'source_documents': source_documents}
@@ -17,26 +17,56 @@ from urllib.parse import urlparse
 
 import openai
 from django.conf import settings
+from django.db import connections
 from django.db.models import F, Q
 from django.utils import timezone
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyMuPDFLoader, UnstructuredWordDocumentLoader, \
-    UnstructuredPowerPointLoader, PDFMinerLoader, TextLoader
+from langchain_community.document_loaders import TextLoader
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 
 # Importa le funzioni utility per la gestione dei documenti
 from dashboard.rag_document_utils import (
     compute_file_hash, check_project_index_update_needed,
     update_project_index_status, get_cached_embedding, create_embedding_cache,
-    copy_embedding_to_project_index
+    copy_embedding_to_project_index, get_project_content_snapshot,
+    invalidate_project_content_snapshot, get_cached_parsed_document, save_parsed_document,
+    prune_parsed_text_cache,
+    save_uploaded_file_with_hash, find_duplicate_project_file
 )
-from profiles.models import ProjectRAGConfiguration, RagDefaultSettings, ProjectURL
+from dashboard.rag_context import TokenBudgetRetriever, compute_context_token_budget
+from dashboard.rag_pdf_loader import load_pdf_documents
+from dashboard.rag_office_loader import load_office_documents
+from dashboard.rag_blob_store import detach_file_from_blob, link_file_to_blob
+from dashboard.rag_previews import schedule_file_previews
+from dashboard.rag_structured_loader import (
+    load_structured_documents, split_row_group_document, TABLE_CONTENT_KIND
+)
+from dashboard.rag_ocr import ocr_image_file, ocr_pdf_pages, is_ocr_result_reliable, render_pdf_page
+from dashboard.rag_vision import (
+    VISION_MAX_CONCURRENCY, prepare_vision_image, get_cached_vision_description, save_vision_description,
+    vision_call_slot,
+)
+from dashboard.rag_rerank import RerankRetriever, RERANK_CANDIDATE_MULTIPLIER
+from dashboard.rag_query_planner import (
+    build_default_plan, plan_query, QUESTION_TYPE_GENERIC, QUESTION_TYPE_URL, QUESTION_TYPE_NOTE,
+    CHAIN_TYPE_SUMMARIES
+)
+from dashboard.rag_conversation import (
+    get_conversation_history, rewrite_followup_question, schedule_conversation_summary_update,
+)
+from dashboard.rag_summaries import (
+    update_project_summaries, get_project_summaries_coverage, answer_from_summaries
+)
+from profiles.models import ProjectRAGConfiguration, RagDefaultSettings, ProjectURL, DEFAULT_RERANK_TOP_N
 
 # Configurazione logger
 logger = logging.getLogger(__name__)
@@ -279,6 +309,10 @@ def get_project_RAG_settings(project):
         if project_config.strict_context is not None:
             settings['strict_context'] = project_config.strict_context
 
+        # Il riordinamento è configurato solo a livello di progetto (non fa parte dei preset)
+        settings['rerank_model'] = project_config.get_rerank_model()
+        settings['rerank_top_n'] = project_config.get_rerank_top_n()
+
         return settings
 
     except ProjectRAGConfiguration.DoesNotExist:
@@ -296,54 +330,87 @@ def get_project_RAG_settings(project):
             'prioritize_filenames': True,
             'equal_notes_weight': True,
             'strict_context': False,
+            'rerank_model': None,
+            'rerank_top_n': DEFAULT_RERANK_TOP_N,
         }
 
 
-def process_image(image_path, user=None):
+def describe_image_with_vision(image_bytes, user=None):
     """
-    Processa un'immagine usando OpenAI Vision per estrarne testo e contenuto.
+    Estrae testo e descrizione da un'immagine con OpenAI Vision.
 
-    Converte l'immagine in base64 e utilizza il modello gpt-4-vision per estrarre
-    testo visibile e generare una descrizione dettagliata dell'immagine. Questo
-    permette di includere il contenuto delle immagini nei documenti indicizzati.
+    L'immagine viene ridimensionata alla risoluzione usata dal modello prima dell'invio
+    e la descrizione viene memorizzata per hash del contenuto: la stessa immagine
+    (anche in un altro progetto o dopo una ri-indicizzazione) non viene inviata due volte.
+    Le chiamate contemporanee sono limitate da RAG_VISION_MAX_CONCURRENCY.
 
     Args:
-        image_path: Percorso completo dell'immagine
+        image_bytes: Contenuto dell'immagine
         user: Oggetto User Django (opzionale)
 
     Returns:
-        Document: Documento LangChain con il testo estratto dall'immagine
+        str: Testo estratto e descrizione dell'immagine
     """
-    logger.debug(f"Elaborazione immagine: {image_path}")
-    try:
-        # Ottieni la chiave API OpenAI per l'utente
-        api_key = get_openai_api_key(user)
+    vision_model = "gpt-4-vision"  # Modello specifico per la visione
 
-        # Ottieni le impostazioni del motore
-        ai_settings = get_project_LLM_settings(None)
+    cached_content = get_cached_vision_description(image_bytes, vision_model)
+    if cached_content is not None:
+        logger.debug("Descrizione Vision in cache riutilizzata")
+        return cached_content
 
-        with open(image_path, "rb") as image_file:
-            image_base64 = base64.b64encode(image_file.read()).decode("utf-8")
+    # Ottieni la chiave API OpenAI per l'utente
+    api_key = get_openai_api_key(user)
+
+    # Ottieni le impostazioni del motore
+    ai_settings = get_project_LLM_settings(None)
 
-        # Configura il client OpenAI con la chiave corretta
-        client = openai.OpenAI(api_key=api_key)
+    prepared_bytes, mime_type = prepare_vision_image(image_bytes)
+    image_base64 = base64.b64encode(prepared_bytes).decode("utf-8")
 
+    # Configura il client OpenAI con la chiave corretta
+    client = openai.OpenAI(api_key=api_key)
+
+    with vision_call_slot():
         response = client.chat.completions.create(
-            model="gpt-4-vision",  # Modello specifico per la visione
+            model=vision_model,
             messages=[
                 {
                     "role": "user",
                     "content": [
                         {"type": "text",
                          "text": "Descrivi in dettaglio questa immagine ed estrai tutto il testo visibile."},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+                        {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_base64}"}}
                     ]
                 }
             ],
             max_tokens=ai_settings['max_tokens']
         )
 
-        content = response.choices[0].message.content
+    content = response.choices[0].message.content
+    save_vision_description(image_bytes, vision_model, content)
+    return content
+
+
+def process_image(image_path, user=None):
+    """
+    Processa un'immagine usando OpenAI Vision per estrarne testo e contenuto.
+
+    Converte l'immagine in base64 e utilizza il modello gpt-4-vision per estrarre
+    testo visibile e generare una descrizione dettagliata dell'immagine. Questo
+    permette di includere il contenuto delle immagini nei documenti indicizzati.
+
+    Args:
+        image_path: Percorso completo dell'immagine
+        user: Oggetto User Django (opzionale)
+
+    Returns:
+        Document: Documento LangChain con il testo estratto dall'immagine
+    """
+    logger.debug(f"Elaborazione immagine: {image_path}")
+    try:
+        with open(image_path, "rb") as image_file:
+            content = describe_image_with_vision(image_file.read(), user)
+
         metadata = {"source": image_path, "type": "image"}
         return Document(page_content=content, metadata=metadata)
 
@@ -355,11 +422,178 @@ def process_image(image_path, user=None):
         )
 
 
+def load_image_document(image_path, user=None):
+    """
+    Estrae il contenuto di un'immagine con l'OCR locale, ricorrendo a Vision solo se necessario.
+
+    Se tesseract riconosce testo con confidenza e quantità sufficienti, il testo OCR
+    viene usato direttamente; altrimenti (foto, grafici, testo scarso) l'immagine viene
+    inviata alla Vision API come in precedenza.
+
+    Args:
+        image_path: Percorso completo dell'immagine
+        user: Oggetto User Django (opzionale)
+
+    Returns:
+        Document: Documento LangChain con il contenuto dell'immagine
+    """
+    try:
+        ocr_result = ocr_image_file(image_path)
+    except Exception as e:
+        logger.warning(f"OCR locale non riuscito per {image_path}: {str(e)}")
+        ocr_result = None
+
+    if is_ocr_result_reliable(ocr_result):
+        logger.info(f"🔤 Immagine {os.path.basename(image_path)} estratta con OCR locale "
+                    f"(confidenza {ocr_result['confidence']})")
+        return Document(page_content=ocr_result['text'], metadata={
+            "source": image_path, "type": "image", "extraction": "ocr",
+            "ocr_confidence": ocr_result['confidence']
+        })
+
+    return process_image(image_path, user)
+
+
+def add_ocr_pages(file_path, documents, user=None):
+    """
+    Completa un PDF con il testo delle pagine scansionate (senza testo estraibile).
+
+    Le pagine mancanti vengono elaborate con l'OCR locale in un pool di processi; solo
+    quelle con OCR poco affidabile vengono inviate alla Vision API, fino a
+    RAG_OCR_MAX_VISION_PAGES pagine per documento. Se tesseract non è disponibile le
+    pagine restano escluse, come in precedenza.
+
+    Args:
+        file_path: Percorso del PDF
+        documents: Pagine con testo restituite da load_pdf_documents
+        user: Oggetto User Django (opzionale)
+
+    Returns:
+        list: Pagine del PDF ordinate per numero di pagina
+    """
+    import fitz  # PyMuPDF
+
+    if documents:
+        total_pages = documents[0].metadata.get('total_pages', 0)
+        base_metadata = {key: value for key, value in documents[0].metadata.items() if key != 'page'}
+    else:
+        with fitz.open(file_path) as pdf:
+            total_pages = pdf.page_count
+        base_metadata = {'source': file_path, 'file_path': file_path, 'total_pages': total_pages}
+
+    missing_pages = sorted(set(range(total_pages)) - {doc.metadata.get('page') for doc in documents})
+    if not missing_pages:
+        return documents
+
+    ocr_results = ocr_pdf_pages(file_path, missing_pages)
+    max_vision_pages = getattr(settings, 'RAG_OCR_MAX_VISION_PAGES', 10)
+
+    # OCR eseguito ma poco affidabile: ricorri alla Vision API (con un limite per documento).
+    # Le pagine vuote sono escluse: non hanno contenuto da descrivere
+    vision_candidates = [page_number for page_number in missing_pages
+                         if ocr_results.get(page_number) is not None
+                         and not ocr_results[page_number].get('blank')
+                         and not is_ocr_result_reliable(ocr_results[page_number])][:max_vision_pages]
+
+    def describe_page(page_number):
+        try:
+            return page_number, describe_image_with_vision(render_pdf_page(file_path, page_number), user)
+        except Exception as e:
+            logger.error(f"Errore Vision sulla pagina {page_number} di {file_path}: {str(e)}")
+            return page_number, None
+        finally:
+            connections.close_all()
+
+    vision_results = {}
+    if vision_candidates:
+        with ThreadPoolExecutor(max_workers=VISION_MAX_CONCURRENCY) as executor:
+            vision_results = dict(executor.map(describe_page, vision_candidates))
+
+    for page_number in missing_pages:
+        result = ocr_results.get(page_number)
+        metadata = {**base_metadata, 'page': page_number}
+
+        if is_ocr_result_reliable(result):
+            documents.append(Document(page_content=result['text'], metadata={
+                **metadata, 'extraction': 'ocr', 'ocr_confidence': result['confidence']}))
+        elif vision_results.get(page_number):
+            documents.append(Document(page_content=vision_results[page_number],
+                                      metadata={**metadata, 'extraction': 'vision'}))
+        elif result and result['text'].strip():
+            # Testo OCR scarso ma presente: meglio di nessun contenuto
+            documents.append(Document(page_content=result['text'], metadata={
+                **metadata, 'extraction': 'ocr', 'ocr_confidence': result['confidence']}))
+
+    vision_pages = sum(1 for content in vision_results.values() if content)
+    blank_pages = sum(1 for result in ocr_results.values() if result and result.get('blank'))
+    logger.info(f"PDF {os.path.basename(file_path)}: {len(missing_pages)} pagine senza testo elaborate "
+                f"con OCR ({blank_pages} vuote, {vision_pages} inviate alla Vision API)")
+    return sorted(documents, key=lambda doc: doc.metadata.get('page', 0))
+
+
+def prefetch_image_documents(file_models):
+    """
+    Estrae in parallelo il contenuto delle immagini da indicizzare, popolando la cache del testo.
+
+    Le chiamate Vision sono indipendenti tra loro: eseguirle in parallelo (al più
+    RAG_VISION_MAX_CONCURRENCY alla volta) riduce il tempo di costruzione dell'indice.
+
+    Args:
+        file_models: Iterabile di ProjectFile da indicizzare
+    """
+    images = [file_model for file_model in file_models
+              if file_model.filename.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".bmp"))
+              and get_cached_parsed_document(file_model.file_hash, DOCUMENT_LOADER_VERSION) is None]
+    if len(images) < 2:
+        return
+
+    def load_image(file_model):
+        try:
+            load_document_cached(file_model.file_path, file_model.file_hash)
+        finally:
+            # I thread del pool aprono connessioni proprie: chiudile per non lasciarle appese
+            connections.close_all()
+
+    logger.info(f"🖼️ Estrazione parallela di {len(images)} immagini")
+    with ThreadPoolExecutor(max_workers=VISION_MAX_CONCURRENCY) as executor:
+        list(executor.map(load_image, images))
+
+
+# Versione dei loader di documenti: va incrementata quando cambia il modo in cui il testo
+# viene estratto, così la cache del testo estratto viene rigenerata
+DOCUMENT_LOADER_VERSION = 5
+
+
+def load_document_cached(file_path, file_hash=None):
+    """
+    Carica un documento riusando, se disponibile, il testo già estratto in precedenza.
+
+    Il testo estratto è salvato compresso per hash del file e versione dei loader,
+    quindi i file invariati (anche se caricati in altri progetti) non vengono
+    nuovamente analizzati durante le ricostruzioni dell'indice.
+
+    Args:
+        file_path: Percorso completo del file da caricare
+        file_hash: Hash SHA-256 del file (opzionale, senza hash la cache non viene usata)
+
+    Returns:
+        list: Lista di oggetti Document di LangChain
+    """
+    documents = get_cached_parsed_document(file_hash, DOCUMENT_LOADER_VERSION, file_path=file_path)
+    if documents is not None:
+        logger.info(f"♻️ Testo estratto in cache per {os.path.basename(file_path)} ({len(documents)} sezioni)")
+        return documents
+
+    documents = load_document(file_path)
+    save_parsed_document(file_hash, documents, DOCUMENT_LOADER_VERSION)
+    return documents
+
+
 def load_document(file_path):
     """
     Carica un singolo documento in base al suo tipo di file.
 
-    Supporta diversi formati come PDF, DOCX, PPT, immagini e testo plain.
+    Supporta diversi formati come PDF, DOCX, PPT, CSV/XLSX, Markdown/HTML, immagini e testo plain.
     Aggiunge metadati utili come nome del file e gestisce vari tipi di errori.
     Questa funzione è utilizzata durante la creazione degli indici vettoriali
     per i progetti.
@@ -375,36 +609,42 @@ def load_document(file_path):
     try:
         documents = []
 
-        # PDF: prova prima PyMuPDFLoader, se fallisce o non estrae contenuto, usa PDFMinerLoader
+        # PDF: estrazione pagina per pagina (in parallelo per i PDF grandi) con fallback per singola pagina
         if filename.lower().endswith(".pdf"):
             try:
                 logger.info(f"Caricamento PDF: {file_path}")
-                loader = PyMuPDFLoader(file_path)
-                documents = loader.load()
+                documents = load_pdf_documents(file_path)
+                # Pagine scansionate: OCR locale, Vision API solo se l'OCR non è affidabile
+                documents = add_ocr_pages(file_path, documents)
 
-                # Verifica se sono stati estratti contenuti
-                if not documents or all(not doc.page_content.strip() for doc in documents):
+                if not documents:
                     logger.warning(f"PDF caricato ma senza contenuto: {file_path}")
-                    logger.info(f"Tentativo con PDFMinerLoader: {file_path}")
-                    loader = PDFMinerLoader(file_path)
-                    documents = loader.load()
 
                 logger.info(f"PDF caricato con successo: {len(documents)} pagine")
             except Exception as pdf_error:
                 logger.error(f"Errore specifico per PDF {file_path}: {str(pdf_error)}")
                 raise
-        # Documenti Word
+        # Documenti Word: estrattore nativo python-docx, Unstructured come fallback (e per .doc)
         elif filename.lower().endswith((".docx", ".doc")):
-            loader = UnstructuredWordDocumentLoader(file_path)
-            documents = loader.load()
-        # Presentazioni PowerPoint
+            documents = load_office_documents(file_path)
+            if not documents:
+                from langchain_community.document_loaders import UnstructuredWordDocumentLoader
+                loader = UnstructuredWordDocumentLoader(file_path)
+                documents = loader.load()
+        # Presentazioni PowerPoint: estrattore nativo python-pptx, Unstructured come fallback (e per .ppt)
         elif filename.lower().endswith((".pptx", ".ppt")):
-            loader = UnstructuredPowerPointLoader(file_path)
-            documents = loader.load()
-        # Immagini: usa OpenAI Vision API
+            documents = load_office_documents(file_path)
+            if not documents:
+                from langchain_community.document_loaders import UnstructuredPowerPointLoader
+                loader = UnstructuredPowerPointLoader(file_path)
+                documents = loader.load()
+        # Immagini: OCR locale, con OpenAI Vision API come fallback
         elif filename.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".bmp")):
-            image_doc = process_image(file_path)
+            image_doc = load_image_document(file_path)
             documents = [image_doc]
+        # Tabelle (CSV/XLSX, lette a blocchi) e markup (Markdown/HTML, suddivisi per titolo)
+        elif filename.lower().endswith((".csv", ".xlsx", ".md", ".markdown", ".html", ".htm")):
+            documents = load_structured_documents(file_path)
         # File di testo
         elif filename.lower().endswith((".txt")):
             loader = TextLoader(file_path)
@@ -1007,6 +1247,10 @@ def create_project_rag_chain(project=None, docs=None, force_rebuild=False):
 
             # PARTE 5: ELABORAZIONE DEI FILE
             # -----------------------------
+            # Le immagini possono richiedere chiamate Vision: estraile in anticipo in parallelo
+            # (con limite di concorrenza); il ciclo seguente le ritrova nella cache del testo estratto
+            prefetch_image_documents(files_to_embed)
+
             for doc_model in files_to_embed:
                 logger.debug(f"Caricamento documento per embedding: {doc_model.filename}")
 
@@ -1026,7 +1270,8 @@ def create_project_rag_chain(project=None, docs=None, force_rebuild=False):
                     })
 
                 # IMPORTANTE: Carichiamo SEMPRE il documento per l'indice
-                langchain_docs = load_document(doc_model.file_path)
+                # (il testo dei file invariati proviene dalla cache del testo estratto, senza ri-analisi)
+                langchain_docs = load_document_cached(doc_model.file_path, doc_model.file_hash)
 
                 if langchain_docs:
                     any_content_available = True  # Abbiamo trovato contenuto
@@ -1042,6 +1287,10 @@ def create_project_rag_chain(project=None, docs=None, force_rebuild=False):
                 else:
                     logger.warning(f"Nessun contenuto estratto dal file {doc_model.filename}")
 
+            # La cache del testo estratto è cresciuta: riportala entro la dimensione massima
+            if files_to_embed:
+                prune_parsed_text_cache()
+
             # PARTE 6: ELABORAZIONE DEGLI URL
             # -------------------------------
             # PARTE 6: ELABORAZIONE DEGLI URL
@@ -1244,8 +1493,16 @@ def create_project_rag_chain(project=None, docs=None, force_rebuild=False):
 
     # Dividi i documenti in chunk
     logger.info(f"Chunking con parametri: size={chunk_size}, overlap={chunk_overlap}")
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    split_docs = splitter.split_documents(docs)
+    # add_start_index permette di riunire in fase di query i chunk adiacenti della stessa fonte
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              add_start_index=True)
+    # I gruppi di righe delle tabelle vengono suddivisi per riga, ripetendo l'intestazione in ogni chunk
+    split_docs = []
+    for doc in docs:
+        if doc.metadata.get('content_kind') == TABLE_CONTENT_KIND:
+            split_docs.extend(split_row_group_document(doc, chunk_size))
+        else:
+            split_docs.extend(splitter.split_documents([doc]))
 
     # Filtra documenti vuoti
     split_docs = [doc for doc in split_docs if doc.page_content.strip() != ""]
@@ -1481,6 +1738,15 @@ def create_project_rag_chain(project=None, docs=None, force_rebuild=False):
                     except ProjectNote.DoesNotExist:
                         logger.warning(f"Nota con ID {note_id} non trovata durante l'aggiornamento")
 
+            # PARTE 16-BIS: RIASSUNTI PRECALCOLATI DELLE FONTI
+            # ----------------------------------------------
+            # Usati dal percorso map-reduce delle domande generiche; vengono generati in background,
+            # e solo le fonti nuove o modificate generano una chiamata al modello
+            if getattr(settings, 'RAG_PRECOMPUTE_SUMMARIES', True):
+                indexed_sources = {doc.metadata.get('source') for doc in docs if doc.metadata.get('source')}
+                if indexed_sources:
+                    schedule_project_summaries_backfill(project, indexed_sources)
+
     # PARTE 17: CREAZIONE DELLA CATENA RAG
     # -----------------------------------
     result = create_retrieval_qa_chain(vectordb, project)
@@ -1488,9 +1754,109 @@ def create_project_rag_chain(project=None, docs=None, force_rebuild=False):
         logger.error("Impossibile creare la catena RAG, controllo dei componenti necessario")
     return result
 
+# Progetti con un completamento dei riassunti in corso e fonti in attesa di essere riassunte
+_summaries_backfill_lock = threading.Lock()
+_summaries_backfill_pending = {}
+
+
+def backfill_project_summaries(project, sources):
+    """
+    Genera i riassunti delle fonti indicate che ne sono prive o che sono cambiate.
+
+    Le fonti vengono ricaricate (il testo dei file proviene dalla cache del testo estratto),
+    così i riassunti non rallentano né l'indicizzazione né le domande.
+
+    Args:
+        project: Oggetto Project
+        sources: Chiavi delle fonti da riassumere (percorso del file, 'url_<id>', 'note_<id>')
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectFile, ProjectNote, ProjectURL
+
+    docs = []
+    for project_file in ProjectFile.objects.filter(project=project, file_path__in=sources):
+        try:
+            file_docs = load_document_cached(project_file.file_path, project_file.file_hash)
+        except Exception as e:
+            logger.error(f"Errore nel caricamento di {project_file.filename} per il riassunto: {str(e)}")
+            continue
+        for doc in file_docs:
+            doc.metadata['source'] = project_file.file_path
+            doc.metadata.setdefault('filename', project_file.filename)
+        docs.extend(file_docs)
+
+    url_ids = [int(source[4:]) for source in sources if source.startswith('url_')]
+    for url_model in ProjectURL.objects.filter(project=project, id__in=url_ids):
+        docs.append(Document(
+            page_content=url_model.content or f"URL: {url_model.url}\nTitolo: {url_model.title or 'Nessun titolo'}",
+            metadata={
+                "source": f"url_{url_model.id}",
+                "type": "url",
+                "title": url_model.title or "URL senza titolo",
+                "url_id": url_model.id,
+                "url": url_model.url,
+                "filename": f"URL: {url_model.title or url_model.url}",
+            }
+        ))
+
+    note_ids = [int(source[5:]) for source in sources if source.startswith('note_')]
+    for note in ProjectNote.objects.filter(project=project, id__in=note_ids):
+        docs.append(Document(
+            page_content=note.content or "",
+            metadata={
+                "source": f"note_{note.id}",
+                "type": "note",
+                "title": note.title or "Nota senza titolo",
+                "note_id": note.id,
+                "filename": f"Nota: {note.title or 'Senza titolo'}"
+            }
+        ))
+
+    engine_settings = get_project_LLM_settings(project)
+    update_project_summaries(project, docs, create_project_llm(project, engine_settings),
+                             engine_settings['model'], sources=sources)
+
+
+def schedule_project_summaries_backfill(project, sources):
+    """
+    Riassume in un thread separato le fonti indicate (un thread per progetto alla volta).
+
+    Se per il progetto è già in corso un completamento, le fonti vengono accodate e
+    riassunte dallo stesso thread al termine del lotto corrente.
+
+    Args:
+        project: Oggetto Project
+        sources: Chiavi delle fonti da riassumere
+    """
+    with _summaries_backfill_lock:
+        running = project.id in _summaries_backfill_pending
+        _summaries_backfill_pending.setdefault(project.id, set()).update(sources)
+        if running:
+            return
+
+    def run():
+        try:
+            while True:
+                with _summaries_backfill_lock:
+                    batch = _summaries_backfill_pending.get(project.id)
+                    if not batch:
+                        _summaries_backfill_pending.pop(project.id, None)
+                        return
+                    _summaries_backfill_pending[project.id] = set()
+                try:
+                    logger.info(f"📝 Riassunto in background di {len(batch)} fonti per il progetto {project.id}")
+                    backfill_project_summaries(project, batch)
+                except Exception as e:
+                    logger.error(f"Errore nel completamento dei riassunti del progetto {project.id}: {str(e)}")
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 # Modifica alla funzione get_answer_from_project per risolvere i problemi di rilevamento note e URL
 
-def get_answer_from_project(project, question):
+def get_answer_from_project(project, question, use_history=True):
     """
     Ottiene una risposta dal sistema RAG per una domanda su un progetto specifico.
 
@@ -1501,41 +1867,46 @@ def get_answer_from_project(project, question):
     Args:
         project: Oggetto Project
         question: Stringa contenente la domanda dell'utente
+        use_history: Se True, le domande di follow-up vengono riscritte usando il
+            riassunto della conversazione corrente del progetto
 
     Returns:
         dict: Dizionario con la risposta, le fonti utilizzate e metadati aggiuntivi
     """
     # Importazione ritardata per evitare cicli di importazione
-    from profiles.models import ProjectFile, ProjectNote, ProjectRAGConfiguration, ProjectURL, ProjectIndexStatus
+    from profiles.models import ProjectFile, ProjectNote, ProjectURL, ProjectIndexStatus
 
     logger.info(f"Elaborazione domanda RAG per progetto {project.id}: '{question[:50]}...'")
 
     try:
-        # ===== STEP 1: OTTIENI TUTTI I CONTENUTI DEL PROGETTO SENZA FILTRI =====
-        # Ottieni tutti i file, le note e gli URL senza filtri
-        all_project_files = ProjectFile.objects.filter(project=project)
-        all_project_notes = ProjectNote.objects.filter(project=project)
-        all_project_urls = ProjectURL.objects.filter(project=project)
+        # ===== STEP 1: OTTIENI LO SNAPSHOT DEI CONTENUTI DEL PROGETTO =====
+        # Un'unica query aggregata (in cache) sostituisce i conteggi separati su file, note e URL
+        snapshot = get_project_content_snapshot(project)
 
         # ===== STEP 2: SINCRONIZZA I FLAG DI INCLUSIONE/INDICIZZAZIONE =====
         # Verifica se ci sono URL non indicizzati e note non incluse
-        unindexed_urls = all_project_urls.filter(is_indexed=False)
-        unincluded_notes = all_project_notes.filter(is_included_in_rag=False)
+        unindexed_urls_count = snapshot['urls']['pending']
+        unincluded_notes_count = snapshot['notes']['total'] - snapshot['notes']['included']
 
-        if unindexed_urls.exists():
-            logger.info(f"Trovati {unindexed_urls.count()} URL non indicizzati. Forzando l'aggiornamento...")
-            all_project_urls.update(is_indexed=True, last_indexed_at=timezone.now())
+        if unindexed_urls_count:
+            logger.info(f"Trovati {unindexed_urls_count} URL non indicizzati. Forzando l'aggiornamento...")
+            ProjectURL.objects.filter(project=project).update(is_indexed=True, last_indexed_at=timezone.now())
 
-        if unincluded_notes.exists():
-            logger.info(f"Trovate {unincluded_notes.count()} note non incluse nel RAG. Forzando l'inclusione...")
-            all_project_notes.update(is_included_in_rag=True, last_indexed_at=timezone.now())
+        if unincluded_notes_count:
+            logger.info(f"Trovate {unincluded_notes_count} note non incluse nel RAG. Forzando l'inclusione...")
+            ProjectNote.objects.filter(project=project).update(is_included_in_rag=True, last_indexed_at=timezone.now())
+
+        if unindexed_urls_count or unincluded_notes_count:
+            # update() non emette segnali: ricalcola esplicitamente lo snapshot
+            invalidate_project_content_snapshot(project)
+            snapshot = get_project_content_snapshot(project)
 
         # ===== STEP 3: VERIFICA L'INDICE VETTORIALE =====
         # Usa ProjectIndexStatus per capire se l'indice esiste realmente
         index_status, _ = ProjectIndexStatus.objects.get_or_create(project=project)
         index_exists = index_status.index_exists
         index_path = os.path.join(settings.MEDIA_ROOT, 'projects', str(project.user.id), str(project.id),
-                                  "vector_index")
+                                  f"vector_index_{project.id}")
 
         # Verifica fisica dell'indice
         if not index_exists and os.path.exists(index_path):
@@ -1545,30 +1916,28 @@ def get_answer_from_project(project, question):
             index_exists = True
 
         # ===== STEP 4: OTTIENI I CONTENUTI DA USARE PER LA RICERCA =====
-        # Ora ottieni i file, note e URL con i filtri appropriati
+        # I queryset sono lazy: vengono valutati solo se servono gli elenchi (STEP 11-13),
+        # mentre i conteggi provengono dallo snapshot
         project_files = ProjectFile.objects.filter(project=project, is_embedded=True)
         project_notes = ProjectNote.objects.filter(project=project, is_included_in_rag=True)
         project_urls = ProjectURL.objects.filter(project=project, is_included_in_rag=True)
-
-        #: Log per verificare quali URL vengono effettivamente utilizzate
-        logger.info(f"🔍 URL disponibili per la ricerca: {project_urls.count()}")
-        for url in project_urls:
-            logger.info(f"   - {url.url} (is_included_in_rag: {url.is_included_in_rag})")
-
+        files_count = snapshot['files']['indexed']
+        notes_count = snapshot['notes']['included']
+        urls_count = snapshot['urls']['included']
 
         # Logga i contenuti disponibili
         logger.info(
-            f"Contenuti reali: {all_project_files.count()} file, {all_project_notes.count()} note, {all_project_urls.count()} URL totali")
+            f"Contenuti reali: {snapshot['files']['total']} file, {snapshot['notes']['total']} note, {snapshot['urls']['total']} URL totali")
         logger.info(
-            f"Di cui: {project_files.count()} file embedded, {project_notes.count()} note incluse, {project_urls.count()} URL indicizzati")
+            f"Di cui: {files_count} file embedded, {notes_count} note incluse, {urls_count} URL inclusi nella ricerca")
 
         # ===== STEP 5: VERIFICA SE L'INDICE NECESSITA AGGIORNAMENTO =====
         update_needed = check_project_index_update_needed(project)
+        has_content = bool(files_count or notes_count or urls_count)
 
         # Se non ci sono contenuti o l'indice necessita di aggiornamento o non esiste
-        if (
-                not project_files.exists() and not project_notes.exists() and not project_urls.exists()) or update_needed or not index_exists:
-            if not project_files.exists() and not project_notes.exists() and not project_urls.exists():
+        if not has_content or update_needed or not index_exists:
+            if not has_content:
                 logger.info("Nessun contenuto indicizzato rilevato nel progetto. Verificando indice...")
             elif not index_exists:
                 logger.info("Indice vettoriale non trovato. Creazione necessaria.")
@@ -1585,165 +1954,113 @@ def get_answer_from_project(project, question):
                 return {"answer": "Non è stato possibile creare un indice per i contenuti di questo progetto.",
                         "sources": []}
 
+            # Memorizza la catena appena costruita per le domande successive
+            cache_project_rag_chain(project, qa_chain)
+
             # Dopo l'aggiornamento, rileggi i contenuti disponibili
-            project_files = ProjectFile.objects.filter(project=project, is_embedded=True)
-            project_notes = ProjectNote.objects.filter(project=project, is_included_in_rag=True)
+            snapshot = get_project_content_snapshot(project)
             project_urls = ProjectURL.objects.filter(project=project, is_indexed=True)
+            files_count = snapshot['files']['indexed']
+            notes_count = snapshot['notes']['included']
+            urls_count = snapshot['urls']['indexed']
         else:
             logger.info("Indice aggiornato, utilizzando indice esistente")
-            qa_chain = create_project_rag_chain(project=project, docs=[])
+            qa_chain = get_project_rag_chain(project)
             if qa_chain is None:
                 return {"answer": "Non è stato possibile caricare l'indice esistente per questo progetto.",
                         "sources": []}
 
         # ===== STEP 6: VERIFICA FINALE DEI CONTENUTI DISPONIBILI =====
         # Verifica finale se il progetto ha contenuti dopo l'aggiornamento
-        if not project_files.exists() and not project_notes.exists() and not project_urls.exists():
+        if not files_count and not notes_count and not urls_count:
             return {
                 "answer": "Il progetto non contiene documenti, note attive o URL indicizzati. Aggiungi alcuni contenuti o prova ad aggiornare l'indice.",
                 "sources": []
             }
 
         logger.info(
-            f"Documenti disponibili: {project_files.count()} file, {project_notes.count()} note, {project_urls.count()} URL")
+            f"Documenti disponibili: {files_count} file, {notes_count} note, {urls_count} URL")
 
         # ===== STEP 7: CONFIGURAZIONE MOTORE LLM =====
-        # Ottieni informazioni sul motore LLM usato dal progetto
-        try:
-            engine_info = get_project_LLM_settings(project)
-            logger.info(
-                f"Utilizzando motore {engine_info['provider'].name if engine_info['provider'] else 'openai'} "
-                f"- {engine_info['model']} per il progetto {project.id}"
-            )
-        except Exception as e:
-            logger.warning(f"Impossibile determinare il motore del progetto: {str(e)}")
-            # Usa engine_info di fallback
-            engine_info = get_project_LLM_settings(None)
-
-        # ===== STEP 8: ANALISI DEL TIPO DI DOMANDA =====
-        # Verifica se la domanda è generica
-        is_generic_question = any(term in question.lower() for term in [
-            'tutti i documenti', 'ogni documento', 'riassumi tutti',
-            'riassumi i punti principali di tutti', 'all documents',
-            'every document', 'summarize all', 'tutti i file',
-            'each document', 'riassumere tutti', 'summarize everything',
-            'tutti gli url', 'tutte le pagine web', 'tutte le pagine',
-            'tutti i siti', 'all websites', 'all urls', 'all pages'
-        ])
-
-        # Verifica se la domanda è specifica per gli URL
-        is_url_question = any(term in question.lower() for term in [
-            'url', 'sito web', 'pagina web', 'website', 'web page',
-            'link', 'http', 'https', 'www', 'siti internet', 'web',
-            'navigato', 'navigati', 'crawlati', 'esplorati'
-        ])
-
-        # Verifica se la domanda è specifica per le note
-        is_note_question = any(term in question.lower() for term in [
-            'nota', 'note', 'appunti', 'note personali', 'annotazioni',
-            'memo', 'promemoria', 'testo', 'testi', 'contenuto personale'
-        ])
-
-        # ===== STEP 9: CONFIGURAZIONE TEMPORANEA PER LA QUERY =====
-        # Gestisci le domande specifiche con configurazioni temporanee
-        original_config = None
-        temp_config_modified = False
-
-        if is_generic_question or is_url_question or is_note_question:
-            type_msg = "generica"
-            if is_url_question:
-                type_msg = "specifica per URL"
-            elif is_note_question:
-                type_msg = "specifica per note"
-
-            logger.info(f"Rilevata domanda {type_msg}")
-
-            # Salva la configurazione originale e modifica temporaneamente
+        # Le impostazioni sono già state lette alla compilazione della catena (vedi create_retrieval_qa_chain)
+        chain_settings = qa_chain.metadata or {}
+        engine_info = chain_settings.get('engine_settings')
+        rag_settings = chain_settings.get('rag_settings')
+        if engine_info is None or rag_settings is None:
             try:
-                project_config = ProjectRAGConfiguration.objects.get(project=project)
-
-                # Salva i valori originali
-                original_config = {
-                    'similarity_top_k': project_config.similarity_top_k,
-                    'mmr_lambda': project_config.mmr_lambda,
-                    'retriever_type': project_config.retriever_type,
-                    'similarity_threshold': project_config.similarity_threshold
-                }
-
-                # Modifica temporaneamente per domande specifiche
-                if is_generic_question:
-                    project_config.similarity_top_k = 20  # Più documenti per domande generiche
-                    project_config.mmr_lambda = 0.1  # Più diversità per domande generiche
-                    project_config.retriever_type = 'mmr'  # Forza l'uso di MMR per diversità
-                    project_config.similarity_threshold = 0.6
-                elif is_url_question:
-                    project_config.similarity_top_k = 12
-                    project_config.mmr_lambda = 0.3
-                    project_config.retriever_type = 'mmr'
-                    project_config.similarity_threshold = 0.5  # Più permissivo per URL
-                elif is_note_question:
-                    project_config.similarity_top_k = 8
-                    project_config.mmr_lambda = 0.4
-                    project_config.retriever_type = 'mmr'
-                    project_config.similarity_threshold = 0.5  # Più permissivo per note
-
-                project_config.save()
+                engine_info = get_project_LLM_settings(project)
+            except Exception as e:
+                logger.warning(f"Impossibile determinare il motore del progetto: {str(e)}")
+                # Usa engine_info di fallback
+                engine_info = get_project_LLM_settings(None)
+            rag_settings = get_project_RAG_settings(project)
+        logger.info(
+            f"Utilizzando motore {engine_info['provider'].name if engine_info['provider'] else 'openai'} "
+            f"- {engine_info['model']} per il progetto {project.id}"
+        )
 
-                temp_config_modified = True
-                logger.info("Configurazione temporanea applicata per domanda speciale")
+        # ===== STEP 7-BIS: RISCRITTURA DELLE DOMANDE DI FOLLOW-UP =====
+        # Il riassunto compresso della conversazione (dimensione fissa) rende autonoma la domanda
+        standalone_question = question
+        if use_history:
+            history = get_conversation_history(project)
+            if history:
+                standalone_question = rewrite_followup_question(
+                    question, history, qa_chain.combine_documents_chain.llm_chain.llm)
+
+        # ===== STEP 8: PIANIFICAZIONE DELLA QUERY =====
+        # Il planner classifica la domanda e produce il piano di recupero (filtri, k, budget, catena)
+        context_budget = chain_settings.get('context_budget') or compute_context_token_budget(
+            engine_info, build_rag_prompt_template(rag_settings))
+        vectordb = get_chain_vectorstore(qa_chain)
+
+        # Il map-reduce sui riassunti è usato solo se ogni fonte inclusa ha il suo riassunto;
+        # la copertura viene verificata solo per le domande generiche: le fonti mancanti
+        # vengono riassunte in background e nel frattempo si usa il recupero
+        summaries = {}
+
+        def summaries_available():
+            nonlocal summaries
+            active_summaries, missing_sources, retry_sources = get_project_summaries_coverage(project)
+            if retry_sources and getattr(settings, 'RAG_PRECOMPUTE_SUMMARIES', True):
+                schedule_project_summaries_backfill(project, retry_sources)
+            if missing_sources:
+                return False
+            summaries = active_summaries
+            return bool(summaries)
+
+        plan = plan_query(
+            standalone_question,
+            rag_settings,
+            context_budget,
+            snapshot=snapshot,
+            embeddings=getattr(vectordb, 'embeddings', None),
+            summaries_available=summaries_available
+        )
 
-            except Exception as e:
-                logger.error(f"Errore nella modifica della configurazione: {str(e)}")
+        is_generic_question = plan['question_type'] == QUESTION_TYPE_GENERIC
+        is_url_question = plan['question_type'] == QUESTION_TYPE_URL
+        is_note_question = plan['question_type'] == QUESTION_TYPE_NOTE
 
-        # ===== STEP 10: ESECUZIONE DELLA RICERCA =====
-        # Esegui la ricerca e ottieni la risposta
+        # ===== STEP 9: ESECUZIONE DELLA RICERCA =====
+        # Esegui il piano e ottieni la risposta
         logger.info(f"Eseguendo ricerca su indice vettoriale del progetto {project.id}")
         start_time = time.time()
 
         try:
-            # Modifica la query in base al tipo di domanda
-            if is_generic_question:
-                enhanced_question = f"""
-                {question}
-
-                IMPORTANTE: Per favore assicurati di:
-                1. Identificare TUTTI i documenti disponibili nel contesto (file, note e URL)
-                2. Riassumere i punti principali di CIASCUNA fonte
-                3. Citare esplicitamente il nome/URL di ogni fonte quando presenti le sue informazioni
-                4. Organizzare la risposta per fonte, non per argomento
-                """
-                result = qa_chain.invoke(enhanced_question)
-            elif is_url_question:
-                # Per domande specifiche sugli URL, enfatizza i contenuti web
-                enhanced_question = f"""
-                {question}
-
-                IMPORTANTE: Questa domanda riguarda contenuti web/URL. Per favore:
-                1. Presta particolare attenzione alle fonti di tipo URL nel contesto
-                2. Quando citi informazioni da URL, indica esplicitamente il link della fonte
-                3. Se la domanda si riferisce a un URL specifico, concentrati principalmente su quello
-                """
-                result = qa_chain.invoke(enhanced_question)
-            elif is_note_question:
-                # Per domande specifiche sulle note
-                enhanced_question = f"""
-                {question}
-
-                IMPORTANTE: Questa domanda riguarda le note del progetto. Per favore:
-                1. Presta particolare attenzione alle fonti di tipo "nota" nel contesto
-                2. Quando citi informazioni da una nota, indica esplicitamente il titolo della nota
-                3. Se la domanda si riferisce a una nota specifica, concentrati principalmente su quella
-                """
-                result = qa_chain.invoke(enhanced_question)
-            else:
-                # Migliora la query generale
-                enhanced_question = f"""
-                {question}
-
-                Cerca le informazioni più rilevanti nel contesto fornito. 
-                Se trovi informazioni nelle note o negli URL inclusi nel contesto, includili nella risposta.
-                """
-                result = qa_chain.invoke(enhanced_question)
+            result = None
+            if plan['chain_type'] == CHAIN_TYPE_SUMMARIES:
+                # Domanda generica: map-reduce sui riassunti precalcolati di tutte le fonti
+                if summaries:
+                    result = answer_from_summaries(
+                        plan['search_query'],
+                        summaries,
+                        qa_chain.combine_documents_chain.llm_chain.llm,
+                        plan['context_budget'],
+                        engine_info['model']
+                    )
+            if result is None:
+                result = execute_retrieval_plan(qa_chain, plan)
 
             processing_time = round(time.time() - start_time, 2)
             logger.info(f"Ricerca completata in {processing_time} secondi")
@@ -1753,13 +2070,6 @@ def get_answer_from_project(project, question):
             error_message = str(auth_error)
             logger.error(f"Errore di autenticazione API {engine_info['type']}: {error_message}")
 
-            if temp_config_modified and original_config:
-                # Ripristina la configurazione originale
-                project_config = ProjectRAGConfiguration.objects.get(project=project)
-                for key, value in original_config.items():
-                    setattr(project_config, key, value)
-                project_config.save()
-
             return {
                 "answer": f"Si è verificato un errore di autenticazione con l'API {engine_info['type'].upper()}. " +
                           "Verifica che le chiavi API siano corrette nelle impostazioni del motore IA.",
@@ -1771,13 +2081,6 @@ def get_answer_from_project(project, question):
         except Exception as query_error:
             logger.error(f"Errore durante l'esecuzione della query: {str(query_error)}")
 
-            if temp_config_modified and original_config:
-                # Ripristina la configurazione originale
-                project_config = ProjectRAGConfiguration.objects.get(project=project)
-                for key, value in original_config.items():
-                    setattr(project_config, key, value)
-                project_config.save()
-
             # Verifica se l'errore è di autenticazione API anche se non catturato direttamente
             if "invalid_api_key" in str(query_error) or "authentication" in str(query_error).lower():
                 return {
@@ -1795,19 +2098,7 @@ def get_answer_from_project(project, question):
                 "engine_info": engine_info  # Includi info sul motore per debugging
             }
 
-        # ===== STEP 11: RIPRISTINO DELLA CONFIGURAZIONE ORIGINALE =====
-        # Ripristina la configurazione originale se era stata modificata
-        if temp_config_modified and original_config:
-            try:
-                project_config = ProjectRAGConfiguration.objects.get(project=project)
-                for key, value in original_config.items():
-                    setattr(project_config, key, value)
-                project_config.save()
-                logger.info("Configurazione originale ripristinata")
-            except Exception as e:
-                logger.error(f"Errore nel ripristinare la configurazione originale: {str(e)}")
-
-        # ===== STEP 12: ANALISI DELLE FONTI TROVATE =====
+        # ===== STEP 10: ANALISI DELLE FONTI TROVATE =====
         # Log fonti trovate
         source_documents = result.get('source_documents', [])
         logger.info(f"Trovate {len(source_documents)} fonti pertinenti")
@@ -1851,35 +2142,35 @@ def get_answer_from_project(project, question):
         logger.info(f"URL unici nei risultati: {len(unique_urls)}")
         logger.info(f"Note uniche nei risultati: {len(unique_notes)}")
 
-        # ===== STEP 13: GESTIONE DI COPERTURA INCOMPLETA =====
+        # ===== STEP 11: GESTIONE DI COPERTURA INCOMPLETA =====
         # Verifica per domande generiche se abbiamo una buona copertura
         if is_generic_question:
             warning_msg = ""
 
             # Verifica la copertura dei file
-            if project_files.count() > 0 and len(unique_files) < project_files.count():
-                all_project_files = [f.filename for f in project_files]
+            if files_count > 0 and len(unique_files) < files_count:
+                all_project_files = list(project_files.values_list('filename', flat=True))
                 missing_files = [f for f in all_project_files if f not in unique_files]
                 if missing_files:
-                    warning_msg += f"\n\nNOTA: La risposta include informazioni da {len(unique_files)} dei {project_files.count()} documenti disponibili nel progetto."
+                    warning_msg += f"\n\nNOTA: La risposta include informazioni da {len(unique_files)} dei {files_count} documenti disponibili nel progetto."
                     warning_msg += f" Documenti non inclusi: {', '.join(missing_files[:5])}" + (
                         "..." if len(missing_files) > 5 else "")
 
             # Verifica la copertura degli URL
-            if project_urls.count() > 0 and len(unique_urls) < project_urls.count():
-                all_project_urls = [u.url for u in project_urls]
+            if urls_count > 0 and len(unique_urls) < urls_count:
+                all_project_urls = list(project_urls.values_list('url', flat=True))
                 missing_urls = [u for u in all_project_urls if u not in unique_urls]
                 if missing_urls:
-                    warning_msg += f"\n\nNOTA: La risposta include informazioni da {len(unique_urls)} dei {project_urls.count()} URL disponibili nel progetto."
+                    warning_msg += f"\n\nNOTA: La risposta include informazioni da {len(unique_urls)} dei {urls_count} URL disponibili nel progetto."
                     warning_msg += f" URL non inclusi: {', '.join([u[:30] + '...' for u in missing_urls[:3]])}" + (
                         "..." if len(missing_urls) > 3 else "")
 
             # Verifica la copertura delle note
-            if project_notes.count() > 0 and len(unique_notes) < project_notes.count():
+            if notes_count > 0 and len(unique_notes) < notes_count:
                 all_project_notes = [n.title or f"Nota {n.id}" for n in project_notes]
                 missing_notes = [n for n in all_project_notes if n not in unique_notes]
                 if missing_notes:
-                    warning_msg += f"\n\nNOTA: La risposta include informazioni da {len(unique_notes)} delle {project_notes.count()} note disponibili nel progetto."
+                    warning_msg += f"\n\nNOTA: La risposta include informazioni da {len(unique_notes)} delle {notes_count} note disponibili nel progetto."
                     warning_msg += f" Note non incluse: {', '.join(missing_notes[:3])}" + (
                         "..." if len(missing_notes) > 3 else "")
 
@@ -1887,45 +2178,45 @@ def get_answer_from_project(project, question):
             if warning_msg and result.get('result'):
                 result['result'] = result['result'] + warning_msg
 
-        # ===== STEP 14: AVVISI PER DOMANDE SPECIFICHE SENZA RISULTATI =====
+        # ===== STEP 12: AVVISI PER DOMANDE SPECIFICHE SENZA RISULTATI =====
         # Se è una domanda URL, aggiungi un avviso se non sono stati trovati risultati da URL
-        if is_url_question and not unique_urls and project_urls.count() > 0:
+        if is_url_question and not unique_urls and urls_count > 0:
             url_warning = "\n\nNOTA: La tua domanda sembra riguardare contenuti web, ma non sono stati trovati URL pertinenti nella ricerca."
             if result.get('result'):
                 result['result'] = result['result'] + url_warning
 
         # Se è una domanda sulle note, aggiungi un avviso se non sono state trovate note pertinenti
-        if is_note_question and not unique_notes and project_notes.count() > 0:
+        if is_note_question and not unique_notes and notes_count > 0:
             note_warning = "\n\nNOTA: La tua domanda sembra riguardare le note del progetto, ma non sono state trovate note pertinenti nella ricerca."
             if result.get('result'):
                 result['result'] = result['result'] + note_warning
 
-        # ===== STEP 15: GESTIONE MANCANZA DI RISULTATI =====
+        # ===== STEP 13: GESTIONE MANCANZA DI RISULTATI =====
         # Nessun risultato? Fornisci una risposta più utile
         if not source_documents:
-            if is_url_question and project_urls.exists():
+            if is_url_question and urls_count:
                 # Se non troviamo fonti ma sappiamo che ci sono URL
                 custom_answer = f"Non ho trovato informazioni specifiche su '{question}' negli URL indicizzati. "
-                custom_answer += f"Ho trovato {project_urls.count()} URL nel progetto: "
+                custom_answer += f"Ho trovato {urls_count} URL nel progetto: "
 
                 # Elenca gli URL nel progetto
                 url_list = [f"- {url.url} ({url.title or 'Nessun titolo'})" for url in project_urls[:5]]
-                if project_urls.count() > 5:
-                    url_list.append(f"... e altri {project_urls.count() - 5} URL")
+                if urls_count > 5:
+                    url_list.append(f"... e altri {urls_count - 5} URL")
 
                 custom_answer += "\n" + "\n".join(url_list)
                 custom_answer += "\n\nProva a formulare la domanda in modo diverso o a specificare quale URL ti interessa."
 
                 result = {"result": custom_answer, "source_documents": []}
-            elif is_note_question and project_notes.exists():
+            elif is_note_question and notes_count:
                 # Se non troviamo fonti ma sappiamo che ci sono note
                 custom_answer = f"Non ho trovato informazioni specifiche su '{question}' nelle note del progetto. "
-                custom_answer += f"Ho trovato {project_notes.count()} note nel progetto: "
+                custom_answer += f"Ho trovato {notes_count} note nel progetto: "
 
                 # Elenca le note nel progetto
                 note_list = [f"- {note.title or f'Nota {note.id}'}" for note in project_notes[:5]]
-                if project_notes.count() > 5:
-                    note_list.append(f"... e altre {project_notes.count() - 5} note")
+                if notes_count > 5:
+                    note_list.append(f"... e altre {notes_count - 5} note")
 
                 custom_answer += "\n" + "\n".join(note_list)
                 custom_answer += "\n\nProva a formulare la domanda in modo diverso o a specificare quale nota ti interessa."
@@ -1936,7 +2227,7 @@ def get_answer_from_project(project, question):
                     "result": "Non ho trovato informazioni pertinenti alla tua domanda nei contenuti disponibili.",
                     "source_documents": []}
 
-        # ===== STEP 16: FORMATTAZIONE DELLA RISPOSTA FINALE =====
+        # ===== STEP 14: FORMATTAZIONE DELLA RISPOSTA FINALE =====
         # Formatta risposta
         response = {
             "answer": result.get('result', 'Nessuna risposta trovata.'),
@@ -1946,6 +2237,7 @@ def get_answer_from_project(project, question):
                 "model": engine_info['model']
             },
             "processing_time": processing_time,
+            "standalone_question": standalone_question if standalone_question != question else None,
             "source_stats": {
                 "files": len(unique_files),
                 "urls": len(unique_urls),
@@ -2019,14 +2311,169 @@ def get_answer_from_project(project, question):
 
 
 
-def create_retrieval_qa_chain(vectordb, project=None):
+def update_project_conversation_history(project, conversation):
     """
-    Configura e crea una catena RetrievalQA con le impostazioni appropriate.
+    Aggiorna in background il riassunto della conversazione dopo una risposta.
+
+    Usa il modello della catena RAG del progetto (in cache), così l'aggiornamento
+    non richiede di ricostruire la catena.
+
+    Args:
+        project: Oggetto Project
+        conversation: Oggetto ProjectConversation appena salvato
     """
-    # Ottieni le impostazioni del motore e RAG dal database
-    engine_settings = get_project_LLM_settings(project)
-    rag_settings = get_project_RAG_settings(project)
+    qa_chain = get_cached_project_rag_chain(project)
+    if qa_chain is None:
+        logger.debug(f"Nessuna catena in cache per il progetto {project.id}: riassunto non aggiornato")
+        return
+    engine_settings = (qa_chain.metadata or {}).get('engine_settings') or {}
+    schedule_conversation_summary_update(
+        conversation,
+        qa_chain.combine_documents_chain.llm_chain.llm,
+        engine_settings.get('model') or "gpt-3.5-turbo"
+    )
+
+
+# ==============================================================================
+# CACHE DELLE CATENE RAG COMPILATE
+# ==============================================================================
+
+# Catene RetrievalQA già costruite per progetto: {project_id: (versione, catena)}.
+# Le catene contengono client HTTP e indici FAISS in memoria, quindi la cache è
+# necessariamente locale al processo (non serializzabile nella cache di Django).
+_rag_chain_cache = TTLCache(
+    maxsize=getattr(settings, 'RAG_CHAIN_CACHE_SIZE', 32),
+    ttl=getattr(settings, 'RAG_CHAIN_CACHE_TTL', 3600)
+)
+_rag_chain_cache_lock = threading.Lock()
+
+
+def get_project_rag_chain_version(project):
+    """
+    Calcola la versione della configurazione da cui dipende la catena RAG di un progetto.
+
+    La versione combina, con un'unica query, i timestamp di aggiornamento della
+    configurazione LLM (motore e prompt di sistema inclusi), della configurazione
+    RAG (preset incluso), delle chiavi API dell'utente e lo stato dell'indice
+    vettoriale. Qualsiasi modifica a uno di questi elementi produce una versione
+    diversa e quindi la ricostruzione della catena.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        tuple: Versione della configurazione (confrontabile per uguaglianza)
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from django.db.models import Max
+    from profiles.models import Project
+
+    version = Project.objects.filter(pk=project.pk).annotate(
+        api_keys_updated=Max('user__api_keys__updated_at')
+    ).values_list(
+        'llm_config__updated_at',
+        'llm_config__engine__updated_at',
+        'llm_config__default_system_prompt__updated_at',
+        'project_config__updated_at',
+        'project_config__rag_preset__updated_at',
+        'index_status__last_updated',
+        'index_status__index_hash',
+        'api_keys_updated',
+    ).first()
+
+    return tuple(version) if version else ()
+
+
+def get_cached_project_rag_chain(project, version=None):
+    """
+    Restituisce la catena RAG in cache per il progetto se la versione corrisponde.
+
+    Args:
+        project: Oggetto Project
+        version: Versione già calcolata (opzionale, altrimenti viene calcolata)
+
+    Returns:
+        RetrievalQA: Catena in cache, o None se assente o non più valida
+    """
+    if version is None:
+        version = get_project_rag_chain_version(project)
+
+    with _rag_chain_cache_lock:
+        entry = _rag_chain_cache.get(project.id)
+
+    if entry and entry[0] == version:
+        logger.debug(f"♻️ Catena RAG in cache riutilizzata per progetto {project.id}")
+        return entry[1]
+    return None
+
+
+def cache_project_rag_chain(project, chain, version=None):
+    """
+    Salva una catena RAG compilata nella cache del processo.
+
+    Args:
+        project: Oggetto Project
+        chain: Catena RetrievalQA da memorizzare
+        version: Versione della configurazione (opzionale, altrimenti viene calcolata)
+    """
+    if chain is None:
+        return
+    if version is None:
+        version = get_project_rag_chain_version(project)
+
+    with _rag_chain_cache_lock:
+        _rag_chain_cache[project.id] = (version, chain)
+    logger.debug(f"Catena RAG salvata in cache per progetto {project.id}")
+
+
+def invalidate_project_rag_chain(project):
+    """
+    Rimuove dalla cache la catena RAG compilata di un progetto.
 
+    Args:
+        project: Oggetto Project o ID del progetto
+    """
+    project_id = getattr(project, 'id', project)
+    with _rag_chain_cache_lock:
+        _rag_chain_cache.pop(project_id, None)
+
+
+def get_project_rag_chain(project):
+    """
+    Restituisce la catena RAG del progetto per l'indice esistente, riusando quella in cache.
+
+    Sul percorso caldo (configurazione e indice invariati) evita di ricaricare
+    l'indice FAISS dal disco e di ricostruire prompt, retriever, client LLM e
+    catena: resta solo una query per calcolare la versione.
+
+    Args:
+        project: Oggetto Project
+
+    Returns:
+        RetrievalQA: Catena RAG pronta all'uso, o None in caso di errore
+    """
+    version = get_project_rag_chain_version(project)
+    qa_chain = get_cached_project_rag_chain(project, version)
+    if qa_chain is not None:
+        return qa_chain
+
+    logger.info(f"Catena RAG non in cache o non aggiornata per progetto {project.id}, ricostruzione")
+    qa_chain = create_project_rag_chain(project=project, docs=[])
+    # La costruzione può aggiornare lo stato dell'indice: ricalcola la versione
+    cache_project_rag_chain(project, qa_chain)
+    return qa_chain
+
+
+def build_rag_prompt_template(rag_settings):
+    """
+    Costruisce il template del prompt RAG a partire dalle impostazioni del progetto.
+
+    Args:
+        rag_settings: Dizionario restituito da get_project_RAG_settings
+
+    Returns:
+        str: Template con le variabili {context} e {question}
+    """
     # Configurazione prompt di sistema
     template = rag_settings['system_prompt']
     logger.info(f"Generazione prompt (lunghezza base: {len(template)} caratteri)")
@@ -2058,46 +2505,128 @@ def create_retrieval_qa_chain(vectordb, project=None):
     # Aggiungi la parte finale del prompt per indicare il contesto e la domanda
     template += "\n\nCONTESTO:\n{context}\n\nDOMANDA: {question}\nRISPOSTA:"
 
-    # Crea l'oggetto prompt
-    PROMPT = PromptTemplate(
-        template=template,
-        input_variables=["context", "question"]
-    )
+    return template
 
-    # Configurazione del retriever per domande generiche
-    logger.info(f"Configurazione retriever: {rag_settings['retriever_type']}")
 
-    # Aumenta il numero di documenti recuperati per domande generiche
-    k_value = rag_settings['similarity_top_k']
-
-    # Se la domanda è generica (contiene parole come 'tutti', 'ogni', 'riassumi tutto'),
-    # aumenta il numero di documenti recuperati
-    # Questo dovrebbe essere gestito dinamicamente, ma per ora usiamo un valore più alto
-    k_value_for_generic = k_value * 2  # Raddoppia il numero di documenti per domande generiche
-
-    if rag_settings['retriever_type'] == 'mmr':
-        # Modifica lambda_mult per aumentare la diversità nelle domande generiche
-        retriever = vectordb.as_retriever(
-            search_type="mmr",
-            search_kwargs={
-                "k": k_value_for_generic,  # Usa più documenti
-                "fetch_k": k_value_for_generic * 3,  # Recupera ancora più documenti per la selezione MMR
-                "lambda_mult": 0.5  # Riduci lambda per maggiore diversità (era 0.7)
-            }
-        )
-    elif rag_settings['retriever_type'] == 'similarity_score_threshold':
-        retriever = vectordb.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={
-                "k": k_value_for_generic,
-                "score_threshold": rag_settings['similarity_threshold'] * 0.8  # Abbassa la soglia per domande generiche
-            }
-        )
+def build_project_retriever(vectordb, rag_settings, engine_settings, plan):
+    """
+    Costruisce la pipeline di recupero (vector store → rerank opzionale → budget di token)
+    che esegue un piano prodotto dal query planner.
+
+    Args:
+        vectordb: Indice FAISS del progetto
+        rag_settings: Dizionario restituito da get_project_RAG_settings
+        engine_settings: Dizionario restituito da get_project_LLM_settings
+        plan: Piano di recupero (vedi dashboard.rag_query_planner)
+
+    Returns:
+        BaseRetriever: Retriever pronto all'uso
+    """
+    search_type = plan['search_type']
+    k = plan['k']
+    fetch_k = plan['fetch_k']
+
+    # Rerank opzionale: il retriever recupera più candidati e il re-scorer conserva i migliori N
+    rerank_model = rag_settings.get('rerank_model')
+    if rerank_model:
+        top_n = rag_settings['rerank_top_n']
+        k = max(k, top_n * RERANK_CANDIDATE_MULTIPLIER)
+        fetch_k = max(fetch_k, k * 3)
+
+    search_kwargs = {"k": k}
+    if plan.get('filter'):
+        search_kwargs["filter"] = plan['filter']
+        search_kwargs["fetch_k"] = fetch_k
+
+    if search_type == 'mmr':
+        search_kwargs.update({"fetch_k": fetch_k, "lambda_mult": plan['lambda_mult']})
+        retriever = vectordb.as_retriever(search_type="mmr", search_kwargs=search_kwargs)
+    elif search_type == 'similarity_score_threshold':
+        search_kwargs["score_threshold"] = plan['score_threshold']
+        retriever = vectordb.as_retriever(search_type="similarity_score_threshold", search_kwargs=search_kwargs)
     else:  # default: similarity
-        retriever = vectordb.as_retriever(
-            search_kwargs={"k": k_value_for_generic}
+        retriever = vectordb.as_retriever(search_kwargs=search_kwargs)
+
+    if rerank_model:
+        logger.info(f"Rerank attivo ({rerank_model}): {k} candidati → top {rag_settings['rerank_top_n']}")
+        retriever = RerankRetriever(
+            base_retriever=retriever,
+            model_name=rerank_model,
+            top_n=rag_settings['rerank_top_n']
         )
 
+    # Limita il contesto al budget di token del piano:
+    # i chunk vengono deduplicati, uniti se adiacenti e inseriti fino a esaurimento del budget
+    return TokenBudgetRetriever(
+        base_retriever=retriever,
+        token_budget=plan['context_budget'],
+        model_name=engine_settings['model']
+    )
+
+
+def get_chain_vectorstore(qa_chain):
+    """
+    Restituisce il vector store usato da una catena RAG, risalendo i retriever annidati.
+
+    Args:
+        qa_chain: Catena RetrievalQA creata da create_retrieval_qa_chain
+
+    Returns:
+        FAISS o None
+    """
+    retriever = getattr(qa_chain, 'retriever', None)
+    while retriever is not None and not hasattr(retriever, 'vectorstore'):
+        retriever = getattr(retriever, 'base_retriever', None)
+    return getattr(retriever, 'vectorstore', None)
+
+
+def execute_retrieval_plan(qa_chain, plan):
+    """
+    Esegue un piano di recupero sulla catena RAG compilata del progetto.
+
+    Il recupero usa i parametri del piano (k, fetch_k, filtri, budget) sullo stesso indice
+    della catena; la generazione riusa la catena di combinazione dei documenti già compilata.
+
+    Args:
+        qa_chain: Catena RetrievalQA creata da create_retrieval_qa_chain
+        plan: Piano di recupero prodotto da plan_query
+
+    Returns:
+        dict: {'result': risposta, 'source_documents': documenti usati come contesto}
+    """
+    chain_settings = qa_chain.metadata or {}
+    vectordb = get_chain_vectorstore(qa_chain)
+
+    if vectordb is None or not chain_settings:
+        # Catena senza metadati (es. creata altrove): usa il recupero predefinito
+        return qa_chain.invoke(plan['generation_question'])
+
+    retriever = build_project_retriever(
+        vectordb, chain_settings['rag_settings'], chain_settings['engine_settings'], plan
+    )
+    source_documents = retriever.invoke(plan['search_query'])
+
+    output = qa_chain.combine_documents_chain.invoke({
+        'input_documents': source_documents,
+        'question': plan['generation_question'],
+    })
+    return {'result': output.get('output_text', ''), 'source_documents': source_documents}
+
+
+def create_project_llm(project=None, engine_settings=None):
+    """
+    Crea il client LLM configurato per il progetto, con la chiave API del provider.
+
+    Args:
+        project: Oggetto Project (opzionale)
+        engine_settings: Impostazioni già lette con get_project_LLM_settings (opzionale)
+
+    Returns:
+        ChatOpenAI: Modello LLM pronto all'uso
+    """
+    if engine_settings is None:
+        engine_settings = get_project_LLM_settings(project)
+
     # Ottieni la chiave API appropriata
     if project and engine_settings['provider'] and engine_settings['provider'].name.lower() == 'openai':
         api_key = get_openai_api_key(project.user)
@@ -2106,8 +2635,7 @@ def create_retrieval_qa_chain(vectordb, project=None):
     else:
         api_key = get_openai_api_key(project.user if project else None)
 
-    # Configura il modello LLM
-    llm = ChatOpenAI(
+    return ChatOpenAI(
         model=engine_settings['model'],
         temperature=engine_settings['temperature'],
         max_tokens=engine_settings['max_tokens'],
@@ -2115,6 +2643,39 @@ def create_retrieval_qa_chain(vectordb, project=None):
         openai_api_key=api_key
     )
 
+
+def create_retrieval_qa_chain(vectordb, project=None):
+    """
+    Configura e crea una catena RetrievalQA con le impostazioni appropriate.
+
+    Le impostazioni LLM/RAG e il budget di contesto vengono salvati nei metadati della
+    catena, così le domande successive possono eseguire i piani di query senza rileggerli.
+    """
+    # Ottieni le impostazioni del motore e RAG dal database
+    engine_settings = get_project_LLM_settings(project)
+    rag_settings = get_project_RAG_settings(project)
+
+    template = build_rag_prompt_template(rag_settings)
+
+    # Crea l'oggetto prompt
+    PROMPT = PromptTemplate(
+        template=template,
+        input_variables=["context", "question"]
+    )
+
+    # Budget di contesto derivato dalla finestra di contesto del motore
+    context_budget = compute_context_token_budget(engine_settings, template)
+    logger.info(f"Budget di contesto: {context_budget} token (modello {engine_settings['model']})")
+
+    # Configurazione del retriever con il piano standard
+    logger.info(f"Configurazione retriever: {rag_settings['retriever_type']}")
+    retriever = build_project_retriever(
+        vectordb, rag_settings, engine_settings, build_default_plan(rag_settings, context_budget)
+    )
+
+    # Configura il modello LLM
+    llm = create_project_llm(project, engine_settings)
+
     # Crea la catena RAG
     qa = RetrievalQA.from_chain_type(
         llm=llm,
@@ -2123,6 +2684,11 @@ def create_retrieval_qa_chain(vectordb, project=None):
         chain_type_kwargs={"prompt": PROMPT},
         return_source_documents=True
     )
+    qa.metadata = {
+        'engine_settings': engine_settings,
+        'rag_settings': rag_settings,
+        'context_budget': context_budget,
+    }
 
     return qa
 
@@ -2303,9 +2869,12 @@ def handle_project_file_upload(project, file, project_dir, file_path=None):
     Gestisce il caricamento di un file per un progetto.
 
     Gestisce tutto il processo di caricamento: crea le directory necessarie,
-    salva il file, registra i metadati nel database e aggiorna l'indice vettoriale.
-    Supporta anche la gestione di file con nomi duplicati. Questa funzione è
-    fondamentale per l'aggiunta di documenti ai progetti.
+    salva il file calcolandone l'hash durante la scrittura, registra i metadati
+    nel database e aggiorna l'indice vettoriale. Se il progetto contiene già un
+    file con lo stesso contenuto, il caricamento viene scartato e viene restituito
+    il file esistente (senza nuova indicizzazione). Supporta anche la gestione di
+    file con nomi duplicati. Questa funzione è fondamentale per l'aggiunta di
+    documenti ai progetti.
 
     Args:
         project: Oggetto Project
@@ -2314,11 +2883,8 @@ def handle_project_file_upload(project, file, project_dir, file_path=None):
         file_path: Percorso completo del file (opzionale)
 
     Returns:
-        ProjectFile: Il file del progetto creato
+        ProjectFile: Il file del progetto creato, o quello esistente con lo stesso contenuto
     """
-    # Importazione ritardata per evitare cicli di importazione
-    from profiles.models import ProjectFile
-
     # Determina il percorso del file
     if file_path is None:
         if hasattr(file, 'name') and file.name:
@@ -2330,6 +2896,52 @@ def handle_project_file_upload(project, file, project_dir, file_path=None):
             file_path = os.path.join(project_dir, random_name)
             logger.warning(f"Nome file non disponibile, generato nome casuale: {random_name}")
 
+    # Salva il file in un file temporaneo calcolando l'hash in un unico passaggio
+    tmp_path, file_hash, file_size = save_uploaded_file_with_hash(file, os.path.dirname(file_path))
+
+    original_name = file.name if hasattr(file, 'name') and file.name else None
+    try:
+        project_file, _ = register_project_file_upload(project, tmp_path, file_hash, file_size, file_path,
+                                                       original_name=original_name)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return project_file
+
+
+def register_project_file_upload(project, tmp_path, file_hash, file_size, file_path, original_name=None):
+    """
+    Completa il caricamento di un file già salvato in un file temporaneo con hash noto.
+
+    Scarta il contenuto se è già presente nel progetto, altrimenti sposta il file nel
+    percorso definitivo (rinominandolo in caso di nomi duplicati), lo collega all'archivio
+    dei blob, registra il ProjectFile, pianifica le anteprime e aggiorna l'indice vettoriale.
+    È usata sia dai caricamenti in un'unica richiesta sia dai caricamenti a blocchi.
+
+    Args:
+        project: Oggetto Project
+        tmp_path: Percorso del file temporaneo (nella stessa directory o sullo stesso filesystem)
+        file_hash: Hash SHA-256 del contenuto
+        file_size: Dimensione in byte
+        file_path: Percorso definitivo desiderato
+        original_name: Nome originale del file, usato per determinarne il tipo (opzionale)
+
+    Returns:
+        tuple: (ProjectFile, bool) - Il file registrato (o quello esistente con lo stesso
+               contenuto) e un flag che indica se è stato creato
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from profiles.models import ProjectFile
+
+    # Contenuto già presente nel progetto: scarta il caricamento e restituisci il file esistente
+    existing_file = find_duplicate_project_file(project, file_hash, file_size)
+    if existing_file is not None:
+        os.remove(tmp_path)
+        logger.info(f"♻️ Caricamento di {os.path.basename(file_path)} ignorato: contenuto identico a "
+                    f"{existing_file.filename} (ID: {existing_file.id})")
+        return existing_file, False
+
     # Gestione dei file con lo stesso nome
     if os.path.exists(file_path):
         filename = os.path.basename(file_path)
@@ -2342,41 +2954,39 @@ def handle_project_file_upload(project, file, project_dir, file_path=None):
             file_path = os.path.join(os.path.dirname(file_path), new_name)
             counter += 1
 
-    # Crea la directory se non esiste
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    os.replace(tmp_path, file_path)
 
-    # Salva il file
-    with open(file_path, 'wb+') as destination:
-        for chunk in file.chunks():
-            destination.write(chunk)
-
-    # Ottieni metadati del file
-    file_stats = os.stat(file_path)
-    file_size = file_stats.st_size
-
-    # Determina il tipo di file
-    if hasattr(file, 'name') and file.name:
-        file_type = os.path.splitext(file.name)[1].lower().lstrip('.')
-    else:
-        file_type = os.path.splitext(file_path)[1].lower().lstrip('.')
-
-    # Calcola l'hash del file
-    file_hash = compute_file_hash(file_path)
-
-    # Crea il record nel database
-    project_file = ProjectFile.objects.create(
-        project=project,
-        filename=os.path.basename(file_path),
-        file_path=file_path,
-        file_type=file_type,
-        file_size=file_size,
-        file_hash=file_hash,
-        is_embedded=False,
-        last_indexed_at=None
-    )
+    try:
+        # Condivide il contenuto fisico con gli altri progetti che hanno caricato lo stesso file
+        link_file_to_blob(file_path, file_hash)
+
+        # Determina il tipo di file
+        file_type = os.path.splitext(original_name or file_path)[1].lower().lstrip('.')
+
+        # Crea il record nel database
+        project_file = ProjectFile.objects.create(
+            project=project,
+            filename=os.path.basename(file_path),
+            file_path=file_path,
+            file_type=file_type,
+            file_size=file_size,
+            file_hash=file_hash,
+            is_embedded=False,
+            last_indexed_at=None
+        )
+    except Exception:
+        # Il file torna nel percorso temporaneo (come copia autonoma, non collegata al blob):
+        # il chiamante può ritentare la registrazione o eliminarlo, senza file orfani nel progetto
+        os.replace(file_path, tmp_path)
+        detach_file_from_blob(tmp_path)
+        raise
 
     logger.debug(f"File caricato: {file_path}")
 
+    # Anteprime delle prime pagine generate in background, pronte per la visualizzazione delle fonti
+    schedule_file_previews(file_path, file_hash)
+
     # Aggiorna l'indice vettoriale
     try:
         logger.info(f"Aggiornamento dell'indice vettoriale dopo caricamento file")
@@ -2385,7 +2995,7 @@ def handle_project_file_upload(project, file, project_dir, file_path=None):
     except Exception as e:
         logger.error(f"Errore nell'aggiornamento dell'indice vettoriale: {str(e)}")
 
-    return project_file
+    return project_file, True
 
 
 
@@ -0,0 +1,136 @@
+"""
+Supporto alle chiamate Vision API per l'indicizzazione delle immagini.
+Questo modulo si occupa di:
+- Ridimensionare le immagini alla risoluzione effettivamente usata dal modello prima dell'invio
+- Memorizzare le descrizioni per hash del contenuto, così le ri-indicizzazioni non ripagano le immagini
+- Limitare il numero di chiamate Vision contemporanee nel processo
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+# Configurazione logger
+logger = logging.getLogger(__name__)
+
+# Il modello ridimensiona le immagini entro 2048x2048 e poi con il lato corto a 768 px:
+# inviare risoluzioni maggiori aumenta solo dimensione della richiesta e latenza
+VISION_MAX_LONG_SIDE = getattr(settings, 'RAG_VISION_MAX_LONG_SIDE', 2048)
+VISION_MAX_SHORT_SIDE = getattr(settings, 'RAG_VISION_MAX_SHORT_SIDE', 768)
+VISION_JPEG_QUALITY = 85
+
+# Numero massimo di chiamate Vision contemporanee
+VISION_MAX_CONCURRENCY = getattr(settings, 'RAG_VISION_MAX_CONCURRENCY', 4)
+
+# Versione del prompt/pipeline Vision (fa parte della chiave di cache)
+VISION_CACHE_VERSION = 2
+
+_vision_semaphore = threading.BoundedSemaphore(VISION_MAX_CONCURRENCY)
+
+
+def prepare_vision_image(image_bytes):
+    """
+    Ridimensiona e ricomprime un'immagine per la Vision API.
+
+    Args:
+        image_bytes: Contenuto originale dell'immagine
+
+    Returns:
+        tuple: (contenuto da inviare, tipo MIME); l'originale se non è decodificabile
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            width, height = image.size
+            scale = min(1.0,
+                        VISION_MAX_LONG_SIDE / max(width, height),
+                        VISION_MAX_SHORT_SIDE / min(width, height))
+            if scale >= 1.0 and image.format == 'JPEG':
+                return image_bytes, "image/jpeg"
+
+            if scale < 1.0:
+                image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))),
+                                     Image.LANCZOS)
+            if image.mode == 'P' and 'transparency' in image.info:
+                image = image.convert('RGBA')
+            if image.mode in ('RGBA', 'LA', 'PA'):
+                # JPEG non ha trasparenza: le aree trasparenti diventerebbero nere, vanno su sfondo bianco
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image.convert('RGBA'), mask=image.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=VISION_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logger.debug(f"Immagine non ridimensionabile, inviata invariata: {str(e)}")
+        return image_bytes, "image/jpeg"
+
+    prepared = output.getvalue()
+    logger.debug(f"Immagine per Vision: {width}x{height} → scala {scale:.2f}, "
+                 f"{len(image_bytes) // 1024} KB → {len(prepared) // 1024} KB")
+    return prepared, "image/jpeg"
+
+
+def _vision_cache_path(content_hash, model_name):
+    """
+    Percorso della descrizione in cache per un'immagine e un modello.
+    """
+    cache_dir = os.path.join(settings.MEDIA_ROOT, 'vision_cache', content_hash[:2])
+    safe_model = model_name.replace('/', '_')
+    return os.path.join(cache_dir, f"{content_hash}_{safe_model}_v{VISION_CACHE_VERSION}.json")
+
+
+def get_cached_vision_description(image_bytes, model_name):
+    """
+    Restituisce la descrizione già calcolata per un'immagine con lo stesso contenuto.
+
+    Args:
+        image_bytes: Contenuto originale dell'immagine
+        model_name: Modello Vision usato
+
+    Returns:
+        str: Descrizione in cache, o None
+    """
+    cache_path = _vision_cache_path(hashlib.sha256(image_bytes).hexdigest(), model_name)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)['content']
+    except Exception:
+        return None
+
+
+def save_vision_description(image_bytes, model_name, content):
+    """
+    Salva la descrizione di un'immagine per hash del contenuto (scrittura atomica).
+
+    Args:
+        image_bytes: Contenuto originale dell'immagine
+        model_name: Modello Vision usato
+        content: Descrizione restituita dal modello
+    """
+    cache_path = _vision_cache_path(hashlib.sha256(image_bytes).hexdigest(), model_name)
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'content': content}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        logger.debug(f"Impossibile salvare la descrizione Vision in cache: {str(e)}")
+
+
+def vision_call_slot():
+    """
+    Restituisce il semaforo che limita le chiamate Vision contemporanee (da usare con `with`).
+    """
+    return _vision_semaphore
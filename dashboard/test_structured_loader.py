@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from dashboard.rag_structured_loader import iter_csv_row_groups, split_row_group_document
+
+
+class RowGroupSplitTests(SimpleTestCase):
+    """Verifica che i chunk delle tabelle ripetano sempre l'intestazione"""
+
+    def test_split_csv_chunks_start_with_header(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, 'data.csv')
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write("codice;descrizione\n")
+                for index in range(40):
+                    f.write(f"{index};articolo numero {index}\n")
+
+            groups = list(iter_csv_row_groups(file_path, rows_per_group=20))
+            chunks = [chunk for group in groups for chunk in split_row_group_document(group, chunk_size=120)]
+
+        self.assertGreater(len(chunks), len(groups))
+        for chunk in chunks:
+            self.assertTrue(chunk.page_content.startswith("codice | descrizione\n"))
+            self.assertEqual(chunk.page_content.count("\n"), chunk.metadata['row_end'] - chunk.metadata['row_start'] + 1)
@@ -24,8 +24,15 @@ urlpatterns = [
     path('projects', views.project, name='project'),  # Supporto per POST senza ID
     path('project/<int:project_id>/details/', views.project_details, name='project_details'),
     path('serve_project_file/<int:file_id>/', views.serve_project_file, name='serve_project_file'),
+    path('serve_project_file/<int:file_id>/preview/<int:page_number>/', views.serve_project_file_preview, name='serve_project_file_preview'),
     path('project/<int:project_id>/config/', views.project_config, name='project_config'),
     path('api/projects/<int:project_id>/urls/<int:url_id>/toggle-inclusion/', views.toggle_url_inclusion, name='toggle_url_inclusion'),
+    path('api/projects/<int:project_id>/batch-ask/', views.batch_ask_questions, name='batch_ask_questions'),
+    path('api/search/', views.federated_search, name='federated_search'),
+    path('api/projects/<int:project_id>/uploads/', views.chunked_upload_init, name='chunked_upload_init'),
+    path('api/projects/<int:project_id>/uploads/<str:upload_id>/', views.chunked_upload_status, name='chunked_upload_status'),
+    path('api/projects/<int:project_id>/uploads/<str:upload_id>/parts/<int:part_number>/', views.chunked_upload_part, name='chunked_upload_part'),
+    path('api/projects/<int:project_id>/uploads/<str:upload_id>/complete/', views.chunked_upload_complete, name='chunked_upload_complete'),
 
     # Crawler
     path('projects/<int:project_id>/website_crawl/', views.website_crawl, name='website_crawl'),
@@ -1,23 +1,18 @@
 import base64
 import datetime
-import hashlib
-import io
 import os
-import fitz  # PyMuPDF
 import pytesseract
 from PIL import Image
-from PyPDF2 import PdfReader
 from bs4 import BeautifulSoup
 from django.conf import settings
 
+from dashboard.rag_pdf_loader import iter_pdf_pages
+
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Estrae il testo da un file PDF"""
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
+    # join evita le copie quadratiche della concatenazione ripetuta con +=
+    return "".join(page.page_content for page in iter_pdf_pages(pdf_path))
 
 
 
@@ -117,73 +112,34 @@ def process_user_files(user_dir, documents_list, search_query='', owner_username
 
 
 
-def extract_page_image(file_path, page_number=0, max_size=(800, 800)):
+def extract_page_image(file_path, page_number=0, max_size=(800, 800), file_hash=None):
     """
-    Estrae l'immagine di una pagina da un documento PDF.
+    Estrae l'immagine (anteprima WebP) di una pagina da un documento PDF o da un'immagine.
+
+    Le anteprime sono in cache per hash del contenuto: se l'hash non viene passato,
+    viene letto dal ProjectFile corrispondente o calcolato dal file.
 
     Args:
         file_path: Percorso del file PDF
         page_number: Numero di pagina da estrarre (0-based)
         max_size: Dimensione massima dell'immagine (larghezza, altezza)
+        file_hash: Hash SHA-256 del file (opzionale)
 
     Returns:
         str: Path dell'immagine estratta o None in caso di errore
     """
-    try:
-        # Crea hash del percorso del file e della pagina per un nome univoco
-        file_hash = hashlib.md5(file_path.encode()).hexdigest()
-        cache_filename = f"page_{file_hash}_{page_number}.png"
-
-        # Directory per la cache delle immagini
-        cache_dir = os.path.join(settings.MEDIA_ROOT, 'document_images')
-        os.makedirs(cache_dir, exist_ok=True)
-
-        cache_path = os.path.join(cache_dir, cache_filename)
-
-        # Se l'immagine è già nella cache, restituisci il percorso
-        if os.path.exists(cache_path):
-            return cache_path
-
-        # Controlla il tipo di file
-        _, ext = os.path.splitext(file_path)
-        ext = ext.lower()
-
-        if ext == '.pdf':
-            # Apri il file PDF
-            doc = fitz.open(file_path)
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_previews import render_page_preview
+    from dashboard.rag_document_utils import compute_file_hash
+    from profiles.models import ProjectFile
 
-            # Verifica che il numero di pagina sia valido
-            if page_number < 0 or page_number >= len(doc):
-                return None
-
-            # Ottieni la pagina
-            page = doc[page_number]
-
-            # Renderizza la pagina ad alta risoluzione
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-
-            # Converti in immagine PIL
-            img = Image.open(io.BytesIO(pix.tobytes("png")))
-
-            # Ridimensiona se necessario
-            if img.width > max_size[0] or img.height > max_size[1]:
-                img.thumbnail(max_size)
-
-            # Salva l'immagine
-            img.save(cache_path)
-            return cache_path
-
-        elif ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp']:
-            # Per i file immagine, crea semplicemente una copia ridimensionata
-            with Image.open(file_path) as img:
-                # Ridimensiona se necessario
-                if img.width > max_size[0] or img.height > max_size[1]:
-                    img.thumbnail(max_size)
-                # Salva l'immagine
-                img.save(cache_path)
-                return cache_path
+    try:
+        if file_hash is None:
+            file_hash = ProjectFile.objects.filter(file_path=file_path).values_list('file_hash', flat=True).first()
+        if not file_hash:
+            file_hash = compute_file_hash(file_path)
 
-        return None
+        return render_page_preview(file_path, file_hash, page_number, tuple(max_size))
     except Exception as e:
         print(f"Errore nell'estrazione dell'immagine: {str(e)}")
         return None
@@ -208,7 +164,9 @@ def get_document_image_b64(file_path, page_number=0):
         # Determina il mime type
         mime_type = "image/png"  # Default
         _, ext = os.path.splitext(image_path)
-        if ext.lower() == '.jpg' or ext.lower() == '.jpeg':
+        if ext.lower() == '.webp':
+            mime_type = "image/webp"
+        elif ext.lower() == '.jpg' or ext.lower() == '.jpeg':
             mime_type = "image/jpeg"
         elif ext.lower() == '.gif':
             mime_type = "image/gif"
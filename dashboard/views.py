@@ -10,7 +10,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, FileResponse, HttpResponseNotModified
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
@@ -23,14 +23,19 @@ from dashboard.dashboard_console import get_dashboard_data, update_cache_statist
 # Importazioni dai moduli RAG
 from dashboard.rag_utils import (
     create_project_rag_chain, handle_add_note, handle_delete_note, handle_update_note,
-    handle_toggle_note_inclusion, get_answer_from_project, handle_project_file_upload,
+    handle_toggle_note_inclusion, get_answer_from_project,
+    update_project_conversation_history,
 )
+from dashboard.rag_document_utils import get_project_content_snapshot, invalidate_project_content_snapshot
+from dashboard.file_serving import build_file_response
+from dashboard.bulk_ingest import ingest_uploaded_files
 # Modelli
 from profiles.models import (
     Project, ProjectFile, ProjectNote, ProjectConversation, AnswerSource,
     LLMEngine, UserAPIKey, LLMProvider, RagTemplateType, RagDefaultSettings,
     ProjectRAGConfiguration,
     ProjectLLMConfiguration, ProjectIndexStatus, DefaultSystemPrompts, ProjectURL,
+    DEFAULT_RERANK_TOP_N, UserSubscription,
 )
 
 # Get logger
@@ -458,6 +463,67 @@ def project_details(request, project_id):
 #################################################### SINO A QUI CONTROLLATO ################################
 
 
+def _add_bulk_upload_messages(request, result):
+    """
+    Riporta all'utente l'esito di un caricamento in blocco.
+
+    Args:
+        request: HttpRequest
+        result: Risultato di ingest_uploaded_files
+    """
+    messages.success(request, f"{len(result['added'])} files uploaded successfully.")
+    if result['duplicates']:
+        messages.info(request, f"{result['duplicates']} files skipped: identical content already in the project.")
+    if result['skipped']:
+        messages.info(request, f"{result['skipped']} hidden or system files skipped.")
+    for error in result['errors']:
+        messages.error(request, error)
+
+
+def _rag_quota_error(user, queries_count):
+    """
+    Verifica che l'abbonamento dell'utente consenta le query RAG richieste da un'API massiva.
+
+    Le query oltre quelle incluse nel piano sono fatturate come eccedenza: batch e ricerca
+    federata vengono rifiutate solo se il piano non prevede un prezzo per le query extra,
+    oppure se supererebbero il tetto di query extra mensili (RAG_EXTRA_QUERIES_HARD_CAP).
+
+    Args:
+        user: Utente che esegue le query
+        queries_count: Numero di query RAG che la richiesta eseguirà
+
+    Returns:
+        JsonResponse: Risposta di errore se il limite non lo consente, altrimenti None
+    """
+    try:
+        subscription = UserSubscription.objects.select_related('plan').get(user=user)
+    except UserSubscription.DoesNotExist:
+        return None
+
+    remaining = subscription.get_remaining_rag_queries()
+    if queries_count <= remaining:
+        return None
+
+    hard_cap = getattr(settings, 'RAG_EXTRA_QUERIES_HARD_CAP', None)
+    if subscription.plan.extra_rag_query_price > 0:
+        if hard_cap is None:
+            return None
+        # Query extra già eseguite nel mese più quelle extra di questa richiesta
+        extra_used = max(subscription.current_month_rag_queries - subscription.plan.monthly_rag_queries, 0)
+        available = remaining + max(hard_cap - extra_used, 0)
+        if queries_count <= available:
+            return None
+    else:
+        available = remaining
+
+    logger.warning(f"⚠️ Limite di query RAG raggiunto per l'utente {user.id}: "
+                   f"richieste {queries_count}, disponibili {available}")
+    return JsonResponse({'status': 'error',
+                         'message': f'Limite mensile di query RAG insufficiente: '
+                                    f'{available} query disponibili, {queries_count} richieste.'},
+                        status=403)
+
+
 def project(request, project_id=None):
     """
     Vista principale per la gestione completa di un progetto.
@@ -537,7 +603,8 @@ def project(request, project_id=None):
 
                             # Verifica configurazione RAG attuale
                             try:
-                                rag_config = ProjectRAGConfiguration.objects.get(project=project)
+                                rag_config = ProjectRAGConfiguration.objects.select_related(
+                                    'rag_preset__template_type').get(project=project)
                                 current_preset = rag_config.rag_preset
                                 if current_preset:
                                     logger.info(
@@ -550,12 +617,10 @@ def project(request, project_id=None):
                                 logger.warning(f"Impossibile determinare la configurazione RAG: {str(config_error)}")
 
                             # Verifica risorse disponibili (file, note, URL) prima di processare la query
-                            project_files = ProjectFile.objects.filter(project=project)
-                            project_notes = ProjectNote.objects.filter(project=project, is_included_in_rag=True)
-                            project_urls = ProjectURL.objects.filter(project=project, is_indexed=True)
+                            snapshot = get_project_content_snapshot(project)
 
                             logger.info(
-                                f"Documenti disponibili: {project_files.count()} file, {project_notes.count()} note, {project_urls.count()} URL")
+                                f"Documenti disponibili: {snapshot['files']['total']} file, {snapshot['notes']['included']} note, {snapshot['urls']['indexed']} URL")
 
                             try:
                                 # Usa la funzione ottimizzata per ottenere la risposta
@@ -645,6 +710,9 @@ def project(request, project_id=None):
                                         )
                                     logger.info(f"Conversazione salvata con ID: {conversation.id}")
 
+                                    # Aggiorna in background il riassunto usato per le domande di follow-up
+                                    update_project_conversation_history(project, conversation)
+
                                 except Exception as save_error:
                                     logger.error(f"Errore nel salvare la conversazione: {str(save_error)}")
                                     # Non interrompiamo il flusso se il salvataggio fallisce
@@ -747,16 +815,11 @@ def project(request, project_id=None):
                     files = request.FILES.getlist('files[]')
 
                     if files:
-                        # Directory del progetto
-                        project_dir = os.path.join(settings.MEDIA_ROOT, 'projects', str(request.user.id),
-                                                   str(project.id))
-                        os.makedirs(project_dir, exist_ok=True)
-
-                        for file in files:
-                            # Usa la funzione ottimizzata per il caricamento dei file
-                            handle_project_file_upload(project, file, project_dir)
-
-                        messages.success(request, f"{len(files)} files uploaded successfully.")
+                        # Caricamento in blocco: un solo inserimento nel database e un solo aggiornamento dell'indice
+                        extract_archives = request.POST.get('extract_archives') == 'on'
+                        result = ingest_uploaded_files(project, [(file.name, file) for file in files],
+                                                       extract_archives=extract_archives)
+                        _add_bulk_upload_messages(request, result)
                         return redirect('project', project_id=project.id)
 
                 # ----- Aggiunta di una cartella -----
@@ -765,31 +828,20 @@ def project(request, project_id=None):
                     folder_files = request.FILES.getlist('folder[]')
 
                     if folder_files:
-                        # Directory del progetto
-                        project_dir = os.path.join(settings.MEDIA_ROOT, 'projects', str(request.user.id),
-                                                   str(project.id))
-                        os.makedirs(project_dir, exist_ok=True)
-
+                        uploaded_files = []
                         for file in folder_files:
                             # Gestisci il percorso relativo per la cartella
                             relative_path = file.name
                             if hasattr(file, 'webkitRelativePath') and file.webkitRelativePath:
                                 relative_path = file.webkitRelativePath
 
+                            # La cartella selezionata corrisponde alla radice del progetto
                             path_parts = relative_path.split('/')
-                            if len(path_parts) > 1:
-                                # Crea sottocartelle se necessario
-                                subfolder_path = '/'.join(path_parts[1:-1])
-                                subfolder_dir = os.path.join(project_dir, subfolder_path)
-                                os.makedirs(subfolder_dir, exist_ok=True)
-                                file_path = os.path.join(subfolder_dir, path_parts[-1])
-                            else:
-                                file_path = os.path.join(project_dir, path_parts[-1])
+                            uploaded_files.append(('/'.join(path_parts[1:]) if len(path_parts) > 1 else path_parts[-1], file))
 
-                            # Usa la funzione ottimizzata per il caricamento dei file
-                            handle_project_file_upload(project, file, project_dir, file_path)
-
-                        messages.success(request, f"Folder with {len(folder_files)} files uploaded successfully.")
+                        # Caricamento in blocco: un solo inserimento nel database e un solo aggiornamento dell'indice
+                        result = ingest_uploaded_files(project, uploaded_files)
+                        _add_bulk_upload_messages(request, result)
                         return redirect('project', project_id=project.id)
 
                 # ----- Eliminazione dei file -----
@@ -1379,10 +1431,11 @@ def project(request, project_id=None):
             # Aggiungi statistiche sugli URL al contesto
             try:
                 from django.db.models import Count
+                urls_snapshot = get_project_content_snapshot(project)['urls']
                 url_stats = {
-                    'total': ProjectURL.objects.filter(project=project).count(),
-                    'indexed': ProjectURL.objects.filter(project=project, is_indexed=True).count(),
-                    'pending': ProjectURL.objects.filter(project=project, is_indexed=False).count(),
+                    'total': urls_snapshot['total'],
+                    'indexed': urls_snapshot['indexed'],
+                    'pending': urls_snapshot['pending'],
                     'domains': ProjectURL.objects.filter(project=project).values(
                         'metadata__domain').annotate(count=Count('id')).order_by('-count')[:5]
                 }
@@ -1649,6 +1702,7 @@ def project_config(request, project_id):
 
                             # Resetta lo stato degli embedding per tutte le note del progetto
                             ProjectNote.objects.filter(project=project).update(last_indexed_at=None)
+                            invalidate_project_content_snapshot(project)
 
                             # Elimina l'indice corrente
                             project_dir = os.path.join(settings.MEDIA_ROOT, 'projects', str(project.user.id),
@@ -1827,6 +1881,9 @@ def project_config(request, project_id):
                             project_rag_config.prioritize_filenames = None
                             project_rag_config.equal_notes_weight = None
                             project_rag_config.strict_context = None
+                            # I preset non definiscono il riordinamento: si torna ai valori predefiniti
+                            project_rag_config.rerank_model = None
+                            project_rag_config.rerank_top_n = None
                             project_rag_config.save()
 
                             logger.info(f"RAG preset '{preset.name}' selected for project {project.id}")
@@ -1857,6 +1914,13 @@ def project_config(request, project_id):
                         project_rag_config.mmr_lambda = float(request.POST.get('mmr_lambda', 0.7))
                         project_rag_config.similarity_threshold = float(request.POST.get('similarity_threshold', 0.7))
                         project_rag_config.retriever_type = request.POST.get('retriever_type', 'mmr')
+                        project_rag_config.rerank_model = request.POST.get('rerank_model') or None
+                        # Lo slider viene sempre inviato: è una personalizzazione solo se diverso dal valore predefinito
+                        rerank_top_n = request.POST.get('rerank_top_n')
+                        rerank_top_n = int(rerank_top_n) if rerank_top_n else None
+                        project_rag_config.rerank_top_n = (
+                            rerank_top_n if rerank_top_n != DEFAULT_RERANK_TOP_N else None
+                        )
                         project_rag_config.save()
 
                         logger.info(f"RAG settings saved for project {project.id}")
@@ -1993,6 +2057,8 @@ def project_config(request, project_id):
                 'prioritize_filenames': project_rag_config.get_prioritize_filenames(),
                 'equal_notes_weight': project_rag_config.get_equal_notes_weight(),
                 'strict_context': project_rag_config.get_strict_context(),
+                'rerank_model': project_rag_config.get_rerank_model(),
+                'rerank_top_n': project_rag_config.get_rerank_top_n(),
             }
 
             # Identifica i valori RAG personalizzati (non ereditati dal preset)
@@ -2011,6 +2077,8 @@ def project_config(request, project_id):
             if project_rag_config.equal_notes_weight is not None: context['customized_values'][
                 'equal_notes_weight'] = True
             if project_rag_config.strict_context is not None: context['customized_values']['strict_context'] = True
+            if project_rag_config.rerank_model: context['customized_values']['rerank_model'] = True
+            if project_rag_config.rerank_top_n is not None: context['customized_values']['rerank_top_n'] = True
 
             return render(request, 'be/project_config.html', context)
 
@@ -2036,7 +2104,8 @@ def serve_project_file(request, file_id):
     1. Verifica che l'utente abbia accesso al file richiesto
     2. Determina il tipo di contenuto (MIME) appropriato
     3. Configura le intestazioni HTTP per visualizzazione o download
-    4. Restituisce il contenuto binario del file
+    4. Restituisce il file in streaming, con supporto a richieste parziali (Range)
+       e condizionali (ETag dall'hash del file), o delega l'invio al proxy frontale
 
     Gestisce diversi tipi di file inclusi PDF, documenti Office, immagini, ecc.
     La modalità di visualizzazione può essere modificata tramite il parametro '?download'.
@@ -2086,9 +2155,11 @@ def serve_project_file(request, file_id):
             else:
                 content_type = 'application/octet-stream'
 
-        # Apri il file in modalità binaria
-        with open(project_file.file_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type=content_type)
+        # Risposta in streaming con supporto a Range/ETag (o delegata al proxy frontale)
+        response = build_file_response(request, project_file.file_path, content_type,
+                                       etag_value=project_file.file_hash)
+        if response.status_code in (304, 416):
+            return response
 
         # Se è richiesto il download (parametro ?download=1 o ?download=true)
         if request.GET.get('download', '').lower() in ['1', 'true']:
@@ -2099,7 +2170,6 @@ def serve_project_file(request, file_id):
             response['Content-Disposition'] = f'inline; filename="{project_file.filename}"'
 
         # Imposta altre intestazioni utili
-        response['Content-Length'] = project_file.file_size
         response['X-Frame-Options'] = 'SAMEORIGIN'  # Permette l'incorporamento solo dal proprio sito
 
         # Per i file di testo, assicurati che l'encoding sia corretto
@@ -2115,6 +2185,50 @@ def serve_project_file(request, file_id):
         raise Http404("File non disponibile")
 
 
+def serve_project_file_preview(request, file_id, page_number=0):
+    """
+    Serve l'anteprima (WebP) di una pagina di un file di progetto.
+
+    Le anteprime delle prime pagine vengono generate in background al caricamento;
+    per le altre pagine l'anteprima viene generata alla prima richiesta e poi
+    servita dalla cache, indicizzata per hash del contenuto del file.
+
+    La risposta porta un ETag basato sull'hash del file: il browser la rivalida a ogni
+    uso, a meno che l'URL contenga ?v=<hash del file>, nel qual caso può restare in cache.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_previews import render_page_preview
+
+    project_file = get_object_or_404(ProjectFile, id=file_id)
+
+    # Verifica che l'utente abbia accesso al file
+    if project_file.project.user != request.user:
+        raise Http404("File non trovato")
+
+    if not os.path.exists(project_file.file_path):
+        logger.error(f"File fisico non trovato: {project_file.file_path}")
+        raise Http404("File non trovato")
+
+    # L'anteprima cambia solo con il contenuto del file: l'hash identifica la versione
+    etag = f'"{project_file.file_hash}-{page_number}"' if project_file.file_hash else None
+    if etag and request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        preview_path = render_page_preview(project_file.file_path, project_file.file_hash, page_number)
+        if not preview_path:
+            raise Http404("Anteprima non disponibile")
+        response = FileResponse(open(preview_path, 'rb'), content_type='image/webp')
+
+    if etag:
+        response['ETag'] = etag
+    if etag and request.GET.get('v') == project_file.file_hash:
+        # URL legato alla versione del file: può restare in cache nel browser
+        response['Cache-Control'] = 'private, max-age=86400'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 def user_profile(request):
     """
     Gestisce la visualizzazione e la modifica del profilo utente.
@@ -3324,3 +3438,237 @@ def toggle_url_inclusion(request, project_id, url_id):
         # Gestisce i metodi HTTP diversi da POST. Ritorna un errore 405 Method Not Allowed in JSON.
         logger.warning(f"Tentativo di accedere alla vista toggle_url_inclusion con metodo {request.method} (richiesto POST) per project_id={project_id}, url_id={url_id}")
         return JsonResponse({'status': 'error', 'message': 'Metodo HTTP non permesso.'}, status=405)
+
+
+@login_required
+def batch_ask_questions(request, project_id):
+    """
+    API per rispondere a più domande su un progetto in un'unica richiesta.
+
+    Accetta un corpo JSON {"questions": [...], "concurrency": N (opzionale)} e restituisce
+    i risultati in streaming in formato JSONL, uno per riga, man mano che sono pronti.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from django.http import StreamingHttpResponse
+    from dashboard.rag_batch import answer_questions_batch, iter_batch_results_jsonl, BATCH_MAX_CONCURRENCY, BATCH_MAX_QUESTIONS
+
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Metodo HTTP non permesso.'}, status=405)
+
+    project = get_object_or_404(Project, id=project_id, user=request.user)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Corpo della richiesta JSON non valido.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'status': 'error', 'message': 'Il corpo della richiesta deve essere un oggetto JSON.'},
+                            status=400)
+
+    questions = data.get('questions')
+    if not isinstance(questions, list) or not questions:
+        return JsonResponse({'status': 'error', 'message': 'Parametro "questions" mancante o vuoto.'}, status=400)
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return JsonResponse({'status': 'error',
+                             'message': f'Troppe domande: massimo {BATCH_MAX_QUESTIONS} per richiesta.'}, status=400)
+
+    # La concorrenza richiesta dal client non può superare il limite configurato
+    concurrency = data.get('concurrency')
+    if concurrency is None:
+        concurrency = BATCH_MAX_CONCURRENCY
+    try:
+        if isinstance(concurrency, bool):
+            raise TypeError(concurrency)
+        concurrency = int(concurrency)
+    except (TypeError, ValueError, OverflowError):
+        return JsonResponse({'status': 'error',
+                             'message': 'Parametro "concurrency" non valido: atteso un numero intero.'}, status=400)
+    concurrency = min(max(concurrency, 1), BATCH_MAX_CONCURRENCY)
+
+    quota_error = _rag_quota_error(request.user, len(questions))
+    if quota_error is not None:
+        return quota_error
+
+    logger.info(f"Batch di {len(questions)} domande per il progetto {project.id}")
+    results = answer_questions_batch(project, [str(q) for q in questions], max_concurrency=concurrency)
+    return StreamingHttpResponse(iter_batch_results_jsonl(results), content_type='application/x-ndjson')
+
+
+@login_required
+def federated_search(request):
+    """
+    API di ricerca federata: risponde a una domanda cercando in tutti i progetti dell'utente.
+
+    Accetta un corpo JSON {"question": "...", "project_ids": [...] (opzionale)} e restituisce
+    la risposta con le fonti, ciascuna con il progetto di provenienza e il punteggio.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_federated import get_answer_across_projects
+
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Metodo HTTP non permesso.'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Corpo della richiesta JSON non valido.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'status': 'error', 'message': 'Il corpo della richiesta deve essere un oggetto JSON.'},
+                            status=400)
+
+    question = data.get('question')
+    question = question.strip() if isinstance(question, str) else ''
+    if not question:
+        return JsonResponse({'status': 'error', 'message': 'Parametro "question" mancante.'}, status=400)
+
+    project_ids = data.get('project_ids')
+    if project_ids:
+        try:
+            if not isinstance(project_ids, list):
+                raise TypeError(project_ids)
+            project_ids = [int(project_id) for project_id in project_ids]
+        except (TypeError, ValueError):
+            return JsonResponse({'status': 'error',
+                                 'message': 'Parametro "project_ids" non valido: attesa una lista di ID numerici.'},
+                                status=400)
+
+    quota_error = _rag_quota_error(request.user, 1)
+    if quota_error is not None:
+        return quota_error
+
+    projects = Project.objects.filter(user=request.user, is_active=True)
+    if project_ids:
+        projects = projects.filter(id__in=project_ids)
+
+    try:
+        response = get_answer_across_projects(request.user, question, projects)
+    except Exception as e:
+        logger.exception(f"Errore nella ricerca federata: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': 'Errore durante la ricerca nei progetti.'}, status=500)
+
+    # Le fonti contengono metadati serializzabili; il motore è già ridotto a tipo e modello
+    return JsonResponse({'status': 'success', **response})
+
+
+@login_required
+def chunked_upload_init(request, project_id):
+    """
+    API per avviare un caricamento a blocchi (riprendibile) di un file di progetto.
+
+    Accetta un corpo JSON {"filename": "...", "size": N, "relative_path": "..." (opzionale),
+    "sha256": "..." (opzionale)} e restituisce l'ID della sessione e la dimensione dei blocchi.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.chunked_upload import create_upload_session
+
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Metodo HTTP non permesso.'}, status=405)
+
+    project = get_object_or_404(Project, id=project_id, user=request.user)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'Corpo della richiesta JSON non valido.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'status': 'error', 'message': 'Il corpo della richiesta deve essere un oggetto JSON.'},
+                            status=400)
+
+    try:
+        session = create_upload_session(project, data.get('filename'), data.get('size'),
+                                        relative_path=data.get('relative_path'),
+                                        expected_sha256=data.get('sha256'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'upload_id': session['upload_id'],
+        'part_size': session['part_size'],
+        'total_parts': session['total_parts'],
+    })
+
+
+@login_required
+def chunked_upload_part(request, project_id, upload_id, part_number):
+    """
+    API per inviare un blocco di un caricamento (corpo della richiesta PUT con i byte del blocco).
+
+    L'intestazione opzionale X-Part-SHA256 permette di verificare l'integrità del blocco;
+    un blocco già ricevuto può essere reinviato (ad esempio dopo un errore di rete).
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.chunked_upload import get_upload_session, write_upload_part
+
+    if request.method != 'PUT':
+        return JsonResponse({'status': 'error', 'message': 'Metodo HTTP non permesso.'}, status=405)
+
+    project = get_object_or_404(Project, id=project_id, user=request.user)
+    session = get_upload_session(upload_id, project)
+    if session is None:
+        return JsonResponse({'status': 'error', 'message': 'Sessione di caricamento non trovata.'}, status=404)
+
+    try:
+        # Il corpo viene letto a blocchi direttamente dal flusso della richiesta
+        part = write_upload_part(session, part_number, request, request.headers.get('X-Part-SHA256'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({'status': 'success', **part})
+
+
+@login_required
+def chunked_upload_status(request, project_id, upload_id):
+    """
+    API per lo stato di un caricamento a blocchi (GET) o per annullarlo (DELETE).
+
+    Lo stato elenca i blocchi ricevuti e quelli mancanti, così il client può riprendere
+    un caricamento interrotto inviando solo i blocchi mancanti.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.chunked_upload import get_upload_session, get_upload_status, abort_upload_session
+
+    project = get_object_or_404(Project, id=project_id, user=request.user)
+    session = get_upload_session(upload_id, project)
+    if session is None:
+        return JsonResponse({'status': 'error', 'message': 'Sessione di caricamento non trovata.'}, status=404)
+
+    if request.method == 'GET':
+        return JsonResponse({'status': 'success', **get_upload_status(session)})
+    if request.method == 'DELETE':
+        abort_upload_session(session)
+        return JsonResponse({'status': 'success', 'message': 'Caricamento annullato.'})
+    return JsonResponse({'status': 'error', 'message': 'Metodo HTTP non permesso.'}, status=405)
+
+
+@login_required
+def chunked_upload_complete(request, project_id, upload_id):
+    """
+    API per completare un caricamento a blocchi e registrare il file nel progetto.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.chunked_upload import get_upload_session, complete_upload_session
+
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Metodo HTTP non permesso.'}, status=405)
+
+    project = get_object_or_404(Project, id=project_id, user=request.user)
+    session = get_upload_session(upload_id, project)
+    if session is None:
+        return JsonResponse({'status': 'error', 'message': 'Sessione di caricamento non trovata.'}, status=404)
+
+    try:
+        project_file, created = complete_upload_session(session, project)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except Exception as e:
+        logger.exception(f"Errore nel completamento del caricamento {upload_id}: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': 'Errore nel completamento del caricamento.'}, status=500)
+
+    return JsonResponse({
+        'status': 'success',
+        'file_id': project_file.id,
+        'filename': project_file.filename,
+        'file_hash': project_file.file_hash,
+        'duplicate': not created,
+    })
@@ -5,14 +5,18 @@ con simulazione di browser completo per gestire siti dinamici e integrazione con
 per l'estrazione di contenuti informativi.
 """
 from django.utils import timezone
+import asyncio
+import hashlib
 import os
-import time
 import uuid
 import logging
 import re
 import json
+from contextlib import asynccontextmanager
 from urllib.parse import urlparse, urljoin
-from playwright.sync_api import sync_playwright
+import httpx
+from django.core.cache import cache
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from bs4 import BeautifulSoup
 from langchain.schema import Document
 
@@ -21,6 +25,80 @@ from vaitony_project import settings
 # Configurazione logger
 logger = logging.getLogger(__name__)
 
+CRAWLER_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
+
+# Pagine del browser visitate in parallelo e limite di richieste parallele verso lo stesso host
+CRAWL_CONCURRENCY = getattr(settings, 'RAG_CRAWL_CONCURRENCY', 4)
+CRAWL_PER_HOST_CONCURRENCY = getattr(settings, 'RAG_CRAWL_PER_HOST_CONCURRENCY', 4)
+
+# Intervallo minimo in secondi tra due richieste allo stesso host
+CRAWL_REQUEST_DELAY = getattr(settings, 'RAG_CRAWL_REQUEST_DELAY', 0.0)
+
+# Attesa massima (ms) dell'inattività di rete dopo il caricamento e attesa dopo lo scorrimento
+CRAWL_NETWORK_IDLE_TIMEOUT = 5000
+CRAWL_SCROLL_WAIT = 500
+
+# Download via HTTP prima del rendering con il browser, usato solo per le pagine generate via JavaScript
+CRAWL_HTTP_FIRST = getattr(settings, 'RAG_CRAWL_HTTP_FIRST', True)
+
+# Pagine che richiedono il browser oltre le quali un dominio viene renderizzato direttamente
+CRAWL_BROWSER_SWITCH_THRESHOLD = 2
+
+# Memoria della modalità di download scelta per ciascun dominio
+CRAWL_FETCH_MODE_CACHE_KEY = "web_crawler_fetch_mode:{host}"
+CRAWL_FETCH_MODE_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+# Numero massimo di link memorizzati per pagina (riusati per le pagine invariate)
+CRAWL_STORED_LINKS_LIMIT = 500
+
+# Tipi di risorse non scaricati durante il rendering
+CRAWL_BLOCKED_RESOURCE_TYPES = ('image', 'media', 'font')
+
+
+def compute_content_hash(text):
+	"""
+	Calcola l'hash SHA-256 del contenuto di una pagina normalizzato negli spazi.
+
+	Args:
+		text: Contenuto testuale estratto dalla pagina
+
+	Returns:
+		str: Hash esadecimale
+	"""
+	return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+def _validators_from_headers(headers, known_page=None):
+	"""
+	Estrae i validatori HTTP (ETag, Last-Modified) dalle intestazioni di una risposta.
+
+	Args:
+		headers: Intestazioni della risposta (chiavi minuscole)
+		known_page: Validatori precedenti, usati se la risposta non li riporta (default: None)
+
+	Returns:
+		dict: {'etag': str o None, 'last_modified': str o None}
+	"""
+	known_page = known_page or {}
+	last_modified = headers.get('last-modified')
+	# Una data HTTP valida è lunga 29 caratteri: valori anomali non entrano nel campo del modello
+	if last_modified and len(last_modified) > 64:
+		last_modified = None
+	return {
+		'etag': headers.get('etag') or known_page.get('etag'),
+		'last_modified': last_modified or known_page.get('last_modified'),
+	}
+
+
+async def _block_heavy_resources(route):
+	"""
+	Interrompe il download delle risorse non necessarie all'estrazione del testo.
+	"""
+	if route.request.resource_type in CRAWL_BLOCKED_RESOURCE_TYPES:
+		await route.abort()
+	else:
+		await route.continue_()
+
 
 class WebCrawler:
 	"""
@@ -31,7 +109,8 @@ class WebCrawler:
 
 	def __init__(self, max_depth=2, max_pages=10, min_text_length=500,
 				 exclude_patterns=None, include_patterns=None, timeout=30000,
-				 llm_provider=None):
+				 llm_provider=None, concurrency=None, per_host_concurrency=None, request_delay=None,
+				 http_first=None):
 		"""
         Inizializza il crawler con i parametri specificati.
 
@@ -43,12 +122,24 @@ class WebCrawler:
             include_patterns: Lista di pattern regex da includere negli URL (default: None)
             timeout: Timeout in ms per il caricamento delle pagine (default: 30000)
             llm_provider: Provider LLM da utilizzare per l'estrazione di contenuti (default: None)
+            concurrency: Numero di pagine visitate in parallelo (default: RAG_CRAWL_CONCURRENCY)
+            per_host_concurrency: Richieste parallele massime verso lo stesso host (default: RAG_CRAWL_PER_HOST_CONCURRENCY)
+            request_delay: Intervallo minimo in secondi tra richieste allo stesso host (default: RAG_CRAWL_REQUEST_DELAY)
+            http_first: Se True, scarica le pagine via HTTP e usa il browser solo per quelle generate
+                via JavaScript (default: RAG_CRAWL_HTTP_FIRST)
         """
 		self.max_depth = max_depth
 		self.max_pages = max_pages
 		self.min_text_length = min_text_length
 		self.timeout = timeout
 		self.llm_provider = llm_provider
+		self.concurrency = max(1, concurrency or CRAWL_CONCURRENCY)
+		self.per_host_concurrency = max(1, per_host_concurrency or CRAWL_PER_HOST_CONCURRENCY)
+		self.request_delay = CRAWL_REQUEST_DELAY if request_delay is None else request_delay
+		self.http_first = CRAWL_HTTP_FIRST if http_first is None else http_first
+
+		# Esito dei download per dominio: {host: {'http_ok': n, 'browser_needed': n}}
+		self.fetch_stats = {}
 
 		# Compila i pattern regex
 		self.exclude_patterns = None
@@ -163,6 +254,9 @@ class WebCrawler:
 		"""
 		Esegue il crawling di un sito web partendo da un URL specificato.
 
+		Le pagine vengono visitate in parallelo (vedi _crawl_async); il salvataggio degli URL nel database avviene al termine,
+		fuori dal ciclo asincrono.
+
 		Args:
 			start_url: URL di partenza per il crawling
 			output_dir: Directory dove salvare eventuali file temporanei
@@ -182,161 +276,22 @@ class WebCrawler:
 		parsed_url = urlparse(start_url)
 		base_domain = parsed_url.netloc
 
-		logger.info(f"Avvio crawling del sito {base_domain} con profondità {self.max_depth}")
+		# Modalità di download (HTTP o browser) già scelta per il dominio nei crawling precedenti
+		self._load_fetch_mode(base_domain)
+
+		logger.info(f"Avvio crawling del sito {base_domain} con profondità {self.max_depth} "
+					f"({self.concurrency} pagine in parallelo, modalità {self.get_fetch_mode(base_domain)})")
 
 		# Crea la directory di output se non esiste
 		os.makedirs(output_dir, exist_ok=True)
 
-		# Inizializza strutture dati per il crawling
-		visited_urls = set()
-		url_queue = [(start_url, 0)]  # (url, profondità)
-		processed_pages = 0
-		failed_pages = 0
-		documents = []
-		collected_data = []  # Raccogliamo i dati qui invece di salvarli immediatamente
-
-		# Avvia Playwright per simulare un browser
-		with sync_playwright() as playwright:
-			browser = playwright.chromium.launch(headless=True)
-			context = browser.new_context(
-				user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
-			)
-
-			page = context.new_page()
-			page.set_default_timeout(self.timeout)
-
-			while url_queue and processed_pages < self.max_pages:
-				current_url, current_depth = url_queue.pop(0)
-
-				# Salta URL già visitati o non validi
-				if current_url in visited_urls or not self.should_process_url(current_url):
-					continue
-
-				# Verifica dominio
-				current_domain = urlparse(current_url).netloc
-				if current_domain != base_domain:
-					continue
-
-				logger.info(f"Elaborazione pagina: {current_url} (profondità: {current_depth})")
-
-				# Aggiungi alla lista dei visitati
-				visited_urls.add(current_url)
-
-				try:
-					# Naviga alla pagina
-					page.goto(current_url, wait_until="networkidle")
-
-					# Scorri la pagina per caricare contenuti lazy
-					page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-					time.sleep(1)
-
-					# Ottieni il contenuto HTML
-					html_content = page.content()
-
-					# Utilizza BeautifulSoup per estrarre il contenuto
-					soup = BeautifulSoup(html_content, 'html.parser')
-					page_content, main_text, title, meta_description = self.extract_text_content(soup, current_url)
-
-					# Verifica la lunghezza minima del testo
-					if len(main_text) < self.min_text_length:
-						logger.debug(f"Pagina saltata: contenuto troppo breve ({len(main_text)} caratteri)")
-						continue
-
-					# Se è stato specificato un provider LLM, usa l'API per estrarre informazioni
-					extracted_info = None
-					if self.llm_provider and hasattr(self, f"extract_info_with_{self.llm_provider.lower()}"):
-						extraction_method = getattr(self, f"extract_info_with_{self.llm_provider.lower()}")
-						extracted_info = extraction_method(page_content, current_url)
-						logger.info(f"Informazioni estratte con {self.llm_provider} per {current_url}")
-
-					# Crea un nome file basato sull'URL
-					parsed_suburl = urlparse(current_url)
-					path = parsed_suburl.path.strip('/')
-					if not path:
-						path = 'index'
-
-					# Sostituisci caratteri non validi nei nomi file
-					path = path.replace('/', '_').replace('?', '_').replace('&', '_')
-					path = re.sub(r'[^a-zA-Z0-9_.-]', '_', path)
-
-					# Limita la lunghezza del nome file
-					if len(path) > 100:
-						path = path[:100]
-
-					file_id = uuid.uuid4().hex[:8]
-					file_name = f"{path}_{file_id}.txt"
-					file_path = os.path.join(output_dir, file_name)
-
-					# Salva il contenuto come file di testo
-					with open(file_path, 'w', encoding='utf-8') as f:
-						f.write(f"URL: {current_url}\n\n{page_content}")
-
-					# Crea un documento LangChain
-					doc = Document(
-						page_content=page_content,
-						metadata={
-							"source": file_path,
-							"url": current_url,
-							"title": title,
-							"crawl_depth": current_depth,
-							"domain": base_domain,
-							"filename": file_name,
-							"type": "web_page"
-						}
-					)
-
-					documents.append((doc, file_path))
-					processed_pages += 1
-
-					logger.info(f"Pagina salvata: {file_name} ({os.path.getsize(file_path)} bytes)")
-
-					# Invece di salvare direttamente, raccogli i dati
-					if project:
-						# Normalizza l'URL se necessario
-						normalized_url = current_url
-
-						# Aggiungi i dati da salvare successivamente
-						url_data = {
-							'project': project,
-							'url': normalized_url,
-							'title': title,
-							'description': meta_description,
-							'content': page_content,
-							'extracted_info': json.dumps(extracted_info) if extracted_info else None,
-							'file_path': file_path,
-							'crawl_depth': current_depth,
-							'is_indexed': False,
-							'metadata': {
-								'domain': base_domain,
-								'path': parsed_suburl.path,
-								'size': len(page_content)
-							}
-						}
-						collected_data.append(url_data)
-
-					# Se non abbiamo raggiunto la profondità massima, aggiungi i link alla coda
-					if current_depth < self.max_depth:
-						# Estrai tutti i link
-						links = page.evaluate("""() => {
-	                        return Array.from(document.querySelectorAll('a[href]'))
-	                            .map(a => a.href)
-	                            .filter(href => href && !href.startsWith('javascript:') && !href.startsWith('#'));
-	                    }""")
-
-						for link in links:
-							# Normalizza il link
-							absolute_link = urljoin(current_url, link)
-
-							# Aggiungi alla coda se non è già visitato
-							if absolute_link not in visited_urls:
-								url_queue.append((absolute_link, current_depth + 1))
-
-				except Exception as e:
-					logger.error(f"Errore nell'elaborazione di {current_url}: {str(e)}")
-					failed_pages += 1
+		# Validatori e hash delle pagine già acquisite, per le richieste condizionali
+		known_pages = self._load_known_pages(project) if project else {}
 
-			# Chiudi il browser
-			browser.close()
+		processed_pages, failed_pages, documents, collected_data, unchanged_pages = asyncio.run(
+			self._crawl_async(start_url, base_domain, output_dir, project, known_pages)
+		)
+		self._save_fetch_mode(base_domain)
 
 		# Ora salviamo tutti gli URL raccolti al di fuori del contesto asincrono
 		stored_urls = []
@@ -357,16 +312,19 @@ class WebCrawler:
 						existing_url.extracted_info = url_data['extracted_info']
 						existing_url.file_path = url_data['file_path']
 						existing_url.crawl_depth = url_data['crawl_depth']
-						existing_url.is_indexed = False  # Forza reindicizzazione
+						existing_url.is_indexed = False  # Contenuto cambiato: forza reindicizzazione
 						existing_url.is_included_in_rag = True  # Assicura che sia incluso
-						existing_url.updated_at = timezone.now()  # Usa updated_at invece di last_crawled_at
+						existing_url.etag = url_data['etag']
+						existing_url.last_modified = url_data['last_modified']
+						existing_url.content_hash = url_data['content_hash']
+						existing_url.last_crawled_at = timezone.now()
 						existing_url.metadata = url_data['metadata']
 						existing_url.save()
 
 						stored_urls.append(existing_url)
 						logger.info(f"🔄 Aggiornato URL esistente {url_data['url']} per il progetto {project.id}")
 					else:
-						# Crea nuovo URL senza last_crawled_at
+						# Crea nuovo URL
 						url_obj = ProjectURL.objects.create(
 							project=url_data['project'],
 							url=url_data['url'],
@@ -378,6 +336,10 @@ class WebCrawler:
 							crawl_depth=url_data['crawl_depth'],
 							is_indexed=False,  # Inizialmente non indicizzato
 							is_included_in_rag=True,  # Includi di default nel RAG
+							etag=url_data['etag'],
+							last_modified=url_data['last_modified'],
+							content_hash=url_data['content_hash'],
+							last_crawled_at=timezone.now(),
 							metadata=url_data['metadata']
 						)
 						stored_urls.append(url_obj)
@@ -386,5 +348,563 @@ class WebCrawler:
 
 				except Exception as db_error:
 					logger.error(f"Errore nel salvare l'URL nel database: {str(db_error)}")
-		logger.info(f"Crawling completato: {processed_pages} pagine elaborate, {failed_pages} fallite")
-		return processed_pages, failed_pages, documents, stored_urls
\ No newline at end of file
+
+		# Pagine invariate: aggiornati solo i validatori, senza toccare is_indexed (nessuna reindicizzazione)
+		if project and unchanged_pages:
+			stored_urls.extend(self._touch_unchanged_urls(project, unchanged_pages))
+
+		logger.info(f"Crawling completato: {processed_pages} pagine elaborate ({len(unchanged_pages)} invariate), "
+					f"{failed_pages} fallite")
+		return processed_pages, failed_pages, documents, stored_urls
+
+	def _load_known_pages(self, project):
+		"""
+		Carica validatori HTTP, hash del contenuto e link delle pagine già acquisite nel progetto.
+
+		Args:
+			project: Oggetto Project
+
+		Returns:
+			dict: {url: {'etag', 'last_modified', 'content_hash', 'links'}}
+		"""
+		# Importazione ritardata per evitare cicli di importazione
+		from profiles.models import ProjectURL
+
+		known_pages = {}
+		for url, etag, last_modified, content_hash, content, metadata in ProjectURL.objects.filter(
+				project=project).values_list('url', 'etag', 'last_modified', 'content_hash', 'content', 'metadata'):
+			known_pages[url] = {
+				'etag': etag,
+				'last_modified': last_modified,
+				# URL acquisiti prima dell'introduzione dell'hash: calcolato dal contenuto salvato
+				'content_hash': content_hash or (compute_content_hash(content) if content else None),
+				'links': (metadata or {}).get('links', []),
+			}
+		return known_pages
+
+	def _touch_unchanged_urls(self, project, unchanged_pages):
+		"""
+		Aggiorna validatori e data di crawling delle pagine invariate con un solo bulk_update.
+
+		Args:
+			project: Oggetto Project
+			unchanged_pages: Lista di dict {'url', 'etag', 'last_modified', 'links'}
+
+		Returns:
+			list: Oggetti ProjectURL aggiornati
+		"""
+		# Importazione ritardata per evitare cicli di importazione
+		from profiles.models import ProjectURL
+
+		pages_by_url = {page['url']: page for page in unchanged_pages}
+		now = timezone.now()
+		url_objects = list(ProjectURL.objects.filter(project=project, url__in=list(pages_by_url)))
+		for url_obj in url_objects:
+			page = pages_by_url[url_obj.url]
+			url_obj.etag = page['etag']
+			url_obj.last_modified = page['last_modified']
+			url_obj.last_crawled_at = now
+			if not url_obj.content_hash and url_obj.content:
+				url_obj.content_hash = compute_content_hash(url_obj.content)
+			if page['links'] is not None:
+				# I link salvati servono a proseguire il crawling quando la pagina risponde 304
+				url_obj.metadata = {**(url_obj.metadata or {}), 'links': page['links']}
+
+		# bulk_update non emette i segnali post_save: nessuna reindicizzazione delle pagine invariate
+		try:
+			ProjectURL.objects.bulk_update(url_objects,
+										   ['etag', 'last_modified', 'last_crawled_at', 'content_hash', 'metadata'],
+										   batch_size=500)
+		except Exception as db_error:
+			logger.error(f"Errore nell'aggiornamento degli URL invariati: {str(db_error)}")
+			return []
+
+		logger.info(f"✅ {len(url_objects)} URL invariati per il progetto {project.id}: nessuna reindicizzazione")
+		return url_objects
+
+	async def _crawl_async(self, start_url, base_domain, output_dir, project, known_pages=None):
+		"""
+		Motore di crawling asincrono: più worker condividono la coda degli URL da visitare
+		(frontiera), mantenendo le regole di profondità, numero massimo di pagine e pattern
+		di inclusione/esclusione.
+
+		Le pagine vengono scaricate prima con un client HTTP condiviso; il browser viene
+		avviato solo se serve renderizzare pagine generate via JavaScript.
+
+		Args:
+			start_url: URL di partenza per il crawling
+			base_domain: Dominio a cui limitare il crawling
+			output_dir: Directory dove salvare i contenuti delle pagine
+			project: Oggetto Project per raccogliere gli URL (default: None)
+			known_pages: Validatori e hash delle pagine già acquisite, per URL (default: None)
+
+		Returns:
+			tuple: (pagine processate, fallite, lista dei documenti, dati degli URL da salvare,
+				pagine invariate)
+		"""
+		# Stato condiviso tra i worker (tutti eseguiti nello stesso ciclo di eventi)
+		crawl_state = {
+			'base_domain': base_domain,
+			'output_dir': output_dir,
+			'project': project,
+			'frontier': asyncio.Queue(),
+			'visited_urls': set(),
+			'processed_pages': 0,
+			'failed_pages': 0,
+			'documents': [],
+			'collected_data': [],
+			'known_pages': known_pages or {},
+			'unchanged_pages': [],
+			'host_semaphores': {},
+			'host_next_request': {},
+			'http_client': None,
+			'browser': {'lock': asyncio.Lock(), 'playwright': None, 'instance': None, 'context': None,
+						'pages': asyncio.Queue(), 'pages_created': 0},
+		}
+		crawl_state['frontier'].put_nowait((start_url, 0))  # (url, profondità)
+
+		# Client HTTP con pool di connessioni condiviso tra i worker
+		async with httpx.AsyncClient(
+			headers={'User-Agent': CRAWLER_USER_AGENT},
+			timeout=self.timeout / 1000,
+			follow_redirects=True,
+			limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+		) as http_client:
+			crawl_state['http_client'] = http_client
+			try:
+				workers = [asyncio.create_task(self._crawl_worker(crawl_state)) for _ in range(self.concurrency)]
+
+				# Attende che la frontiera sia esaurita (o che sia raggiunto il numero massimo di pagine)
+				await crawl_state['frontier'].join()
+				for worker in workers:
+					worker.cancel()
+				await asyncio.gather(*workers, return_exceptions=True)
+			finally:
+				# Chiudi il browser, se è stato avviato
+				browser = crawl_state['browser']
+				if browser['instance']:
+					await browser['instance'].close()
+				if browser['playwright']:
+					await browser['playwright'].stop()
+
+		return (crawl_state['processed_pages'], crawl_state['failed_pages'],
+				crawl_state['documents'], crawl_state['collected_data'], crawl_state['unchanged_pages'])
+
+	async def _crawl_worker(self, crawl_state):
+		"""
+		Estrae gli URL dalla frontiera e li visita.
+
+		Args:
+			crawl_state: Stato condiviso del crawling
+		"""
+		frontier = crawl_state['frontier']
+		while True:
+			current_url, current_depth = await frontier.get()
+			try:
+				# Raggiunto il numero massimo di pagine: svuota la frontiera senza visitare
+				if crawl_state['processed_pages'] >= self.max_pages:
+					continue
+
+				# Salta URL già visitati o non validi
+				if current_url in crawl_state['visited_urls'] or not self.should_process_url(current_url):
+					continue
+
+				# Verifica dominio
+				current_domain = urlparse(current_url).netloc
+				if current_domain != crawl_state['base_domain']:
+					continue
+
+				logger.info(f"Elaborazione pagina: {current_url} (profondità: {current_depth})")
+
+				# Aggiungi alla lista dei visitati
+				crawl_state['visited_urls'].add(current_url)
+
+				try:
+					async with self._host_slot(crawl_state, current_domain):
+						page_data, links = await self._fetch_page(current_url, current_depth, crawl_state)
+					if page_data is None:
+						continue
+
+					if crawl_state['processed_pages'] >= self.max_pages:
+						continue
+					self._store_page(page_data, links, current_url, current_depth, crawl_state)
+
+					# Se non abbiamo raggiunto la profondità massima, aggiungi i link alla frontiera
+					for link in links:
+						# Normalizza il link
+						absolute_link = urljoin(current_url, link)
+
+						# Aggiungi alla frontiera se non è già visitato
+						if absolute_link not in crawl_state['visited_urls']:
+							frontier.put_nowait((absolute_link, current_depth + 1))
+
+				except Exception as e:
+					logger.error(f"Errore nell'elaborazione di {current_url}: {str(e)}")
+					crawl_state['failed_pages'] += 1
+			finally:
+				frontier.task_done()
+
+	@asynccontextmanager
+	async def _host_slot(self, crawl_state, host):
+		"""
+		Limita le richieste parallele verso lo stesso host e distanzia quelle successive
+		di almeno request_delay secondi (cortesia verso il sito visitato).
+
+		Args:
+			crawl_state: Stato condiviso del crawling
+			host: Host della richiesta
+		"""
+		semaphore = crawl_state['host_semaphores'].setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+		async with semaphore:
+			if self.request_delay:
+				now = asyncio.get_running_loop().time()
+				request_time = max(now, crawl_state['host_next_request'].get(host, now))
+				crawl_state['host_next_request'][host] = request_time + self.request_delay
+				if request_time > now:
+					await asyncio.sleep(request_time - now)
+			yield
+
+	def get_fetch_mode(self, host):
+		"""
+		Restituisce la modalità di download preferita per un dominio.
+
+		Args:
+			host: Dominio
+
+		Returns:
+			str: 'http' (richiesta HTTP semplice) o 'browser' (rendering con Playwright)
+		"""
+		if not self.http_first:
+			return 'browser'
+		stats = self.fetch_stats.get(host)
+		if stats is None:
+			return 'http'
+		if stats['browser_needed'] >= CRAWL_BROWSER_SWITCH_THRESHOLD and stats['browser_needed'] > stats['http_ok']:
+			return 'browser'
+		return 'http'
+
+	def _load_fetch_mode(self, host):
+		"""
+		Recupera dalla cache la modalità di download scelta per il dominio nei crawling precedenti.
+		"""
+		if host not in self.fetch_stats and cache.get(CRAWL_FETCH_MODE_CACHE_KEY.format(host=host)) == 'browser':
+			self.fetch_stats[host] = {'http_ok': 0, 'browser_needed': CRAWL_BROWSER_SWITCH_THRESHOLD}
+
+	def _save_fetch_mode(self, host):
+		"""
+		Memorizza in cache la modalità di download scelta per il dominio.
+		"""
+		if host in self.fetch_stats:
+			mode = self.get_fetch_mode(host)
+			cache.set(CRAWL_FETCH_MODE_CACHE_KEY.format(host=host), mode, CRAWL_FETCH_MODE_CACHE_TIMEOUT)
+			logger.debug(f"Modalità di download per {host}: {mode} ({self.fetch_stats[host]})")
+
+	async def _fetch_page(self, url, depth, crawl_state):
+		"""
+		Scarica ed estrae una pagina, prima via HTTP e, se il testo ottenuto non è
+		significativo (pagina generata via JavaScript), con il browser.
+
+		Args:
+			url: URL della pagina
+			depth: Profondità dell'URL
+			crawl_state: Stato condiviso del crawling
+
+		Returns:
+			tuple: (dati estratti o None se la pagina va saltata, lista dei link da seguire)
+		"""
+		host = urlparse(url).netloc
+		stats = self.fetch_stats.setdefault(host, {'http_ok': 0, 'browser_needed': 0})
+		http_mode = self.get_fetch_mode(host) == 'http'
+
+		# Pagina già acquisita in un crawling precedente: richiesta condizionale anche prima del rendering.
+		# Se servono i link della pagina ma non sono salvati, una risposta 304 fermerebbe la frontiera:
+		# la pagina viene scaricata per intero
+		known_page = crawl_state['known_pages'].get(url)
+		conditional = bool(known_page and (known_page['etag'] or known_page['last_modified'])
+						   and (known_page['links'] or depth >= self.max_depth))
+
+		if http_mode or conditional:
+			response = await self._http_fetch(url, crawl_state, known_page if conditional else None)
+			if response is None:
+				# Contenuto non HTML (es. documenti binari): la pagina viene saltata
+				return None, []
+
+			if response.status_code == 304:
+				# Pagina invariata dall'ultimo crawling: nessun download né rendering
+				logger.debug(f"Pagina invariata (304): {url}")
+				page_data = {'unchanged': True, **_validators_from_headers(response.headers, known_page)}
+				return page_data, known_page['links'] if depth < self.max_depth else []
+
+			if http_mode and response.status_code != 403:
+				# Altri errori HTTP: la pagina è fallita anche nel browser
+				response.raise_for_status()
+				base_url = str(response.url) if depth < self.max_depth else None
+				page_data = await asyncio.to_thread(self._extract_page_data, response.text, url, base_url)
+				if page_data is not None:
+					stats['http_ok'] += 1
+					page_data.update(_validators_from_headers(response.headers))
+					return page_data, page_data.pop('links')
+
+			if http_mode:
+				logger.debug(f"Testo non significativo via HTTP per {url}: rendering con il browser")
+
+		html_content, links, validators = await self._render_page(url, depth, crawl_state)
+		page_data = await asyncio.to_thread(self._extract_page_data, html_content, url)
+		if page_data is None:
+			return None, []
+		stats['browser_needed'] += 1
+		page_data.update(validators)
+		return page_data, links
+
+	async def _http_fetch(self, url, crawl_state, known_page=None):
+		"""
+		Scarica una pagina con il client HTTP condiviso.
+
+		Args:
+			url: URL della pagina
+			crawl_state: Stato condiviso del crawling
+			known_page: Validatori del crawling precedente, per una richiesta condizionale (default: None)
+
+		Returns:
+			httpx.Response: Risposta con il contenuto già letto (o 304 se la pagina è invariata),
+				o None se il contenuto non è HTML
+		"""
+		headers = {}
+		if known_page:
+			if known_page['etag']:
+				headers['If-None-Match'] = known_page['etag']
+			if known_page['last_modified']:
+				headers['If-Modified-Since'] = known_page['last_modified']
+
+		async with crawl_state['http_client'].stream('GET', url, headers=headers) as response:
+			content_type = response.headers.get('content-type', '')
+			if response.is_success and 'html' not in content_type.lower():
+				return None
+			await response.aread()
+			return response
+
+	@asynccontextmanager
+	async def _browser_page(self, crawl_state):
+		"""
+		Fornisce una pagina del browser dal pool, avviando il browser al primo utilizzo.
+
+		Args:
+			crawl_state: Stato condiviso del crawling
+		"""
+		browser = crawl_state['browser']
+		if browser['pages'].empty() and browser['pages_created'] < self.concurrency:
+			browser['pages_created'] += 1
+			try:
+				async with browser['lock']:
+					if browser['context'] is None:
+						# Avvia Playwright per simulare un browser
+						logger.info(f"Avvio del browser per il rendering delle pagine JavaScript")
+						browser['playwright'] = await async_playwright().start()
+						browser['instance'] = await browser['playwright'].chromium.launch(headless=True)
+						browser['context'] = await browser['instance'].new_context(user_agent=CRAWLER_USER_AGENT)
+						# Immagini, font e contenuti multimediali non servono per estrarre il testo
+						await browser['context'].route("**/*", _block_heavy_resources)
+				page = await browser['context'].new_page()
+				page.set_default_timeout(self.timeout)
+			except Exception:
+				browser['pages_created'] -= 1
+				raise
+		else:
+			page = await browser['pages'].get()
+
+		try:
+			yield page
+		finally:
+			browser['pages'].put_nowait(page)
+
+	async def _render_page(self, url, depth, crawl_state):
+		"""
+		Carica una pagina nel browser e ne restituisce l'HTML renderizzato.
+
+		Args:
+			url: URL da caricare
+			depth: Profondità dell'URL
+			crawl_state: Stato condiviso del crawling
+
+		Returns:
+			tuple: (HTML della pagina, lista dei link da seguire, validatori HTTP del documento)
+		"""
+		async with self._browser_page(crawl_state) as page:
+			# Naviga alla pagina
+			response = await page.goto(url, wait_until="domcontentloaded")
+			validators = _validators_from_headers(response.headers if response else {})
+			try:
+				await page.wait_for_load_state("networkidle", timeout=CRAWL_NETWORK_IDLE_TIMEOUT)
+			except PlaywrightTimeoutError:
+				# Pagine con richieste continue (analytics, polling): si procede con il contenuto già caricato
+				pass
+
+			# Scorri la pagina per caricare contenuti lazy
+			await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+			await page.wait_for_timeout(CRAWL_SCROLL_WAIT)
+
+			# Ottieni il contenuto HTML
+			html_content = await page.content()
+
+			links = []
+			if depth < self.max_depth:
+				# Estrai tutti i link
+				links = await page.evaluate("""() => {
+					return Array.from(document.querySelectorAll('a[href]'))
+						.map(a => a.href)
+						.filter(href => href && !href.startsWith('javascript:') && !href.startsWith('#'));
+				}""")
+		return html_content, links, validators
+
+	def _extract_page_data(self, html_content, url, base_url=None):
+		"""
+		Estrae il contenuto informativo dall'HTML di una pagina.
+
+		Args:
+			html_content: HTML della pagina
+			url: URL della pagina
+			base_url: URL rispetto a cui risolvere i link; se indicato, i link della pagina
+				vengono restituiti nella chiave 'links' (default: None)
+
+		Returns:
+			dict: Contenuto, titolo, descrizione e informazioni estratte, o None se
+				il testo è più breve di min_text_length
+		"""
+		# Utilizza BeautifulSoup per estrarre il contenuto
+		soup = BeautifulSoup(html_content, 'html.parser')
+
+		# I link vanno letti prima che extract_text_content rimuova navigazione e piè di pagina
+		links = []
+		if base_url:
+			for anchor in soup.find_all('a', href=True):
+				href = anchor['href'].strip()
+				if href and not href.startswith(('javascript:', '#', 'mailto:', 'tel:')):
+					links.append(urljoin(base_url, href))
+
+		page_content, main_text, title, meta_description = self.extract_text_content(soup, url)
+
+		# Verifica la lunghezza minima del testo
+		if len(main_text) < self.min_text_length:
+			logger.debug(f"Pagina saltata: contenuto troppo breve ({len(main_text)} caratteri)")
+			return None
+
+		# Se è stato specificato un provider LLM, usa l'API per estrarre informazioni
+		extracted_info = None
+		if self.llm_provider and hasattr(self, f"extract_info_with_{self.llm_provider.lower()}"):
+			extraction_method = getattr(self, f"extract_info_with_{self.llm_provider.lower()}")
+			extracted_info = extraction_method(page_content, url)
+			logger.info(f"Informazioni estratte con {self.llm_provider} per {url}")
+
+		return {
+			'page_content': page_content,
+			'title': title,
+			'meta_description': meta_description,
+			'extracted_info': extracted_info,
+			'links': links,
+		}
+
+	def _store_page(self, page_data, links, current_url, current_depth, crawl_state):
+		"""
+		Salva il contenuto di una pagina su file e ne prepara documento e dati dell'URL.
+
+		Le pagine invariate rispetto al crawling precedente (risposta 304 o stesso hash del
+		contenuto normalizzato) non producono né file né documenti: ne vengono solo aggiornati
+		i validatori, così non vengono reindicizzate.
+
+		Args:
+			page_data: Dati estratti da _extract_page_data (con i validatori HTTP)
+			links: Link della pagina da seguire
+			current_url: URL della pagina
+			current_depth: Profondità della pagina
+			crawl_state: Stato condiviso del crawling
+		"""
+		output_dir = crawl_state['output_dir']
+		base_domain = crawl_state['base_domain']
+		known_page = crawl_state['known_pages'].get(current_url)
+
+		content_hash = None
+		unchanged = page_data.get('unchanged', False)
+		if not unchanged:
+			content_hash = compute_content_hash(page_data['page_content'])
+			unchanged = bool(known_page) and known_page['content_hash'] == content_hash
+
+		if unchanged:
+			crawl_state['unchanged_pages'].append({
+				'url': current_url,
+				'etag': page_data['etag'],
+				'last_modified': page_data['last_modified'],
+				# Link estratti solo sotto la profondità massima: altrimenti restano quelli salvati
+				'links': links[:CRAWL_STORED_LINKS_LIMIT] if current_depth < self.max_depth else None,
+			})
+			crawl_state['processed_pages'] += 1
+			logger.info(f"Pagina invariata: {current_url}")
+			return
+
+		page_content = page_data['page_content']
+		title = page_data['title']
+
+		# Crea un nome file basato sull'URL
+		parsed_suburl = urlparse(current_url)
+		path = parsed_suburl.path.strip('/')
+		if not path:
+			path = 'index'
+
+		# Sostituisci caratteri non validi nei nomi file
+		path = path.replace('/', '_').replace('?', '_').replace('&', '_')
+		path = re.sub(r'[^a-zA-Z0-9_.-]', '_', path)
+
+		# Limita la lunghezza del nome file
+		if len(path) > 100:
+			path = path[:100]
+
+		file_id = uuid.uuid4().hex[:8]
+		file_name = f"{path}_{file_id}.txt"
+		file_path = os.path.join(output_dir, file_name)
+
+		# Salva il contenuto come file di testo
+		with open(file_path, 'w', encoding='utf-8') as f:
+			f.write(f"URL: {current_url}\n\n{page_content}")
+
+		# Crea un documento LangChain
+		doc = Document(
+			page_content=page_content,
+			metadata={
+				"source": file_path,
+				"url": current_url,
+				"title": title,
+				"crawl_depth": current_depth,
+				"domain": base_domain,
+				"filename": file_name,
+				"type": "web_page"
+			}
+		)
+
+		crawl_state['documents'].append((doc, file_path))
+		crawl_state['processed_pages'] += 1
+
+		logger.info(f"Pagina salvata: {file_name} ({os.path.getsize(file_path)} bytes)")
+
+		# Invece di salvare direttamente, raccogli i dati
+		if crawl_state['project']:
+			extracted_info = page_data['extracted_info']
+			crawl_state['collected_data'].append({
+				'project': crawl_state['project'],
+				'url': current_url,
+				'title': title,
+				'description': page_data['meta_description'],
+				'content': page_content,
+				'extracted_info': json.dumps(extracted_info) if extracted_info else None,
+				'file_path': file_path,
+				'crawl_depth': current_depth,
+				'is_indexed': False,
+				'etag': page_data['etag'],
+				'last_modified': page_data['last_modified'],
+				'content_hash': content_hash,
+				'metadata': {
+					'domain': base_domain,
+					'path': parsed_suburl.path,
+					'size': len(page_content),
+					# Link seguiti dalla pagina, riusati se al prossimo crawling risulta invariata (304)
+					'links': links[:CRAWL_STORED_LINKS_LIMIT]
+				}
+			})
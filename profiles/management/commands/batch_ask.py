@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+import json
+import logging
+import sys
+from profiles.models import Project
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+	help = 'Risponde a un elenco di domande su un progetto in batch, scrivendo i risultati in formato JSONL'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'project_id',
+			type=int,
+			help='ID del progetto su cui eseguire le domande',
+		)
+		parser.add_argument(
+			'input',
+			help='File delle domande: testo (una domanda per riga) o JSONL con il campo "question"; "-" per stdin',
+		)
+		parser.add_argument(
+			'--output',
+			default='-',
+			help='File JSONL di destinazione (default: stdout)',
+		)
+		parser.add_argument(
+			'--concurrency',
+			type=int,
+			default=None,
+			help='Numero massimo di generazioni in parallelo (default: RAG_BATCH_MAX_CONCURRENCY)',
+		)
+
+	def handle(self, *args, **options):
+		# Importazione ritardata per evitare cicli di importazione
+		from dashboard.rag_batch import answer_questions_batch, iter_batch_results_jsonl
+
+		try:
+			project = Project.objects.get(id=options['project_id'])
+		except Project.DoesNotExist:
+			raise CommandError(f"Progetto {options['project_id']} non trovato")
+
+		questions = self.read_questions(options['input'])
+		if not questions:
+			raise CommandError('Nessuna domanda trovata nel file di input')
+
+		output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+		answered = errors = 0
+		try:
+			results = answer_questions_batch(project, questions, max_concurrency=options['concurrency'])
+			for line in iter_batch_results_jsonl(results):
+				# Ogni risultato viene scritto appena pronto
+				output.write(line)
+				output.flush()
+				answered += 1
+				if json.loads(line)['error']:
+					errors += 1
+		except Exception as e:
+			logger.error(f"❌ Errore durante l'esecuzione del batch: {e}")
+			raise CommandError(e)
+		finally:
+			if output is not sys.stdout:
+				output.close()
+
+		self.stderr.write(self.style.SUCCESS(
+			f'✅ Batch completato: {answered} risposte ({errors} errori) per il progetto {project.id}'
+		))
+
+	def read_questions(self, path):
+		"""Legge le domande da un file di testo o JSONL (una per riga)"""
+		stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+		questions = []
+		try:
+			for line in stream:
+				line = line.strip()
+				if not line:
+					continue
+				if line.startswith('{'):
+					try:
+						line = json.loads(line).get('question', '')
+					except json.JSONDecodeError:
+						pass
+				if line:
+					questions.append(line)
+		finally:
+			if stream is not sys.stdin:
+				stream.close()
+		return questions
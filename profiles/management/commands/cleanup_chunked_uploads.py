@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+import logging
+from dashboard.chunked_upload import cleanup_expired_upload_sessions, CHUNKED_UPLOAD_TTL_HOURS
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+	help = 'Elimina le sessioni di caricamento a blocchi incomplete e inattive (da eseguire periodicamente, es. cron)'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--ttl-hours',
+			type=float,
+			default=CHUNKED_UPLOAD_TTL_HOURS,
+			help='Ore di inattività dopo le quali una sessione viene eliminata',
+		)
+		parser.add_argument(
+			'--dry-run',
+			action='store_true',
+			help='Mostra quante sessioni verrebbero eliminate senza eliminarle',
+		)
+
+	def handle(self, *args, **options):
+		try:
+			stats = cleanup_expired_upload_sessions(ttl_hours=options['ttl_hours'], dry_run=options['dry_run'])
+			self.stdout.write(self.style.SUCCESS(
+				f"Pulizia dei caricamenti a blocchi{' (simulazione)' if options['dry_run'] else ''}:\n"
+				f"- {stats['checked']} sessioni verificate\n"
+				f"- {stats['removed']} sessioni scadute eliminate\n"
+				f"- {stats['freed_bytes'] / (1024 * 1024):.2f} MB liberati"
+			))
+		except Exception as e:
+			logger.error(f"Errore nella pulizia dei caricamenti a blocchi: {e}")
+			raise CommandError(f"Si è verificato un errore: {e}")
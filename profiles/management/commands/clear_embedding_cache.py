@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand, CommandError
 import logging
-from dashboard.rag_document_utils import clear_embedding_cache
+from dashboard.rag_document_utils import clear_embedding_cache, clear_parsed_text_cache
 from profiles.models import GlobalEmbeddingCache, EmbeddingCacheStats
 
 # Get logger
@@ -21,6 +21,11 @@ class Command(BaseCommand):
 			action='store_true',
 			help='Mostra statistiche sulla cache prima della cancellazione',
 		)
+		parser.add_argument(
+			'--parsed-text',
+			action='store_true',
+			help='Cancella anche la cache del testo estratto dai documenti',
+		)
 
 	def handle(self, *args, **options):
 		try:
@@ -47,6 +52,12 @@ class Command(BaseCommand):
 				f'- {db_count} record DB eliminati'
 			))
 
+			if options['parsed_text']:
+				parsed_count = clear_parsed_text_cache()
+				self.stdout.write(self.style.SUCCESS(
+					f'Cache del testo estratto cancellata: {parsed_count} file eliminati'
+				))
+
 		except Exception as e:
 			logger.error(f"Errore durante la cancellazione della cache degli embedding: {e}")
 			raise CommandError(f"Si è verificato un errore: {e}")
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+import logging
+from dashboard.rag_blob_store import adopt_project_files, collect_unreferenced_blobs
+from profiles.models import Project
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+	help = "Gestisce l'archivio dei file per contenuto: migrazione dei file esistenti e garbage collection dei blob"
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--adopt',
+			action='store_true',
+			help="Collega all'archivio i file di progetto esistenti, unificando i contenuti duplicati",
+		)
+		parser.add_argument(
+			'--gc',
+			action='store_true',
+			help='Elimina i blob non più collegati ad alcun file di progetto',
+		)
+		parser.add_argument(
+			'--project',
+			type=int,
+			help='Limita la migrazione a un singolo progetto (ID)',
+		)
+		parser.add_argument(
+			'--dry-run',
+			action='store_true',
+			help='Mostra cosa verrebbe fatto senza modificare i file',
+		)
+
+	def handle(self, *args, **options):
+		if not options['adopt'] and not options['gc']:
+			raise CommandError("Specificare almeno un'operazione: --adopt e/o --gc")
+
+		try:
+			if options['adopt']:
+				project = None
+				if options['project']:
+					try:
+						project = Project.objects.get(id=options['project'])
+					except Project.DoesNotExist:
+						raise CommandError(f"Progetto {options['project']} non trovato")
+
+				stats = adopt_project_files(project=project, dry_run=options['dry_run'])
+				self.stdout.write(self.style.SUCCESS(
+					f"Migrazione nell'archivio{' (simulazione)' if options['dry_run'] else ''}:\n"
+					f"- {stats['checked']} file verificati\n"
+					f"- {stats['linked']} file collegati\n"
+					f"- {stats['deduplicated']} copie duplicate unificate\n"
+					f"- {stats['saved_bytes'] / (1024 * 1024):.2f} MB recuperati"
+				))
+
+			if options['gc']:
+				stats = collect_unreferenced_blobs(dry_run=options['dry_run'])
+				self.stdout.write(self.style.SUCCESS(
+					f"Garbage collection dei blob{' (simulazione)' if options['dry_run'] else ''}:\n"
+					f"- {stats['checked']} blob verificati\n"
+					f"- {stats['removed']} blob eliminati\n"
+					f"- {stats['freed_bytes'] / (1024 * 1024):.2f} MB liberati"
+				))
+
+		except CommandError:
+			raise
+		except Exception as e:
+			logger.error(f"Errore nella gestione dell'archivio dei blob: {e}")
+			raise CommandError(f"Si è verificato un errore: {e}")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+import logging
+from dashboard.rag_project_watcher import watch_project_directories, WATCH_DEBOUNCE_SECONDS
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+	help = 'Monitora le directory dei progetti e aggiorna i documenti registrati in modo incrementale (richiede watchdog)'
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--debounce',
+			type=float,
+			default=WATCH_DEBOUNCE_SECONDS,
+			help='Secondi di attesa dopo l\'ultimo evento di un progetto prima della scansione',
+		)
+
+	def handle(self, *args, **options):
+		try:
+			self.stdout.write(self.style.SUCCESS('Monitoraggio delle directory dei progetti avviato (Ctrl+C per terminare)'))
+			watch_project_directories(debounce_seconds=options['debounce'])
+		except ImportError:
+			raise CommandError("Il monitoraggio richiede il pacchetto opzionale 'watchdog' (pip install watchdog)")
+		except Exception as e:
+			logger.error(f"Errore nel monitoraggio delle directory dei progetti: {e}")
+			raise CommandError(f"Si è verificato un errore: {e}")
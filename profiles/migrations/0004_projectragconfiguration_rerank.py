@@ -0,0 +1,22 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0003_projecturl_is_included_in_rag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectragconfiguration',
+            name='rerank_model',
+            field=models.CharField(blank=True, choices=[('lexical', 'Lessicale (BM25)'), ('cross-encoder/ms-marco-MiniLM-L-6-v2', 'Cross-encoder MiniLM (CPU)')], help_text='Modello usato per riordinare i frammenti recuperati (vuoto = nessun riordinamento)', max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectragconfiguration',
+            name='rerank_top_n',
+            field=models.IntegerField(blank=True, help_text='Numero di frammenti migliori passati al modello dopo il riordinamento', null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0004_projectragconfiguration_rerank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectconversation',
+            name='context_summary',
+            field=models.TextField(blank=True, help_text='Riassunto della conversazione usato per riscrivere le domande successive', null=True),
+        ),
+    ]
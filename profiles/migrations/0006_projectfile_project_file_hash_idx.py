@@ -0,0 +1,16 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0005_projectconversation_context_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectfile',
+            index=models.Index(fields=['project', 'file_hash'], name='profiles_pr_project_226100_idx'),
+        ),
+    ]
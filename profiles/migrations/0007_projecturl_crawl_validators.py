@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0006_projectfile_project_file_hash_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projecturl',
+            name='etag',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projecturl',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='projecturl',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='projecturl',
+            name='last_crawled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -7,7 +7,7 @@ from cryptography.fernet import Fernet
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
@@ -106,6 +106,10 @@ class ProjectFile(models.Model):
 
     class Meta:
         unique_together = ('project', 'file_path')
+        indexes = [
+            # Ricerca dei caricamenti duplicati per contenuto all'interno di un progetto
+            models.Index(fields=['project', 'file_hash']),
+        ]
 
     def __str__(self):
         return f"{self.project.name} - {self.filename}"
@@ -148,6 +152,9 @@ class ProjectConversation(models.Model):
     question = models.TextField()
     answer = models.TextField()
     processing_time = models.FloatField(null=True, blank=True)  # Tempo di elaborazione in secondi
+    # Riassunto compresso della conversazione fino a questo scambio (incluso)
+    context_summary = models.TextField(blank=True, null=True,
+                                       help_text="Riassunto della conversazione usato per riscrivere le domande successive")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -173,6 +180,11 @@ class ProjectURL(models.Model):
     is_indexed = models.BooleanField(default=False)
     is_included_in_rag = models.BooleanField(default=True)
     last_indexed_at = models.DateTimeField(blank=True, null=True)
+    # Validatori HTTP e hash del contenuto normalizzato, usati per le richieste condizionali nei nuovi crawling
+    etag = models.TextField(blank=True, null=True)  # Gli ETag non hanno una lunghezza massima
+    last_modified = models.CharField(max_length=64, blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, null=True)  # SHA-256 hash
+    last_crawled_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     metadata = models.JSONField(default=dict, blank=True, null=True)
@@ -620,6 +632,10 @@ class LLMUsageLog(models.Model):
         return f"Utilizzo LLM: {self.provider.name} - {self.engine.name} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
 
+# Frammenti mantenuti dopo il riordinamento quando il progetto non lo personalizza
+DEFAULT_RERANK_TOP_N = 6
+
+
 class ProjectRAGConfiguration(models.Model):
     """
     Memorizza le configurazioni RAG specifiche per un progetto.
@@ -649,6 +665,20 @@ class ProjectRAGConfiguration(models.Model):
     equal_notes_weight = models.BooleanField(null=True, blank=True)
     strict_context = models.BooleanField(null=True, blank=True)
 
+    # Riordinamento (rerank) dei frammenti recuperati prima della generazione
+    rerank_model = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        choices=[
+            ('lexical', 'Lessicale (BM25)'),
+            ('cross-encoder/ms-marco-MiniLM-L-6-v2', 'Cross-encoder MiniLM (CPU)'),
+        ],
+        help_text=_("Modello usato per riordinare i frammenti recuperati (vuoto = nessun riordinamento)")
+    )
+    rerank_top_n = models.IntegerField(null=True, blank=True, help_text=_(
+        "Numero di frammenti migliori passati al modello dopo il riordinamento"))
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -736,6 +766,15 @@ class ProjectRAGConfiguration(models.Model):
         elif self.rag_preset:
             return self.rag_preset.strict_context
         return False
+
+    def get_rerank_model(self):
+        # Il riordinamento non fa parte dei preset: è disattivato se non configurato
+        return self.rerank_model or None
+
+    def get_rerank_top_n(self):
+        if self.rerank_top_n is not None:
+            return self.rerank_top_n
+        return DEFAULT_RERANK_TOP_N
 # ==============================================================================
 # MODELLI PER LA CACHE DEGLI EMBEDDING
 # ==============================================================================
@@ -898,6 +937,10 @@ class UserSubscription(models.Model):
         """Verifica se l'utente ha raggiunto il limite di query RAG mensili"""
         return self.current_month_rag_queries >= self.plan.monthly_rag_queries
 
+    def get_remaining_rag_queries(self):
+        """Restituisce il numero di query RAG mensili ancora incluse nel piano"""
+        return max(self.plan.monthly_rag_queries - self.current_month_rag_queries, 0)
+
     def calculate_extra_storage_cost(self):
         """Calcola il costo per l'archiviazione extra utilizzata"""
         if self.current_storage_used_mb <= self.plan.storage_limit_mb:
@@ -1117,7 +1160,7 @@ def update_index_on_file_change(sender, instance, created, **kwargs):
 
     try:
         # Forza l'aggiornamento dell'indice vettoriale se il file è un PDF o un documento supportato
-        supported_extensions = ['.pdf', '.docx', '.doc', '.txt']
+        supported_extensions = ['.pdf', '.docx', '.doc', '.txt', '.csv', '.xlsx', '.md', '.html']
         if instance.extension.lower() in supported_extensions:
             logger.info(f"🔄 Avvio aggiornamento automatico dell'indice per il file {instance.filename}")
 
@@ -1410,71 +1453,87 @@ def update_storage_usage(sender, instance, created, **kwargs):
 
 
 
-@receiver(post_save, sender=ProjectConversation)
-def log_rag_query(sender, instance, created, **kwargs):
+def record_rag_query_usage(project, question, answer, processing_time=None):
     """
-    Registra una query RAG e aggiorna l'utilizzo dell'utente.
+    Registra una query RAG nel log di fatturazione e aggiorna l'utilizzo dell'utente.
+
+    Usata dal signal sulle conversazioni e dai percorsi che rispondono senza creare
+    una ProjectConversation (batch di domande, ricerca federata).
+
+    Args:
+        project: Progetto su cui è stata eseguita la query
+        question: Testo della domanda
+        answer: Testo della risposta generata
+        processing_time: Tempo di elaborazione in secondi (opzionale)
     """
-    if created:
-        try:
-            subscription = UserSubscription.objects.get(user=instance.project.user)
+    try:
+        subscription = UserSubscription.objects.get(user=project.user)
+
+        # Determina la complessità della query in base alla lunghezza della domanda
+        # e al tempo di elaborazione
+        query_complexity = 'simple'
+        if processing_time and processing_time > 5:
+            query_complexity = 'complex'
+        elif processing_time and processing_time > 2:
+            query_complexity = 'medium'
+
+        # Ottieni l'engine utilizzato
+        llm_engine = None
+        # Verifico se un progetto abbia associato un LLM (sia configurazione che engine)
+        if hasattr(project, 'llm_config') and project.llm_config.engine:
+            llm_engine = project.llm_config.engine
+
+        # Stime approssimative delle risorse utilizzate
+        # In un caso reale, questi dati dovrebbero essere forniti dai componenti RAG
+        estimated_docs = 5
+        context_tokens = 1000
+        embedding_tokens = 500
+        input_tokens = 1500
+        output_tokens = (answer or '').split().__len__()
+
+        # Crea il log della query
+        query_log = RAGQueryLog.objects.create(
+            user=project.user,
+            project=project,
+            query_text=question,
+            query_complexity=query_complexity,
+            documents_searched=estimated_docs,
+            total_context_size_tokens=context_tokens,
+            embedding_tokens_used=embedding_tokens,
+            llm_input_tokens=input_tokens,
+            llm_output_tokens=output_tokens,
+            processing_time_seconds=processing_time or 0,
+            search_time_seconds=(processing_time or 0) * 0.3,  # Stima
+            llm_time_seconds=(processing_time or 0) * 0.7,  # Stima
+            llm_engine=llm_engine
+        )
 
-            # Determina la complessità della query in base alla lunghezza della domanda
-            # e al tempo di elaborazione
-            query_complexity = 'simple'
-            if instance.processing_time and instance.processing_time > 5:
-                query_complexity = 'complex'
-            elif instance.processing_time and instance.processing_time > 2:
-                query_complexity = 'medium'
-
-            # Ottieni l'engine utilizzato
-            llm_engine = None
-            # Verifico se un progetto abbia associato un LLM (sia configurazione che engine)
-            if hasattr(instance.project, 'llm_config') and instance.project.llm_config.engine:
-                llm_engine = instance.project.llm_config.engine
-
-            # Stime approssimative delle risorse utilizzate
-            # In un caso reale, questi dati dovrebbero essere forniti dai componenti RAG
-            estimated_docs = 5
-            context_tokens = 1000
-            embedding_tokens = 500
-            input_tokens = 1500
-            output_tokens = instance.answer.split().__len__()
-
-            # Crea il log della query
-            query_log = RAGQueryLog.objects.create(
-                user=instance.project.user,
-                project=instance.project,
-                query_text=instance.question,
-                query_complexity=query_complexity,
-                documents_searched=estimated_docs,
-                total_context_size_tokens=context_tokens,
-                embedding_tokens_used=embedding_tokens,
-                llm_input_tokens=input_tokens,
-                llm_output_tokens=output_tokens,
-                processing_time_seconds=instance.processing_time or 0,
-                search_time_seconds=(instance.processing_time or 0) * 0.3,  # Stima
-                llm_time_seconds=(instance.processing_time or 0) * 0.7,  # Stima
-                llm_engine=llm_engine
-            )
+        # Aggiorna il conteggio delle query per l'utente
+        subscription.current_month_rag_queries += 1
+        subscription.save(update_fields=['current_month_rag_queries', 'updated_at'])
 
-            # Aggiorna il conteggio delle query per l'utente
-            subscription.current_month_rag_queries += 1
-            subscription.save(update_fields=['current_month_rag_queries', 'updated_at'])
+        # Calcola costi extra se il limite è stato superato
+        if subscription.is_rag_query_limit_reached():
+            extra_cost = subscription.calculate_extra_query_cost()
+            if extra_cost > 0:
+                subscription.extra_queries_charges += extra_cost
+                subscription.save(update_fields=['extra_queries_charges'])
 
-            # Calcola costi extra se il limite è stato superato
-            if subscription.is_rag_query_limit_reached():
-                extra_cost = subscription.calculate_extra_query_cost()
-                if extra_cost > 0:
-                    subscription.extra_queries_charges += extra_cost
-                    subscription.save(update_fields=['extra_queries_charges'])
+                # Aggiorna l'importo fatturato nel log
+                query_log.billed_amount = extra_cost
+                query_log.save(update_fields=['billed_amount'])
 
-                    # Aggiorna l'importo fatturato nel log
-                    query_log.billed_amount = extra_cost
-                    query_log.save(update_fields=['billed_amount'])
+    except UserSubscription.DoesNotExist:
+        pass
 
-        except UserSubscription.DoesNotExist:
-            pass
+
+@receiver(post_save, sender=ProjectConversation)
+def log_rag_query(sender, instance, created, **kwargs):
+    """
+    Registra una query RAG e aggiorna l'utilizzo dell'utente.
+    """
+    if created:
+        record_rag_query_usage(instance.project, instance.question, instance.answer, instance.processing_time)
 
 
 
@@ -1540,6 +1599,9 @@ def update_rag_index_on_url_change(sender, instance, created, **kwargs):
                 is_indexed=True,
                 last_indexed_at=timezone.now()
             )
+            # update() non emette segnali: invalida esplicitamente lo snapshot dei contenuti
+            from dashboard.rag_document_utils import invalidate_project_content_snapshot
+            invalidate_project_content_snapshot(instance.project_id)
             logger.info(f"✅ URL {instance.url} indicizzata con successo")
 
         except Exception as e:
@@ -1547,4 +1609,36 @@ def update_rag_index_on_url_change(sender, instance, created, **kwargs):
 
     # Se sono stati modificati altri campi che non richiedono reindicizzazione
     else:
-        logger.debug(f"ℹ️ Modifica URL {instance.url} non richiede reindicizzazione")
\ No newline at end of file
+        logger.debug(f"ℹ️ Modifica URL {instance.url} non richiede reindicizzazione")
+
+
+
+# ===== Invalidazione dello snapshot dei contenuti di progetto =====
+@receiver(post_save, sender=ProjectFile)
+@receiver(post_delete, sender=ProjectFile)
+@receiver(post_save, sender=ProjectNote)
+@receiver(post_delete, sender=ProjectNote)
+@receiver(post_save, sender=ProjectURL)
+@receiver(post_delete, sender=ProjectURL)
+def invalidate_snapshot_on_content_change(sender, instance, **kwargs):
+    """
+    Invalida lo snapshot aggregato dei contenuti del progetto (conteggi di file,
+    note e URL usati dal percorso di richiesta RAG) e la catena RAG compilata
+    in cache quando un contenuto viene creato, modificato o eliminato.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_document_utils import invalidate_project_content_snapshot
+    from dashboard.rag_utils import invalidate_project_rag_chain
+    invalidate_project_content_snapshot(instance.project_id)
+    invalidate_project_rag_chain(instance.project_id)
+
+
+# ===== Rilascio dei blob condivisi =====
+@receiver(post_delete, sender=ProjectFile)
+def release_file_blob_on_delete(sender, instance, **kwargs):
+    """
+    Elimina il blob del contenuto del file se nessun altro file di progetto vi è ancora collegato.
+    """
+    # Importazione ritardata per evitare cicli di importazione
+    from dashboard.rag_blob_store import release_blob
+    release_blob(instance.file_hash)
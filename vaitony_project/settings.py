@@ -396,6 +396,105 @@ DEFAULT_PRIORITIZE_FILENAMES = True
 DEFAULT_EQUAL_NOTES_WEIGHT = True
 DEFAULT_STRICT_CONTEXT = False
 
+# Durata (secondi) della cache dello snapshot dei contenuti di progetto (invalidata a ogni modifica)
+PROJECT_SNAPSHOT_CACHE_TIMEOUT = 300
+
+# Cache (per processo) delle catene RAG compilate: numero massimo di progetti e durata in secondi
+RAG_CHAIN_CACHE_SIZE = 32
+RAG_CHAIN_CACHE_TTL = 3600
+
+# Budget di token per il contesto RAG (derivato dalla finestra del motore, entro questi limiti)
+RAG_MAX_CONTEXT_TOKENS = 6000
+RAG_MIN_CONTEXT_TOKENS = 1000
+RAG_CONTEXT_RESERVED_TOKENS = 512  # Riserva per la domanda e margini di sicurezza
+
+# Classificatore del query planner: 'keyword' (matcher precompilati) o 'embedding' (prototipi, usa l'API embedding)
+RAG_QUERY_CLASSIFIER = 'keyword'
+RAG_QUERY_CLASSIFIER_THRESHOLD = 0.8
+
+# Riassunti precalcolati delle fonti (percorso map-reduce per le domande generiche)
+RAG_PRECOMPUTE_SUMMARIES = True
+RAG_SUMMARY_SOURCE_MAX_TOKENS = 6000
+RAG_SUMMARY_MAX_WORKERS = 4
+
+# Risposte in batch (recupero condiviso e generazione parallela)
+RAG_BATCH_MAX_CONCURRENCY = 4
+RAG_BATCH_MAX_QUESTIONS = 500
+
+# Ricerca federata su tutti i progetti dell'utente
+RAG_FEDERATED_MAX_WORKERS = 4
+RAG_FEDERATED_PER_PROJECT_K = 8
+RAG_FEDERATED_TOP_K = 20
+
+# Cronologia compressa della conversazione per le domande di follow-up
+RAG_CONVERSATION_SUMMARY_MAX_TOKENS = 300
+RAG_CONVERSATION_MAX_IDLE_SECONDS = 3600
+
+# Estrazione dei PDF pagina per pagina (parallela per i documenti grandi)
+RAG_PDF_PARALLEL_MIN_PAGES = 40
+RAG_PDF_PAGES_PER_WORKER = 20
+RAG_PDF_MAX_WORKERS = 4
+
+# OCR locale (tesseract) prima della Vision API
+RAG_OCR_LANG = 'ita+eng'
+RAG_OCR_DPI = 200
+RAG_OCR_MAX_WORKERS = 4
+RAG_OCR_MIN_CONFIDENCE = 60
+RAG_OCR_MIN_TEXT_CHARS = 30
+RAG_OCR_MAX_VISION_PAGES = 10
+
+# Vision API: ridimensionamento, cache per contenuto e concorrenza
+RAG_VISION_MAX_LONG_SIDE = 2048
+RAG_VISION_MAX_SHORT_SIDE = 768
+RAG_VISION_MAX_CONCURRENCY = 4
+
+# Righe per gruppo nei loader tabellari (CSV/XLSX); l'intestazione viene ripetuta in ogni chunk
+RAG_TABLE_ROWS_PER_GROUP = 50
+
+# Archivio dei file per contenuto (MEDIA_ROOT/blobs): i file identici tra progetti sono hardlink dello stesso blob
+RAG_BLOB_STORE_ENABLED = True
+
+# Scansione delle directory dei progetti: thread per gli hash e attesa del watcher (manage.py watch_project_files)
+RAG_SCAN_HASH_WORKERS = 4
+RAG_WATCH_DEBOUNCE_SECONDS = 2.0
+
+# Anteprime delle pagine (WebP, in cache per hash del file con limite LRU)
+RAG_PREVIEW_PAGES_AT_UPLOAD = 3
+RAG_PREVIEW_MAX_WORKERS = 2
+RAG_PREVIEW_CACHE_MAX_MB = 500
+
+# Invio dei file di progetto: None (streaming da Django), 'x-accel-redirect' (nginx) o 'x-sendfile' (Apache)
+# Con nginx, RAG_FILE_SERVE_ACCEL_PREFIX deve essere una location `internal` con alias su MEDIA_ROOT
+RAG_FILE_SERVE_OFFLOAD = None
+RAG_FILE_SERVE_ACCEL_PREFIX = '/protected-media/'
+
+# Caricamento a blocchi (riprendibile); le sessioni inattive vengono eliminate da manage.py cleanup_chunked_uploads
+RAG_CHUNKED_UPLOAD_PART_SIZE = 8 * 1024 * 1024
+RAG_CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+RAG_CHUNKED_UPLOAD_TTL_HOURS = 24
+
+# Caricamento in blocco di cartelle e archivi ZIP: limiti per singolo lotto
+RAG_BULK_MAX_FILES = 5000
+RAG_BULK_MAX_TOTAL_SIZE = 2 * 1024 * 1024 * 1024
+
+# Crawling dei siti web: pagine del browser in parallelo, limite per host e intervallo minimo (s) tra richieste allo stesso host
+RAG_CRAWL_CONCURRENCY = 4
+RAG_CRAWL_PER_HOST_CONCURRENCY = 4
+RAG_CRAWL_REQUEST_DELAY = 0.0
+
+# Crawling: download via HTTP e rendering con il browser solo per le pagine generate via JavaScript
+RAG_CRAWL_HTTP_FIRST = True
+
+# Dimensione massima (MB) della cache del testo estratto dai documenti
+RAG_PARSED_TEXT_CACHE_MAX_MB = 2048
+
+# Secondi prima di ritentare il riassunto di una fonte la cui generazione è fallita
+RAG_SUMMARY_RETRY_SECONDS = 24 * 3600
+
+# Query RAG extra (oltre quelle incluse nel piano) consentite alle API massive ogni mese;
+# None = nessun tetto, le query extra sono fatturate al prezzo del piano
+RAG_EXTRA_QUERIES_HARD_CAP = None
+
 # Prompt predefinito di base
 DEFAULT_RAG_PROMPT = """
 Sei un assistente esperto che analizza documenti e note, fornendo risposte dettagliate e complete.